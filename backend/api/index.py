@@ -1,26 +1,106 @@
 """Main FastAPI application"""
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+from typing import Optional
+import hmac
+import importlib
 import sys
 import os
+import threading
 
 # Add parent directory to path to import routes
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from routes import auth, books, diary, ratings, users
+from utils.metrics import CONTENT_TYPE, METRICS_TOKEN, MetricsMiddleware, render_metrics
+from utils.profiling import PROFILING_ENABLED, ProfilingMiddleware
 
 # Check if we're running locally (for local dev, we need /api prefix)
 # In Vercel, the /api prefix is handled by routing, so we don't add it here
 IS_LOCAL = os.getenv("VERCEL") is None
 API_PREFIX = "/api" if IS_LOCAL else ""
 
+# Import each router (and the models, drivers and libraries behind it) on the
+# first request under its prefix. Worth it on serverless cold starts; a
+# long-running server loads everything up front.
+LAZY_ROUTERS = os.getenv("LAZY_ROUTERS", "0" if IS_LOCAL else "1") == "1"
+
+# First path segment -> module defining the router for it
+ROUTERS = {
+    "auth": "routes.auth",
+    "books": "routes.books",
+    "diary": "routes.diary",
+    "ratings": "routes.ratings",
+    "users": "routes.users",
+    "sync": "routes.sync",
+    "batch": "routes.batch",
+    "feed": "routes.feed",
+    "events": "routes.events",
+    "jobs": "routes.jobs",
+    "profiles": "routes.profiles",
+}
+# Paths that describe the whole API and so need every router
+SCHEMA_PATHS = {"/docs", "/redoc", "/openapi.json"}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run background job workers for the life of a long-running server"""
+    from utils.jobs import start_workers, stop_workers
+
+    start_workers()
+    yield
+    stop_workers()
+
+
 app = FastAPI(
     title="BlueberryBooks API",
     description="API for BlueberryBooks - A book diary application",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
+_loaded = set()
+_load_lock = threading.Lock()
+
+
+def load_router(name: str):
+    """Import a router and include it with optional /api prefix for local development"""
+    if name in _loaded:
+        return
+    with _load_lock:
+        if name not in _loaded:
+            module = importlib.import_module(ROUTERS[name])
+            app.include_router(module.router, prefix=API_PREFIX)
+            _loaded.add(name)
+            # Regenerate the schema with the new routes when next asked
+            app.openapi_schema = None
+
+
+def load_all_routers():
+    for name in ROUTERS:
+        load_router(name)
+
+
+class LazyRouterMiddleware:
+    """Loads the router a request needs before routing it"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket") and len(_loaded) < len(ROUTERS):
+            path = scope["path"]
+            if path in SCHEMA_PATHS:
+                load_all_routers()
+            elif path.startswith(API_PREFIX + "/"):
+                name = path[len(API_PREFIX) + 1:].split("/", 1)[0]
+                if name in ROUTERS:
+                    load_router(name)
+        await self.app(scope, receive, send)
+
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -30,12 +110,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Include routers with optional /api prefix for local development
-app.include_router(auth.router, prefix=API_PREFIX)
-app.include_router(books.router, prefix=API_PREFIX)
-app.include_router(diary.router, prefix=API_PREFIX)
-app.include_router(ratings.router, prefix=API_PREFIX)
-app.include_router(users.router, prefix=API_PREFIX)
+if LAZY_ROUTERS:
+    app.add_middleware(LazyRouterMiddleware)
+else:
+    load_all_routers()
+
+# Not installed at all unless PROFILE_SECRET is set
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+# Outermost, so a request's time includes loading its router
+app.add_middleware(MetricsMiddleware)
 
 
 @app.get("/")
@@ -49,3 +134,10 @@ async def health_check():
     """Health check endpoint"""
     return JSONResponse({"status": "healthy"})
 
+
+@app.get("/metrics")
+def metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus metrics for this worker process"""
+    if METRICS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
@@ -1,8 +1,17 @@
-"""Database connection and session management"""
+"""Database connection and session management
+
+The engine (and with it the database driver) is created on first use, not
+at import, so loading the app stays cheap on a cold start. ``engine`` is
+still importable from here and is created by that import.
+"""
+from contextvars import ContextVar
+from typing import Optional
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 import os
+import threading
 
 # Determine which database to use based on environment
 # Production (Vercel): Use DATABASE_URL from environment (PostgreSQL)
@@ -24,22 +33,60 @@ else:
         # Default to SQLite for local development
         DATABASE_URL = "sqlite:///./blueberrybooks.db"
 
-# Create engine
-# For SQLite, we need check_same_thread=False
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-else:
-    engine = create_engine(DATABASE_URL)
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    """The process's engine, created on first use"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                # For SQLite, we need check_same_thread=False
+                if DATABASE_URL.startswith("sqlite"):
+                    _engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+                else:
+                    _engine = create_engine(DATABASE_URL)
+                from utils.metrics import instrument_engine
+                instrument_engine(_engine)
+    return _engine
+
+
+def __getattr__(name: str):
+    # Keeps "from models.database import engine" working
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class _LazySessionMaker(sessionmaker):
+    """Session factory that binds to the engine when the first session is made"""
+
+    def __call__(self, **local_kw) -> Session:
+        if self.kw.get("bind") is None:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
+
 
 # Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = _LazySessionMaker(autocommit=False, autoflush=False)
 
 # Base class for models
 Base = declarative_base()
 
+# Set while a batch request runs so its sub-requests share one session
+shared_session: ContextVar[Optional[Session]] = ContextVar("shared_session", default=None)
+
 
 def get_db():
     """Dependency for getting database session"""
+    shared = shared_session.get()
+    if shared is not None:
+        # Owned and closed by the batch request
+        yield shared
+        return
+
     db = SessionLocal()
     try:
         yield db
@@ -0,0 +1,124 @@
+"""Migration script for account deletion: users.deleted_at and ON DELETE CASCADE foreign keys"""
+import os
+from pathlib import Path
+from sqlalchemy import text
+
+# Try to load dotenv, but don't fail if it's not available
+try:
+    from dotenv import load_dotenv
+    HAS_DOTENV = True
+except ImportError:
+    HAS_DOTENV = False
+    print("WARNING: python-dotenv not installed. Using system environment variables only.")
+
+# Load environment variables
+env_loaded = False
+if HAS_DOTENV:
+    possible_paths = [
+        Path(__file__).parent.parent / ".env.local",
+        Path(__file__).parent.parent.parent / ".env.local",
+        Path(__file__).parent.parent / ".env",
+    ]
+
+    for env_path in possible_paths:
+        if env_path.exists():
+            load_dotenv(env_path)
+            print(f"Loaded environment variables from {env_path}")
+            env_loaded = True
+            break
+
+if not env_loaded and HAS_DOTENV:
+    print("WARNING: No .env.local or .env file found. Using system environment variables.")
+elif not HAS_DOTENV:
+    print("Using system environment variables (python-dotenv not available)")
+
+from .database import engine
+
+# (table, column, referenced table) for every foreign key that should cascade
+CASCADE_FOREIGN_KEYS = [
+    ("diary_entries", "user_id", "users"),
+    ("ratings", "user_id", "users"),
+    ("read_books", "user_id", "users"),
+    ("follows", "follower_id", "users"),
+    ("follows", "followed_id", "users"),
+    ("change_log", "user_id", "users"),
+    ("activities", "user_id", "users"),
+    ("timeline_entries", "owner_id", "users"),
+    ("timeline_entries", "activity_id", "activities"),
+]
+
+
+def _add_deleted_at(conn, is_sqlite: bool):
+    if is_sqlite:
+        result = conn.execute(text("PRAGMA table_info(users)"))
+        exists = 'deleted_at' in [row[1] for row in result]
+    else:
+        result = conn.execute(text("""
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_name='users' AND column_name='deleted_at'
+        """))
+        exists = result.fetchone() is not None
+
+    if not exists:
+        print("Adding deleted_at column to users table...")
+        column_type = "DATETIME" if is_sqlite else "TIMESTAMP WITH TIME ZONE"
+        conn.execute(text(f"ALTER TABLE users ADD COLUMN deleted_at {column_type}"))
+        print("SUCCESS: Added deleted_at column to users table")
+    else:
+        print("SUCCESS: deleted_at column already exists")
+
+
+def _cascade_foreign_keys(conn):
+    for table, column, referenced in CASCADE_FOREIGN_KEYS:
+        if conn.execute(text("SELECT to_regclass(:table)"), {"table": table}).scalar() is None:
+            print(f"Skipping {table}: table does not exist yet (init_db creates it with cascades)")
+            continue
+        constraint = conn.execute(text("""
+            SELECT con.conname, con.confdeltype
+            FROM pg_constraint con
+            JOIN pg_attribute att ON att.attrelid = con.conrelid AND att.attnum = con.conkey[1]
+            WHERE con.contype = 'f' AND con.conrelid = CAST(:table AS regclass) AND att.attname = :column
+        """), {"table": table, "column": column}).first()
+        if constraint is not None and constraint[1] == "c":
+            print(f"SUCCESS: {table}.{column} already cascades")
+            continue
+
+        name = constraint[0] if constraint is not None else f"{table}_{column}_fkey"
+        if constraint is not None:
+            conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+        conn.execute(text(
+            f'ALTER TABLE {table} ADD CONSTRAINT "{name}" '
+            f'FOREIGN KEY ({column}) REFERENCES {referenced} (id) ON DELETE CASCADE'
+        ))
+        print(f"SUCCESS: {table}.{column} now cascades on delete")
+
+
+def migrate_account_deletion():
+    """Add users.deleted_at and make foreign keys to users cascade"""
+    from .database import DATABASE_URL
+
+    is_sqlite = DATABASE_URL.startswith("sqlite")
+    with engine.begin() as conn:
+        try:
+            _add_deleted_at(conn, is_sqlite)
+            if is_sqlite:
+                # SQLite can't alter constraints and doesn't enforce them by
+                # default; account deletion removes child rows explicitly
+                print("Using SQLite database: foreign keys left as they are")
+                # AUTOINCREMENT can only be set when the table is created
+                print("Note: an existing SQLite users table may reuse the highest deleted id; "
+                      "new databases created by init_db don't")
+            else:
+                _cascade_foreign_keys(conn)
+        except Exception as e:
+            print(f"ERROR: Error migrating account deletion: {e}")
+            raise
+
+
+if __name__ == "__main__":
+    print("Starting account deletion migration...")
+    print("=" * 50)
+    migrate_account_deletion()
+    print("=" * 50)
+    print("Migration complete!")
@@ -0,0 +1,73 @@
+"""Migration script to add the per-user data_version column used for response caching"""
+import os
+from pathlib import Path
+from sqlalchemy import text
+
+# Try to load dotenv, but don't fail if it's not available
+try:
+    from dotenv import load_dotenv
+    HAS_DOTENV = True
+except ImportError:
+    HAS_DOTENV = False
+    print("WARNING: python-dotenv not installed. Using system environment variables only.")
+
+# Load environment variables
+env_loaded = False
+if HAS_DOTENV:
+    possible_paths = [
+        Path(__file__).parent.parent / ".env.local",
+        Path(__file__).parent.parent.parent / ".env.local",
+        Path(__file__).parent.parent / ".env",
+    ]
+
+    for env_path in possible_paths:
+        if env_path.exists():
+            load_dotenv(env_path)
+            print(f"Loaded environment variables from {env_path}")
+            env_loaded = True
+            break
+
+if not env_loaded and HAS_DOTENV:
+    print("WARNING: No .env.local or .env file found. Using system environment variables.")
+elif not HAS_DOTENV:
+    print("Using system environment variables (python-dotenv not available)")
+
+from .database import engine
+
+
+def migrate_data_version():
+    """Add data_version column to users"""
+    from .database import DATABASE_URL
+
+    with engine.begin() as conn:
+        if DATABASE_URL.startswith("sqlite"):
+            print("Using SQLite database")
+            result = conn.execute(text("PRAGMA table_info(users)"))
+            exists = 'data_version' in [row[1] for row in result]
+        else:
+            print("Using PostgreSQL database")
+            result = conn.execute(text("""
+                SELECT column_name
+                FROM information_schema.columns
+                WHERE table_name='users' AND column_name='data_version'
+            """))
+            exists = result.fetchone() is not None
+
+        if not exists:
+            print("Adding data_version column to users table...")
+            try:
+                conn.execute(text("ALTER TABLE users ADD COLUMN data_version INTEGER DEFAULT 0 NOT NULL"))
+                print("SUCCESS: Added data_version column to users table")
+            except Exception as e:
+                print(f"ERROR: Error adding data_version column: {e}")
+                raise
+        else:
+            print("SUCCESS: data_version column already exists")
+
+
+if __name__ == "__main__":
+    print("Starting data_version migration...")
+    print("=" * 50)
+    migrate_data_version()
+    print("=" * 50)
+    print("Migration complete!")
@@ -0,0 +1,106 @@
+"""Migration script to add the full-text index over diary entries
+
+SQLite gets an external-content FTS5 table kept in sync by triggers.
+PostgreSQL gets a generated tsvector column with a GIN index. Either way the
+index is maintained by the database on every insert, update and delete.
+"""
+import os
+from pathlib import Path
+from sqlalchemy import text
+
+# Try to load dotenv, but don't fail if it's not available
+try:
+    from dotenv import load_dotenv
+    HAS_DOTENV = True
+except ImportError:
+    HAS_DOTENV = False
+    print("WARNING: python-dotenv not installed. Using system environment variables only.")
+
+# Load environment variables
+env_loaded = False
+if HAS_DOTENV:
+    possible_paths = [
+        Path(__file__).parent.parent / ".env.local",
+        Path(__file__).parent.parent.parent / ".env.local",
+        Path(__file__).parent.parent / ".env",
+    ]
+
+    for env_path in possible_paths:
+        if env_path.exists():
+            load_dotenv(env_path)
+            print(f"Loaded environment variables from {env_path}")
+            env_loaded = True
+            break
+
+if not env_loaded and HAS_DOTENV:
+    print("WARNING: No .env.local or .env file found. Using system environment variables.")
+elif not HAS_DOTENV:
+    print("Using system environment variables (python-dotenv not available)")
+
+from .database import engine
+
+SQLITE_STATEMENTS = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS diary_entries_fts USING fts5(
+        entry_text,
+        content='diary_entries',
+        content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS diary_entries_fts_ai AFTER INSERT ON diary_entries BEGIN
+        INSERT INTO diary_entries_fts(rowid, entry_text) VALUES (new.id, new.entry_text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS diary_entries_fts_ad AFTER DELETE ON diary_entries BEGIN
+        INSERT INTO diary_entries_fts(diary_entries_fts, rowid, entry_text) VALUES ('delete', old.id, old.entry_text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS diary_entries_fts_au AFTER UPDATE OF entry_text ON diary_entries BEGIN
+        INSERT INTO diary_entries_fts(diary_entries_fts, rowid, entry_text) VALUES ('delete', old.id, old.entry_text);
+        INSERT INTO diary_entries_fts(rowid, entry_text) VALUES (new.id, new.entry_text);
+    END
+    """,
+    # Index entries written before the triggers existed
+    "INSERT INTO diary_entries_fts(diary_entries_fts) VALUES ('rebuild')",
+]
+
+POSTGRESQL_STATEMENTS = [
+    """
+    ALTER TABLE diary_entries ADD COLUMN IF NOT EXISTS entry_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', coalesce(entry_text, ''))) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_diary_entries_entry_tsv ON diary_entries USING GIN (entry_tsv)",
+]
+
+
+def migrate_diary_search():
+    """Create the diary full-text index for the configured database"""
+    from .database import DATABASE_URL
+
+    if DATABASE_URL.startswith("sqlite"):
+        print("Using SQLite database")
+        statements = SQLITE_STATEMENTS
+    else:
+        print("Using PostgreSQL database")
+        statements = POSTGRESQL_STATEMENTS
+
+    with engine.begin() as conn:
+        try:
+            for statement in statements:
+                conn.execute(text(statement))
+            print("SUCCESS: Diary full-text index created/verified")
+        except Exception as e:
+            print(f"ERROR: Error creating diary full-text index: {e}")
+            raise
+
+
+if __name__ == "__main__":
+    print("Starting diary search migration...")
+    print("=" * 50)
+    migrate_diary_search()
+    print("=" * 50)
+    print("Migration complete!")
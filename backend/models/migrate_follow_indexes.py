@@ -0,0 +1,60 @@
+"""Migration script to add the follows indexes used by follower list pagination"""
+import os
+from pathlib import Path
+from sqlalchemy import text
+
+# Try to load dotenv, but don't fail if it's not available
+try:
+    from dotenv import load_dotenv
+    HAS_DOTENV = True
+except ImportError:
+    HAS_DOTENV = False
+    print("WARNING: python-dotenv not installed. Using system environment variables only.")
+
+# Load environment variables
+env_loaded = False
+if HAS_DOTENV:
+    possible_paths = [
+        Path(__file__).parent.parent / ".env.local",
+        Path(__file__).parent.parent.parent / ".env.local",
+        Path(__file__).parent.parent / ".env",
+    ]
+
+    for env_path in possible_paths:
+        if env_path.exists():
+            load_dotenv(env_path)
+            print(f"Loaded environment variables from {env_path}")
+            env_loaded = True
+            break
+
+if not env_loaded and HAS_DOTENV:
+    print("WARNING: No .env.local or .env file found. Using system environment variables.")
+elif not HAS_DOTENV:
+    print("Using system environment variables (python-dotenv not available)")
+
+from .database import engine
+
+STATEMENTS = [
+    "CREATE INDEX IF NOT EXISTS ix_follows_followed_created ON follows (followed_id, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_follows_follower_created ON follows (follower_id, created_at, id)",
+]
+
+
+def migrate_follow_indexes():
+    """Create the follows pagination indexes"""
+    with engine.begin() as conn:
+        try:
+            for statement in STATEMENTS:
+                conn.execute(text(statement))
+            print("SUCCESS: Follows indexes created/verified")
+        except Exception as e:
+            print(f"ERROR: Error creating follows indexes: {e}")
+            raise
+
+
+if __name__ == "__main__":
+    print("Starting follows index migration...")
+    print("=" * 50)
+    migrate_follow_indexes()
+    print("=" * 50)
+    print("Migration complete!")
@@ -0,0 +1,104 @@
+"""Migration script to index usernames for substring search
+
+SQLite gets an external-content FTS5 trigram table kept in sync by
+triggers (needs SQLite 3.34+). PostgreSQL gets a pg_trgm GIN index for
+substring matches and a pattern-ops B-tree for short prefix matches.
+"""
+import os
+from pathlib import Path
+from sqlalchemy import text
+
+# Try to load dotenv, but don't fail if it's not available
+try:
+    from dotenv import load_dotenv
+    HAS_DOTENV = True
+except ImportError:
+    HAS_DOTENV = False
+    print("WARNING: python-dotenv not installed. Using system environment variables only.")
+
+# Load environment variables
+env_loaded = False
+if HAS_DOTENV:
+    possible_paths = [
+        Path(__file__).parent.parent / ".env.local",
+        Path(__file__).parent.parent.parent / ".env.local",
+        Path(__file__).parent.parent / ".env",
+    ]
+
+    for env_path in possible_paths:
+        if env_path.exists():
+            load_dotenv(env_path)
+            print(f"Loaded environment variables from {env_path}")
+            env_loaded = True
+            break
+
+if not env_loaded and HAS_DOTENV:
+    print("WARNING: No .env.local or .env file found. Using system environment variables.")
+elif not HAS_DOTENV:
+    print("Using system environment variables (python-dotenv not available)")
+
+from .database import engine
+
+SQLITE_STATEMENTS = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+        username,
+        content='users',
+        content_rowid='id',
+        tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN
+        INSERT INTO users_fts(rowid, username) VALUES (new.id, new.username);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, username) VALUES ('delete', old.id, old.username);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF username ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, username) VALUES ('delete', old.id, old.username);
+        INSERT INTO users_fts(rowid, username) VALUES (new.id, new.username);
+    END
+    """,
+    # Index users created before the triggers existed
+    "INSERT INTO users_fts(users_fts) VALUES ('rebuild')",
+]
+
+POSTGRESQL_STATEMENTS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_users_username_trgm ON users USING GIN (lower(username) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_users_username_prefix ON users (lower(username) text_pattern_ops)",
+]
+
+
+def migrate_user_search():
+    """Create the username search indexes for the configured database"""
+    from .database import DATABASE_URL
+
+    if DATABASE_URL.startswith("sqlite"):
+        print("Using SQLite database")
+        statements = SQLITE_STATEMENTS
+    else:
+        print("Using PostgreSQL database")
+        statements = POSTGRESQL_STATEMENTS
+
+    with engine.begin() as conn:
+        try:
+            for statement in statements:
+                conn.execute(text(statement))
+            print("SUCCESS: Username search indexes created/verified")
+        except Exception as e:
+            print(f"ERROR: Error creating username search indexes: {e}")
+            raise
+
+
+if __name__ == "__main__":
+    print("Starting user search migration...")
+    print("=" * 50)
+    migrate_user_search()
+    print("=" * 50)
+    print("Migration complete!")
@@ -1,5 +1,5 @@
 """Database models for BlueberryBooks"""
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, LargeBinary, Boolean, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -8,20 +8,27 @@ from .database import Base
 class User(Base):
     """User model"""
     __tablename__ = "users"
+    # Never hand a deleted account's id to a new one; caches and tokens key on it
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True, nullable=False)
     password_hash = Column(String, nullable=False)
     is_private = Column(Integer, default=0, nullable=False)  # 0 = public, 1 = private
+    data_version = Column(Integer, default=0, nullable=False)  # bumped on every diary/rating/read-book write
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Set when the account is deleted; its rows are removed in the background
+    deleted_at = Column(DateTime(timezone=True))
 
     # Relationships
-    diary_entries = relationship("DiaryEntry", back_populates="user", cascade="all, delete-orphan")
-    ratings = relationship("Rating", back_populates="user", cascade="all, delete-orphan")
-    read_books = relationship("ReadBook", back_populates="user", cascade="all, delete-orphan")
-    following = relationship("Follow", foreign_keys="Follow.follower_id", back_populates="follower", cascade="all, delete-orphan")
-    followers = relationship("Follow", foreign_keys="Follow.followed_id", back_populates="followed", cascade="all, delete-orphan")
+    # Child rows are removed by ON DELETE CASCADE (see utils.account_deletion),
+    # not loaded and deleted one by one
+    diary_entries = relationship("DiaryEntry", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    ratings = relationship("Rating", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    read_books = relationship("ReadBook", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    following = relationship("Follow", foreign_keys="Follow.follower_id", back_populates="follower", cascade="all, delete-orphan", passive_deletes=True)
+    followers = relationship("Follow", foreign_keys="Follow.followed_id", back_populates="followed", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Book(Base):
@@ -49,7 +56,7 @@ class DiaryEntry(Base):
     __tablename__ = "diary_entries"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
     entry_text = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -65,7 +72,7 @@ class Rating(Base):
     __tablename__ = "ratings"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
     rating = Column(Integer, nullable=False)  # 1-5
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -86,7 +93,7 @@ class ReadBook(Base):
     __tablename__ = "read_books"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
     read_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -105,8 +112,8 @@ class Follow(Base):
     __tablename__ = "follows"
 
     id = Column(Integer, primary_key=True, index=True)
-    follower_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    followed_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    follower_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    followed_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relationships
@@ -116,5 +123,126 @@ class Follow(Base):
     # Unique constraint: one follow relationship per user pair
     __table_args__ = (
         UniqueConstraint('follower_id', 'followed_id', name='unique_follow_relationship'),
+        # Keyset pagination of followers and following lists
+        Index('ix_follows_followed_created', 'followed_id', 'created_at', 'id'),
+        Index('ix_follows_follower_created', 'follower_id', 'created_at', 'id'),
     )
 
+
+
+class ChangeLog(Base):
+    """ChangeLog model - per-user record of writes, read by the incremental sync endpoint"""
+    __tablename__ = "change_log"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    version = Column(Integer, nullable=False)  # user's data_version after the write
+    entity = Column(String, nullable=False)  # diary_entry, rating, read_book or follow
+    entity_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)  # upsert or delete
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_change_log_user_version', 'user_id', 'version'),
+    )
+
+
+class BookRatingStats(Base):
+    """BookRatingStats model - per-book rating aggregates, kept in step with ratings by utils.rating_stats"""
+    __tablename__ = "book_rating_stats"
+
+    book_id = Column(Integer, ForeignKey("books.id"), primary_key=True)
+    rating_count = Column(Integer, default=0, nullable=False)
+    rating_sum = Column(Integer, default=0, nullable=False)
+    count_1 = Column(Integer, default=0, nullable=False)
+    count_2 = Column(Integer, default=0, nullable=False)
+    count_3 = Column(Integer, default=0, nullable=False)
+    count_4 = Column(Integer, default=0, nullable=False)
+    count_5 = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class LeaderboardEntry(Base):
+    """LeaderboardEntry model - ranked snapshot rows, replaced wholesale by utils.leaderboards"""
+    __tablename__ = "leaderboard_entries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    period = Column(String, nullable=False)  # all, 30d or 7d
+    kind = Column(String, nullable=False)  # top_rated or most_read
+    rank = Column(Integer, nullable=False)
+    book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
+    score = Column(Float, nullable=False)  # Bayesian average for top_rated, read count for most_read
+    rating_count = Column(Integer)
+    read_count = Column(Integer)
+    computed_at = Column(DateTime(timezone=True), nullable=False)
+
+    # Relationships
+    book = relationship("Book")
+
+    __table_args__ = (
+        UniqueConstraint('period', 'kind', 'rank', name='unique_leaderboard_rank'),
+    )
+
+
+class BookNeighbors(Base):
+    """BookNeighbors model - precomputed similar books, written by utils.train_recommendations"""
+    __tablename__ = "book_neighbors"
+
+    book_id = Column(Integer, ForeignKey("books.id"), primary_key=True)
+    # Little-endian int32 book ids followed by float32 similarities, best first
+    neighbors = Column(LargeBinary, nullable=False)
+    computed_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class Activity(Base):
+    """Activity model - a user's rating, review or read event, shown in their followers' feeds"""
+    __tablename__ = "activities"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    verb = Column(String, nullable=False)  # rated, reviewed or read
+    object_id = Column(Integer, nullable=False)  # id of the rating, diary entry or read book
+    book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
+    rating = Column(Integer)
+    excerpt = Column(Text)
+    # False when the actor had too many followers to copy into timelines;
+    # such activities are pulled at read time instead
+    fanned_out = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_activities_user_id_id', 'user_id', 'id'),
+        Index('ix_activities_verb_object', 'verb', 'object_id'),
+    )
+
+
+class TimelineEntry(Base):
+    """TimelineEntry model - an activity copied into a follower's feed on write"""
+    __tablename__ = "timeline_entries"
+
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    activity_id = Column(Integer, ForeignKey("activities.id", ondelete="CASCADE"), primary_key=True)
+
+
+class Job(Base):
+    """Job model - durable background work, claimed and run by utils.jobs"""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # registered handler name
+    payload = Column(Text, nullable=False, default="{}")  # JSON keyword arguments
+    priority = Column(Integer, nullable=False, default=100)  # lower runs first
+    # At most one job per key; a finished job is re-armed instead of duplicated
+    dedupe_key = Column(String, unique=True)
+    status = Column(String, nullable=False, default="queued")  # queued, running, done or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(DateTime(timezone=True), nullable=False)
+    locked_until = Column(DateTime(timezone=True))  # a running job past this is reclaimed
+    last_error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        Index('ix_jobs_status_priority_run_at', 'status', 'priority', 'run_at'),
+    )
@@ -2,18 +2,19 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import Optional
-
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from typing import Optional, Tuple
+from contextvars import ContextVar
 
 from models.database import get_db
 from models.models import User
 from utils.auth import verify_password, get_password_hash, create_access_token, decode_access_token
+from utils.user_search import note_new_user
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
+# (token, user) resolved once by a batch request and reused by its sub-requests
+resolved_user: ContextVar[Optional[Tuple[str, User]]] = ContextVar("resolved_user", default=None)
+
 
 class UserRegister(BaseModel):
     username: str
@@ -52,6 +53,7 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    note_new_user(new_user.username, new_user.id)
     
     # Create access token
     access_token = create_access_token(data={"sub": new_user.username, "user_id": new_user.id})
@@ -69,7 +71,7 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
     """Login user"""
     # Find user
     user = db.query(User).filter(User.username == user_data.username).first()
-    if not user:
+    if not user or user.deleted_at is not None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
@@ -95,6 +97,10 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
 
 def get_current_user(token: str, db: Session = Depends(get_db)) -> User:
     """Get current authenticated user from token"""
+    resolved = resolved_user.get()
+    if resolved is not None and resolved[0] == token:
+        return resolved[1]
+
     payload = decode_access_token(token)
     if payload is None:
         raise HTTPException(
@@ -111,8 +117,9 @@ def get_current_user(token: str, db: Session = Depends(get_db)) -> User:
             detail="Invalid authentication credentials"
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
+    user = db.query(User).filter(User.id == user_id, User.deleted_at.is_(None)).first()
+    # A token names its user twice; both must still match the same account
+    if user is None or user.username != username:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
@@ -0,0 +1,162 @@
+"""Batch request route"""
+from fastapi import APIRouter, Depends, HTTPException, Header, Request
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import Optional, List, Any
+import asyncio
+import json
+import os
+
+from models.database import get_db, shared_session
+from routes.auth import get_current_user, resolved_user
+
+router = APIRouter(prefix="/batch", tags=["batch"])
+
+MAX_BATCH_REQUESTS = 20
+BATCH_METHODS = {"GET", "POST", "PUT", "PATCH", "DELETE"}
+# Seconds a sub-request may spend awaiting before it is cancelled with a 504
+BATCH_ITEM_TIMEOUT = float(os.getenv("BATCH_ITEM_TIMEOUT", "10"))
+# Streaming endpoints, relative to the API root: their responses are open-ended
+STREAMING_PATHS = {"/events/stream", "/users/me/export", "/books/import"}
+
+# Connection-level scope keys copied onto every sub-request
+_SCOPE_KEYS = ("type", "asgi", "http_version", "scheme", "server", "client", "root_path")
+
+
+class BatchItem(BaseModel):
+    method: str = "GET"
+    path: str
+    body: Optional[Any] = None
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+
+
+class BatchItemResult(BaseModel):
+    status: int
+    body: Optional[Any] = None
+
+
+class BatchResponse(BaseModel):
+    responses: List[BatchItemResult]
+
+
+async def _dispatch(request: Request, prefix: str, item: BatchItem) -> dict:
+    """Run one sub-request through the app in-process and collect its response"""
+    path, _, query = item.path.partition("?")
+    body = b"" if item.body is None else json.dumps(item.body).encode()
+    headers = [(name, value) for name, value in request.scope["headers"] if name in (b"authorization", b"host")]
+    headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+
+    scope = {key: request.scope[key] for key in _SCOPE_KEYS if key in request.scope}
+    scope.update({
+        "method": item.method.upper(),
+        "path": prefix + path,
+        "raw_path": (prefix + path).encode(),
+        "query_string": query.encode(),
+        "headers": headers,
+    })
+
+    sent_body = False
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Only streaming responses wait for more; they are rejected before
+        # dispatch, and the timeout ends anything else that gets here
+        await asyncio.Future()
+
+    response = {"status": 500, "headers": [], "body": []}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = message.get("headers", [])
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    try:
+        await request.app(scope, receive, send)
+    except Exception:
+        # The error middleware has already sent a 500 if it could
+        pass
+
+    raw = b"".join(response["body"])
+    content_type = dict(response["headers"]).get(b"content-type", b"")
+    if not raw:
+        data = None
+    elif content_type.startswith(b"application/json"):
+        data = json.loads(raw)
+    else:
+        data = raw.decode("utf-8", errors="replace")
+    return {"status": response["status"], "body": data}
+
+
+@router.post("", response_model=BatchResponse)
+async def run_batch(
+    batch: BatchRequest,
+    request: Request,
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Run several API requests in one round trip
+
+    Each item gives a method, a path relative to the API root (query string
+    included) and an optional JSON body. Sub-requests share this request's
+    database session and its already-resolved user, and run one at a time in
+    order, so later items see earlier writes. Streaming endpoints can't be
+    batched. An item still running after BATCH_ITEM_TIMEOUT seconds is
+    cancelled with a 504, but only at an await: the timeout can't interrupt
+    a handler's blocking database calls, so a hung query still holds up the
+    batch. Results come back in request order with each item's own status,
+    so one failing item does not fail the batch.
+    """
+    if len(batch.requests) > MAX_BATCH_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_REQUESTS} requests per batch")
+
+    # Authentication is optional here: public endpoints work without it, and
+    # protected ones report their own 401
+    if authorization and authorization.startswith("Bearer "):
+        token = authorization.split(" ")[1]
+        user_token = resolved_user.set((token, get_current_user(token, db)))
+    else:
+        user_token = None
+    session_token = shared_session.set(db)
+
+    prefix = request.url.path[:-len(router.prefix)]
+    results: List[dict] = []
+
+    try:
+        for item in batch.requests:
+            method = item.method.upper()
+            path = item.path.split("?")[0].rstrip("/")
+            if method not in BATCH_METHODS:
+                results.append({"status": 405, "body": {"detail": f"Method {item.method} not allowed"}})
+                continue
+            if not item.path.startswith("/") or path == router.prefix:
+                results.append({"status": 400, "body": {"detail": "Invalid path"}})
+                continue
+            if path in STREAMING_PATHS:
+                results.append({"status": 400, "body": {"detail": "Streaming endpoints can't be batched"}})
+                continue
+            try:
+                result = await asyncio.wait_for(_dispatch(request, prefix, item), BATCH_ITEM_TIMEOUT)
+            except asyncio.TimeoutError:
+                # Cancelled partway through, possibly mid-write; drop what it changed
+                db.rollback()
+                result = {"status": 504, "body": {"detail": "Request timed out"}}
+            else:
+                if result["status"] >= 400 and method != "GET":
+                    # Don't leave a failed write's changes on the shared session
+                    db.rollback()
+            results.append(result)
+    finally:
+        shared_session.reset(session_token)
+        if user_token is not None:
+            resolved_user.reset(user_token)
+
+    return {"responses": results}
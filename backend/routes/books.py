@@ -1,20 +1,34 @@
 """Book-related routes"""
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Header, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, select
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict
+from datetime import datetime
 
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import io
+import json
+import tempfile
 
-from models.database import get_db
-from models.models import Book, ReadBook, User
+from models.database import get_db, SessionLocal
+from models.models import Book, ReadBook, User, Rating, DiaryEntry, BookRatingStats, Follow
 from utils.open_library import search_books, get_book_details
 from routes.auth import get_current_user
+from utils.response_cache import get_cached_response, set_cached_response
+from utils.changelog import record_change, record_changes
+from utils.bulk import upsert_rows
+from utils.library_import import import_library
+from utils.rating_stats import apply_rating_changes, current_ratings, serialize_stats
+from utils.leaderboards import WINDOWS, get_leaderboard
+from utils.recommendations import similar_books
+from utils.feed import record_activities, record_activity
 
 router = APIRouter(prefix="/books", tags=["books"])
 
+MAX_IMPORT_BYTES = 20 * 1024 * 1024
+MAX_BULK_ITEMS = 500
+
 
 class BookResponse(BaseModel):
     id: int
@@ -39,6 +53,90 @@ class BookSearchResult(BaseModel):
     published_year: Optional[int]
 
 
+class RatingStats(BaseModel):
+    count: int
+    average: Optional[float]
+    histogram: Dict[int, int]
+
+
+class BookDetailResponse(BookResponse):
+    rating_stats: RatingStats
+
+
+class BookBundleResponse(BaseModel):
+    book: BookResponse
+    is_read: bool
+    read_at: Optional[datetime]
+    rating: Optional[dict]
+    diary_entry: Optional[dict]
+    rating_stats: RatingStats
+
+
+class LeaderboardItem(BaseModel):
+    rank: int
+    score: float
+    rating_count: Optional[int]
+    read_count: Optional[int]
+    book: dict
+
+
+class LeaderboardResponse(BaseModel):
+    window: str
+    computed_at: Optional[datetime]
+    min_votes: int
+    top_rated: List[LeaderboardItem]
+    most_read: List[LeaderboardItem]
+
+
+class SimilarBook(BaseModel):
+    score: float
+    book: dict
+
+
+class SimilarBooksResponse(BaseModel):
+    results: List[SimilarBook]
+
+
+class FriendReader(BaseModel):
+    id: int
+    username: str
+    read_at: Optional[datetime]
+    rating: Optional[int]
+
+
+class FriendReadersResponse(BaseModel):
+    results: List[FriendReader]
+
+
+class LogReadRequest(BaseModel):
+    open_library_id: str
+    rating: Optional[int] = None  # 1-5
+    entry_text: Optional[str] = None
+
+
+class LogReadResponse(BaseModel):
+    book: BookResponse
+    read_at: Optional[datetime]
+    rating_id: Optional[int]
+    rating: Optional[int]
+    diary_entry_id: Optional[int]
+    entry_text: Optional[str]
+
+
+class BulkReadRequest(BaseModel):
+    book_ids: List[int]
+
+
+class BulkReadResult(BaseModel):
+    book_id: int
+    status: int
+    detail: Optional[str] = None
+
+
+class BulkReadResponse(BaseModel):
+    results: List[BulkReadResult]
+
+
 @router.get("/search")
 async def search_books_endpoint(
     q: str,
@@ -50,16 +148,202 @@ async def search_books_endpoint(
         raise HTTPException(status_code=400, detail="Search query is required")
     
     results = search_books(q, limit)
+    
+    # Rating stats for results already in the database, in one query
+    open_library_ids = [result["open_library_id"] for result in results]
+    known = db.query(Book.open_library_id, BookRatingStats).outerjoin(
+        BookRatingStats, BookRatingStats.book_id == Book.id
+    ).filter(Book.open_library_id.in_(open_library_ids)).all() if open_library_ids else []
+    stats = {open_library_id: serialize_stats(row) for open_library_id, row in known}
+    
+    results = [{**result, "rating_stats": stats.get(result["open_library_id"])} for result in results]
     return {"results": results}
 
 
-@router.get("/{book_id}", response_model=BookResponse)
+@router.get("/top", response_model=LeaderboardResponse)
+async def get_top_books(window: str = "all", db: Session = Depends(get_db)):
+    """
+    Get the top-rated and most-read books
+
+    ``window`` is all, 30d or 7d. Rankings come from a periodically
+    refreshed snapshot, so they can lag recent ratings by a few minutes.
+    """
+    if window not in WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of: {', '.join(WINDOWS)}")
+    
+    return get_leaderboard(db, window)
+
+
+@router.post("/import")
+async def import_reading_history(
+    request: Request,
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Import a Goodreads or StoryGraph CSV export
+
+    Send the CSV file as the raw request body. Books on the read shelf are
+    marked read with their ratings and reviews. Progress is streamed back as
+    one JSON object per line after each batch is committed.
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+    user_id = current_user.id
+    
+    # Spool the upload to disk so memory use doesn't grow with file size
+    upload = tempfile.TemporaryFile()
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > MAX_IMPORT_BYTES:
+            upload.close()
+            raise HTTPException(status_code=413, detail="Import file is too large")
+        upload.write(chunk)
+    upload.seek(0)
+    
+    def run_import():
+        # The request's session may be closed before the stream finishes
+        import_db = SessionLocal()
+        try:
+            user = import_db.get(User, user_id)
+            stream = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+            for progress in import_library(import_db, user, stream):
+                yield json.dumps(progress) + "\n"
+        except Exception as e:
+            print(f"Error importing library: {e}")
+            yield json.dumps({"error": "Import failed", "done": True}) + "\n"
+        finally:
+            import_db.close()
+            upload.close()
+    
+    return StreamingResponse(run_import(), media_type="application/x-ndjson")
+
+
+@router.get("/{book_id}", response_model=BookDetailResponse)
 async def get_book(book_id: int, db: Session = Depends(get_db)):
-    """Get book details by ID"""
-    book = db.query(Book).filter(Book.id == book_id).first()
-    if not book:
+    """Get book details by ID, with its rating stats across all users"""
+    row = db.query(Book, BookRatingStats).outerjoin(
+        BookRatingStats, BookRatingStats.book_id == Book.id
+    ).filter(Book.id == book_id).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Book not found")
-    return book
+    book, stats = row
+    return {**BookResponse.model_validate(book).model_dump(), "rating_stats": serialize_stats(stats)}
+
+
+def _book_values(book_data: dict) -> dict:
+    """Column values for a Book row from Open Library details"""
+    return {
+        "open_library_id": book_data["open_library_id"],
+        "title": book_data["title"],
+        "author": book_data.get("author"),
+        "isbn": book_data.get("isbn"),
+        "cover_image_url": book_data.get("cover_image_url"),
+        "description": book_data.get("description"),
+        "published_year": int(book_data["published_year"]) if book_data.get("published_year") else None
+    }
+
+
+@router.get("/{book_id}/bundle", response_model=BookBundleResponse)
+async def get_book_bundle(
+    book_id: int,
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Get everything the book page needs in one query
+
+    The book, the viewer's read status, rating and diary entry, and the
+    book's rating stats across all users.
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+    
+    row = db.query(
+        Book,
+        ReadBook.read_at,
+        ReadBook.id.label("read_id"),
+        Rating,
+        DiaryEntry,
+        BookRatingStats
+    ).outerjoin(
+        ReadBook, and_(ReadBook.book_id == Book.id, ReadBook.user_id == current_user.id)
+    ).outerjoin(
+        Rating, and_(Rating.book_id == Book.id, Rating.user_id == current_user.id)
+    ).outerjoin(
+        DiaryEntry, and_(DiaryEntry.book_id == Book.id, DiaryEntry.user_id == current_user.id)
+    ).outerjoin(
+        BookRatingStats, BookRatingStats.book_id == Book.id
+    ).filter(Book.id == book_id).first()
+    
+    if not row:
+        raise HTTPException(status_code=404, detail="Book not found")
+    
+    rating, entry = row.Rating, row.DiaryEntry
+    return {
+        "book": row.Book,
+        "is_read": row.read_id is not None,
+        "read_at": row.read_at,
+        "rating": {
+            "id": rating.id,
+            "user_id": rating.user_id,
+            "book_id": rating.book_id,
+            "rating": rating.rating,
+            "created_at": rating.created_at,
+            "updated_at": rating.updated_at
+        } if rating else None,
+        "diary_entry": {
+            "id": entry.id,
+            "user_id": entry.user_id,
+            "book_id": entry.book_id,
+            "entry_text": entry.entry_text,
+            "created_at": entry.created_at,
+            "updated_at": entry.updated_at
+        } if entry else None,
+        "rating_stats": serialize_stats(row.BookRatingStats)
+    }
+
+
+@router.get("/{book_id}/similar", response_model=SimilarBooksResponse)
+async def get_similar_books(book_id: int, limit: int = 10, db: Session = Depends(get_db)):
+    """Get books most often read and rated alongside this one"""
+    return {"results": similar_books(db, book_id, min(max(limit, 1), 50))}
+
+
+@router.get("/{book_id}/friends", response_model=FriendReadersResponse)
+async def get_friends_who_read(
+    book_id: int,
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Get the people you follow who have read or rated this book"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+    
+    rows = db.query(
+        User.id, User.username, ReadBook.read_at, Rating.rating
+    ).join(
+        Follow, and_(Follow.followed_id == User.id, Follow.follower_id == current_user.id)
+    ).outerjoin(
+        ReadBook, and_(ReadBook.user_id == User.id, ReadBook.book_id == book_id)
+    ).outerjoin(
+        Rating, and_(Rating.user_id == User.id, Rating.book_id == book_id)
+    ).filter(
+        User.deleted_at.is_(None),
+        or_(ReadBook.id.isnot(None), Rating.id.isnot(None))
+    ).order_by(User.username).all()
+    
+    return {"results": [row._mapping for row in rows]}
 
 
 @router.post("/add")
@@ -86,15 +370,7 @@ async def add_book_to_library(
         raise HTTPException(status_code=404, detail="Book not found in Open Library")
     
     # Create book record
-    new_book = Book(
-        open_library_id=book_data["open_library_id"],
-        title=book_data["title"],
-        author=book_data.get("author"),
-        isbn=book_data.get("isbn"),
-        cover_image_url=book_data.get("cover_image_url"),
-        description=book_data.get("description"),
-        published_year=int(book_data["published_year"]) if book_data.get("published_year") else None
-    )
+    new_book = Book(**_book_values(book_data))
     db.add(new_book)
     db.commit()
     db.refresh(new_book)
@@ -102,6 +378,87 @@ async def add_book_to_library(
     return {"book_id": new_book.id, "message": "Book added successfully"}
 
 
+@router.post("/log", response_model=LogReadResponse)
+async def log_read(
+    log_data: LogReadRequest,
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Add a book, mark it read, rate and review it in one transaction
+
+    Replaces the /books/add, /books/{id}/read, POST /ratings and POST /diary
+    sequence. Rating and entry text are optional; existing rows are updated.
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+    
+    if log_data.rating is not None and (log_data.rating < 1 or log_data.rating > 5):
+        raise HTTPException(status_code=400, detail="Rating must be between 1 and 5")
+    
+    book = db.query(Book).filter(Book.open_library_id == log_data.open_library_id).first()
+    if not book:
+        book_data = get_book_details(log_data.open_library_id)
+        if not book_data:
+            raise HTTPException(status_code=404, detail="Book not found in Open Library")
+        # Another request may add the same book concurrently
+        upsert_rows(db, Book, [_book_values(book_data)], ["open_library_id"], [])
+        book = db.query(Book).filter(Book.open_library_id == log_data.open_library_id).first()
+    
+    read_ids = upsert_rows(db, ReadBook, [
+        {"user_id": current_user.id, "book_id": book.id}
+    ], ["user_id", "book_id"], [])
+    record_changes(db, current_user, "read_book", read_ids)
+    # Only a new read mark is news; ON CONFLICT DO NOTHING returns no id otherwise
+    record_activities(db, current_user, "read", [{"object_id": read_id, "book_id": book.id} for read_id in read_ids])
+    
+    if log_data.rating is not None:
+        previous = current_ratings(db, current_user.id, [book.id])
+        rating_ids = upsert_rows(db, Rating, [
+            {"user_id": current_user.id, "book_id": book.id, "rating": log_data.rating}
+        ], ["user_id", "book_id"], ["rating"])
+        apply_rating_changes(db, [(book.id, previous.get(book.id), log_data.rating)])
+        record_changes(db, current_user, "rating", rating_ids)
+        record_activities(db, current_user, "rated", [
+            {"object_id": rating_id, "book_id": book.id, "rating": log_data.rating} for rating_id in rating_ids
+        ])
+    
+    if log_data.entry_text:
+        entry = db.query(DiaryEntry).filter(
+            DiaryEntry.user_id == current_user.id,
+            DiaryEntry.book_id == book.id
+        ).first()
+        if entry:
+            entry.entry_text = log_data.entry_text
+        else:
+            entry = DiaryEntry(user_id=current_user.id, book_id=book.id, entry_text=log_data.entry_text)
+            db.add(entry)
+        record_change(db, current_user, "diary_entry", entry)
+        record_activity(db, current_user, "reviewed", entry.id, book.id, text=entry.entry_text)
+    
+    db.commit()
+    
+    # Return the combined state in one query
+    state = db.execute(
+        select(
+            ReadBook.read_at,
+            Rating.id.label("rating_id"),
+            Rating.rating,
+            DiaryEntry.id.label("diary_entry_id"),
+            DiaryEntry.entry_text
+        )
+        .select_from(ReadBook)
+        .outerjoin(Rating, and_(Rating.user_id == ReadBook.user_id, Rating.book_id == ReadBook.book_id))
+        .outerjoin(DiaryEntry, and_(DiaryEntry.user_id == ReadBook.user_id, DiaryEntry.book_id == ReadBook.book_id))
+        .where(ReadBook.user_id == current_user.id, ReadBook.book_id == book.id)
+    ).first()
+    
+    return {"book": book, **state._mapping}
+
+
 @router.post("/{book_id}/read")
 async def mark_book_as_read(
     book_id: int,
@@ -135,11 +492,65 @@ async def mark_book_as_read(
         book_id=book_id
     )
     db.add(read_book)
+    record_change(db, current_user, "read_book", read_book)
+    record_activity(db, current_user, "read", read_book.id, book_id)
     db.commit()
     
     return {"message": "Book marked as read"}
 
 
+@router.post("/read/bulk", response_model=BulkReadResponse)
+async def bulk_mark_books_as_read(
+    bulk_data: BulkReadRequest,
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Mark many books as read in one transaction
+
+    Uses a single INSERT ... ON CONFLICT DO NOTHING on unique_user_book_read.
+    Each book gets a status: 201 newly marked, 200 already read, 404 unknown book.
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+    
+    if len(bulk_data.book_ids) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_ITEMS} books per request")
+    
+    requested_ids = set(bulk_data.book_ids)
+    existing_books = {
+        book_id for (book_id,) in db.query(Book.id).filter(Book.id.in_(requested_ids))
+    } if requested_ids else set()
+    
+    inserted = upsert_rows(db, ReadBook, [
+        {"user_id": current_user.id, "book_id": book_id}
+        for book_id in requested_ids if book_id in existing_books
+    ], ["user_id", "book_id"], [], returning=[ReadBook.id, ReadBook.book_id])
+    newly_read = {row.book_id for row in inserted}
+    
+    record_changes(db, current_user, "read_book", [row.id for row in inserted])
+    record_activities(db, current_user, "read", [
+        {"object_id": row.id, "book_id": row.book_id} for row in inserted
+    ])
+    db.commit()
+    
+    results = []
+    for book_id in bulk_data.book_ids:
+        if book_id not in existing_books:
+            results.append({"book_id": book_id, "status": 404, "detail": "Book not found"})
+        elif book_id in newly_read:
+            results.append({"book_id": book_id, "status": 201})
+            # Report a duplicate in the same request as already read
+            newly_read.discard(book_id)
+        else:
+            results.append({"book_id": book_id, "status": 200, "detail": "Book already marked as read"})
+    
+    return {"results": results}
+
+
 @router.get("/user/read", response_model=List[BookResponse])
 async def get_user_read_books(
     authorization: Optional[str] = Header(None),
@@ -152,9 +563,16 @@ async def get_user_read_books(
     token = authorization.split(" ")[1]
     current_user = get_current_user(token, db)
     
+    cached = get_cached_response(current_user, "books/user/read")
+    if cached is not None:
+        return cached
+    
     read_books = db.query(Book).join(ReadBook).filter(
         ReadBook.user_id == current_user.id
     ).all()
     
-    return read_books
+    # Cache plain dicts, not ORM instances bound to this request's session
+    result = [BookResponse.model_validate(book).model_dump() for book in read_books]
+    set_cached_response(current_user, "books/user/read", result)
+    return result
 
@@ -1,17 +1,18 @@
 """Diary entry routes"""
 from fastapi import APIRouter, Depends, HTTPException, Header
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import OperationalError, ProgrammingError
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
 
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
 from models.database import get_db
 from models.models import DiaryEntry, Book, User
 from routes.auth import get_current_user
+from utils.response_cache import get_cached_response, set_cached_response
+from utils.changelog import record_change
+from utils.feed import record_activity, remove_activities
+from utils.diary_search import search_diary_entries
 
 router = APIRouter(prefix="/diary", tags=["diary"])
 
@@ -38,6 +39,20 @@ class DiaryEntryResponse(BaseModel):
         from_attributes = True
 
 
+class DiaryEntrySearchResult(BaseModel):
+    id: int
+    book_id: int
+    snippet: str
+    score: float
+    created_at: datetime
+    updated_at: Optional[datetime]
+    book: Optional[dict] = None
+
+
+class DiarySearchResponse(BaseModel):
+    results: List[DiaryEntrySearchResult]
+
+
 @router.post("", response_model=DiaryEntryResponse)
 async def create_diary_entry(
     entry_data: DiaryEntryCreate,
@@ -75,6 +90,8 @@ async def create_diary_entry(
         entry_text=entry_data.entry_text
     )
     db.add(new_entry)
+    record_change(db, current_user, "diary_entry", new_entry)
+    record_activity(db, current_user, "reviewed", new_entry.id, new_entry.book_id, text=new_entry.entry_text)
     db.commit()
     db.refresh(new_entry)
     
@@ -109,6 +126,10 @@ async def get_all_diary_entries(
     token = authorization.split(" ")[1]
     current_user = get_current_user(token, db)
     
+    cached = get_cached_response(current_user, "diary")
+    if cached is not None:
+        return cached
+    
     entries = db.query(DiaryEntry).filter(
         DiaryEntry.user_id == current_user.id
     ).order_by(DiaryEntry.created_at.desc()).all()
@@ -134,9 +155,38 @@ async def get_all_diary_entries(
         }
         result.append(entry_dict)
     
+    set_cached_response(current_user, "diary", result)
     return result
 
 
+@router.get("/search", response_model=DiarySearchResponse)
+async def search_diary(
+    q: str,
+    limit: int = 20,
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Full-text search over the current user's diary entries"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+    
+    if not q or len(q.strip()) == 0:
+        raise HTTPException(status_code=400, detail="Search query is required")
+    
+    try:
+        results = search_diary_entries(db, current_user.id, q, min(max(limit, 1), 100))
+    except (OperationalError, ProgrammingError):
+        raise HTTPException(
+            status_code=503,
+            detail="Diary search index is not set up. Run python -m models.migrate_diary_search"
+        )
+    
+    return {"results": results}
+
+
 @router.get("/{book_id}", response_model=DiaryEntryResponse)
 async def get_diary_entry_for_book(
     book_id: int,
@@ -201,6 +251,8 @@ async def update_diary_entry(
         raise HTTPException(status_code=404, detail="Diary entry not found")
     
     entry.entry_text = entry_data.entry_text
+    record_change(db, current_user, "diary_entry", entry)
+    record_activity(db, current_user, "reviewed", entry.id, entry.book_id, text=entry.entry_text)
     db.commit()
     db.refresh(entry)
     
@@ -248,6 +300,8 @@ async def delete_diary_entry(
         raise HTTPException(status_code=404, detail="Diary entry not found")
     
     db.delete(entry)
+    record_change(db, current_user, "diary_entry", entry, "delete")
+    remove_activities(db, "reviewed", [entry.id])
     db.commit()
     
     return {"message": "Diary entry deleted successfully"}
@@ -0,0 +1,64 @@
+"""Server-Sent Events stream of social events"""
+from fastapi import APIRouter, HTTPException, Header, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import asyncio
+import json
+
+from models.database import SessionLocal
+from models.models import Follow
+from routes.auth import get_current_user
+from utils.events import EVENTS_HEARTBEAT, subscribe, unsubscribe
+
+router = APIRouter(prefix="/events", tags=["events"])
+
+
+@router.get("/stream")
+async def stream_events(
+    request: Request,
+    token: Optional[str] = None,
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Stream new followers and followed users' activity as Server-Sent Events
+
+    EventSource can't send headers, so the token may be passed as ?token=
+    instead of the Authorization header. A comment line is sent every
+    EVENTS_HEARTBEAT seconds to keep proxies from closing an idle stream.
+    """
+    if authorization and authorization.startswith("Bearer "):
+        token = authorization.split(" ")[1]
+    if not token:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    # Not Depends(get_db): an open stream would hold a pooled connection while idle
+    db = SessionLocal()
+    try:
+        current_user = get_current_user(token, db)
+        user_id = current_user.id
+        following = {followed for (followed,) in db.query(Follow.followed_id).filter(Follow.follower_id == user_id)}
+    finally:
+        db.close()
+    
+    subscription = subscribe(user_id, following)
+    if subscription is None:
+        raise HTTPException(status_code=429, detail="Too many open event streams")
+    
+    async def stream():
+        try:
+            yield f"retry: 5000\nevent: ready\ndata: {json.dumps({'type': 'ready'})}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), EVENTS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            unsubscribe(subscription)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,51 @@
+"""Activity feed routes"""
+from fastapi import APIRouter, Depends, HTTPException, Header
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import Optional, List
+from datetime import datetime
+
+from models.database import get_db
+from routes.auth import get_current_user
+from utils.feed import load_feed
+
+router = APIRouter(prefix="/feed", tags=["feed"])
+
+MAX_FEED_PAGE = 100
+
+
+class FeedItem(BaseModel):
+    id: int
+    verb: str
+    created_at: Optional[datetime]
+    user: dict
+    book: Optional[dict]
+    rating: Optional[int]
+    excerpt: Optional[str]
+
+
+class FeedResponse(BaseModel):
+    items: List[FeedItem]
+    next_cursor: Optional[int]
+
+
+@router.get("", response_model=FeedResponse)
+async def get_feed(
+    limit: int = 20,
+    before: Optional[int] = None,
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Get recent ratings, reviews and reads of the users you follow
+
+    Newest first. Pass ``next_cursor`` from the previous page as ``before``
+    to get the next one.
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+    
+    return load_feed(db, current_user.id, min(max(limit, 1), MAX_FEED_PAGE), before)
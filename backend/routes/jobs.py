@@ -0,0 +1,28 @@
+"""Background job routes"""
+from fastapi import APIRouter, HTTPException, Header
+from typing import Optional
+import hmac
+import os
+
+from utils.jobs import drain
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+CRON_SECRET = os.getenv("CRON_SECRET", "")
+
+
+@router.get("/drain")
+def drain_jobs(authorization: Optional[str] = Header(None)):
+    """
+    Run due background jobs for up to JOB_DRAIN_SECONDS
+
+    For Vercel Cron, which sends ``Authorization: Bearer $CRON_SECRET``.
+    Disabled unless CRON_SECRET is set. A plain def so the drain runs in
+    the threadpool instead of blocking the event loop.
+    """
+    if not CRON_SECRET:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not authorization or not hmac.compare_digest(authorization, f"Bearer {CRON_SECRET}"):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    return drain()
@@ -0,0 +1,58 @@
+"""Admin routes for stored request profiles"""
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import JSONResponse, PlainTextResponse
+from typing import Optional
+import hmac
+
+from utils.profiling import PROFILE_SECRET, get_profile, list_profiles
+
+router = APIRouter(prefix="/profiles", tags=["profiles"])
+
+
+def _require_admin(authorization: Optional[str]):
+    """Disabled unless PROFILE_SECRET is set; callers send it as a bearer token"""
+    if not PROFILE_SECRET:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not authorization or not hmac.compare_digest(authorization, f"Bearer {PROFILE_SECRET}"):
+        raise HTTPException(status_code=401, detail="Authentication required")
+
+
+def _stored(profile_id: str, kind: str):
+    profile = get_profile(profile_id, kind)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+
+@router.get("")
+def get_profiles(authorization: Optional[str] = Header(None)):
+    """Most recent profiles, newest first"""
+    _require_admin(authorization)
+    return {"results": list_profiles()}
+
+
+@router.get("/{profile_id}")
+def get_profile_details(profile_id: str, authorization: Optional[str] = Header(None)):
+    """Summary of one profile with its SQL statements and Open Library calls"""
+    _require_admin(authorization)
+    return _stored(profile_id, "details")
+
+
+@router.get("/{profile_id}/speedscope")
+def get_profile_speedscope(profile_id: str, authorization: Optional[str] = Header(None)):
+    """Profile as a speedscope file (open it at https://www.speedscope.app)"""
+    _require_admin(authorization)
+    return JSONResponse(
+        _stored(profile_id, "speedscope"),
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.speedscope.json"'}
+    )
+
+
+@router.get("/{profile_id}/collapsed")
+def get_profile_collapsed(profile_id: str, authorization: Optional[str] = Header(None)):
+    """Profile as collapsed stacks, for flamegraph.pl or speedscope"""
+    _require_admin(authorization)
+    return PlainTextResponse(
+        _stored(profile_id, "collapsed"),
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.collapsed.txt"'}
+    )
@@ -6,16 +6,19 @@ from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
 
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
 from models.database import get_db
 from models.models import Rating, Book, User
 from routes.auth import get_current_user
+from utils.response_cache import get_cached_response, set_cached_response
+from utils.changelog import record_change, record_changes
+from utils.bulk import upsert_rows
+from utils.rating_stats import apply_rating_changes, current_ratings
+from utils.feed import record_activities, record_activity, remove_activities
 
 router = APIRouter(prefix="/ratings", tags=["ratings"])
 
+MAX_BULK_ITEMS = 500
+
 
 class RatingCreate(BaseModel):
     book_id: int
@@ -35,6 +38,22 @@ class RatingResponse(BaseModel):
         from_attributes = True
 
 
+class BulkRatingRequest(BaseModel):
+    ratings: List[RatingCreate]
+
+
+class BulkRatingResult(BaseModel):
+    book_id: int
+    status: int
+    id: Optional[int] = None
+    rating: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class BulkRatingResponse(BaseModel):
+    results: List[BulkRatingResult]
+
+
 @router.post("", response_model=RatingResponse)
 async def create_or_update_rating(
     rating_data: RatingCreate,
@@ -65,7 +84,10 @@ async def create_or_update_rating(
     
     if existing_rating:
         # Update existing rating
+        apply_rating_changes(db, [(book.id, existing_rating.rating, rating_data.rating)])
         existing_rating.rating = rating_data.rating
+        record_change(db, current_user, "rating", existing_rating)
+        record_activity(db, current_user, "rated", existing_rating.id, book.id, rating=rating_data.rating)
         db.commit()
         db.refresh(existing_rating)
         
@@ -94,6 +116,9 @@ async def create_or_update_rating(
         rating=rating_data.rating
     )
     db.add(new_rating)
+    apply_rating_changes(db, [(book.id, None, rating_data.rating)])
+    record_change(db, current_user, "rating", new_rating)
+    record_activity(db, current_user, "rated", new_rating.id, book.id, rating=rating_data.rating)
     db.commit()
     db.refresh(new_rating)
     
@@ -116,6 +141,72 @@ async def create_or_update_rating(
     return rating_dict
 
 
+@router.post("/bulk", response_model=BulkRatingResponse)
+async def bulk_rate_books(
+    bulk_data: BulkRatingRequest,
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Create or update many ratings in one transaction
+
+    Valid items are written with a single INSERT ... ON CONFLICT on
+    unique_user_book_rating. Each item gets its own result with an HTTP-style
+    status; invalid items don't prevent the others from being saved. When a
+    book appears more than once, the last rating wins.
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+    
+    if len(bulk_data.ratings) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_ITEMS} ratings per request")
+    
+    requested_ids = {item.book_id for item in bulk_data.ratings}
+    existing_books = {
+        book_id for (book_id,) in db.query(Book.id).filter(Book.id.in_(requested_ids))
+    } if requested_ids else set()
+    
+    results = []
+    valid = {}
+    for item in bulk_data.ratings:
+        if item.rating < 1 or item.rating > 5:
+            results.append({"book_id": item.book_id, "status": 400, "detail": "Rating must be between 1 and 5"})
+        elif item.book_id not in existing_books:
+            results.append({"book_id": item.book_id, "status": 404, "detail": "Book not found"})
+        else:
+            results.append(None)
+            valid[item.book_id] = item.rating
+    
+    previous = current_ratings(db, current_user.id, valid)
+    saved = upsert_rows(db, Rating, [
+        {"user_id": current_user.id, "book_id": book_id, "rating": rating}
+        for book_id, rating in valid.items()
+    ], ["user_id", "book_id"], ["rating"], returning=[Rating.id, Rating.book_id])
+    rating_ids = {row.book_id: row.id for row in saved}
+    apply_rating_changes(db, [(book_id, previous.get(book_id), rating) for book_id, rating in valid.items()])
+    
+    record_changes(db, current_user, "rating", list(rating_ids.values()))
+    record_activities(db, current_user, "rated", [
+        {"object_id": rating_ids[book_id], "book_id": book_id, "rating": rating}
+        for book_id, rating in valid.items()
+    ])
+    db.commit()
+    
+    for index, item in enumerate(bulk_data.ratings):
+        if results[index] is None:
+            results[index] = {
+                "book_id": item.book_id,
+                "status": 200,
+                "id": rating_ids[item.book_id],
+                "rating": valid[item.book_id]
+            }
+    
+    return {"results": results}
+
+
 @router.get("", response_model=List[RatingResponse])
 async def get_all_ratings(
     authorization: Optional[str] = Header(None),
@@ -128,6 +219,10 @@ async def get_all_ratings(
     token = authorization.split(" ")[1]
     current_user = get_current_user(token, db)
     
+    cached = get_cached_response(current_user, "ratings")
+    if cached is not None:
+        return cached
+    
     ratings = db.query(Rating).filter(
         Rating.user_id == current_user.id
     ).order_by(desc(Rating.rating), desc(Rating.created_at)).all()
@@ -154,6 +249,7 @@ async def get_all_ratings(
         }
         result.append(rating_dict)
     
+    set_cached_response(current_user, "ratings", result)
     return result
 
 
@@ -169,6 +265,10 @@ async def get_top_10_rated_books(
     token = authorization.split(" ")[1]
     current_user = get_current_user(token, db)
     
+    cached = get_cached_response(current_user, "ratings/top10")
+    if cached is not None:
+        return cached
+    
     ratings = db.query(Rating).filter(
         Rating.user_id == current_user.id
     ).order_by(desc(Rating.rating), desc(Rating.created_at)).limit(10).all()
@@ -195,6 +295,7 @@ async def get_top_10_rated_books(
         }
         result.append(rating_dict)
     
+    set_cached_response(current_user, "ratings/top10", result)
     return result
 
 
@@ -260,6 +361,9 @@ async def delete_rating(
         raise HTTPException(status_code=404, detail="Rating not found")
     
     db.delete(rating)
+    apply_rating_changes(db, [(rating.book_id, rating.rating, None)])
+    record_change(db, current_user, "rating", rating, "delete")
+    remove_activities(db, "rated", [rating.id])
     db.commit()
     
     return {"message": "Rating deleted successfully"}
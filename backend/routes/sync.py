@@ -0,0 +1,158 @@
+"""Incremental sync routes"""
+from fastapi import APIRouter, Depends, HTTPException, Header
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import or_
+from pydantic import BaseModel
+from typing import Optional, List, Dict
+
+from models.database import get_db
+from models.models import ChangeLog, DiaryEntry, Rating, ReadBook, Follow, User
+from routes.auth import get_current_user
+
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+
+class SyncChange(BaseModel):
+    entity: str
+    id: int
+    op: str
+    data: Optional[dict] = None
+
+
+class SyncResponse(BaseModel):
+    version: int
+    full: bool
+    changes: List[SyncChange]
+
+
+def _book_summary(book) -> Optional[dict]:
+    return {
+        "id": book.id,
+        "open_library_id": book.open_library_id,
+        "title": book.title,
+        "author": book.author,
+        "cover_image_url": book.cover_image_url
+    } if book else None
+
+
+def _serialize_diary_entry(entry: DiaryEntry) -> dict:
+    return {
+        "id": entry.id,
+        "book_id": entry.book_id,
+        "entry_text": entry.entry_text,
+        "created_at": entry.created_at,
+        "updated_at": entry.updated_at,
+        "book": _book_summary(entry.book)
+    }
+
+
+def _serialize_rating(rating: Rating) -> dict:
+    return {
+        "id": rating.id,
+        "book_id": rating.book_id,
+        "rating": rating.rating,
+        "created_at": rating.created_at,
+        "updated_at": rating.updated_at,
+        "book": _book_summary(rating.book)
+    }
+
+
+def _serialize_read_book(read_book: ReadBook) -> dict:
+    return {
+        "id": read_book.id,
+        "book_id": read_book.book_id,
+        "read_at": read_book.read_at,
+        "book": _book_summary(read_book.book)
+    }
+
+
+def _serialize_follow(follow: Follow) -> dict:
+    return {
+        "id": follow.id,
+        "follower_id": follow.follower_id,
+        "followed_id": follow.followed_id,
+        "created_at": follow.created_at
+    }
+
+
+SYNCED_ENTITIES = {
+    "diary_entry": (DiaryEntry, _serialize_diary_entry),
+    "rating": (Rating, _serialize_rating),
+    "read_book": (ReadBook, _serialize_read_book),
+    "follow": (Follow, _serialize_follow),
+}
+
+
+def _load_rows(db: Session, user: User, entity: str, ids: Optional[List[int]] = None) -> Dict[int, dict]:
+    """Load the user's current rows of one entity, optionally limited to ids"""
+    model, serialize = SYNCED_ENTITIES[entity]
+    if model is Follow:
+        query = db.query(Follow).filter(or_(Follow.follower_id == user.id, Follow.followed_id == user.id))
+    else:
+        query = db.query(model).options(joinedload(model.book)).filter(model.user_id == user.id)
+
+    if ids is not None:
+        query = query.filter(model.id.in_(ids))
+    return {row.id: serialize(row) for row in query.all()}
+
+
+@router.get("", response_model=SyncResponse)
+async def get_changes(
+    since: int = 0,
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Get changes to the current user's diary, ratings, read books and follows
+
+    Pass the version from the previous response as ``since``. Only rows
+    written after it are returned, deletions as tombstones with no data.
+    ``since=0`` returns the full current state with ``full`` set.
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+
+    version = current_user.data_version or 0
+
+    if since <= 0:
+        changes = []
+        for entity in SYNCED_ENTITIES:
+            for row_id, data in _load_rows(db, current_user, entity).items():
+                changes.append({"entity": entity, "id": row_id, "op": "upsert", "data": data})
+        return {"version": version, "full": True, "changes": changes}
+
+    # Bound by the version read at auth time so writes committed meanwhile are
+    # picked up by the next sync rather than skipped
+    log = db.query(ChangeLog).filter(
+        ChangeLog.user_id == current_user.id,
+        ChangeLog.version > since,
+        ChangeLog.version <= version
+    ).order_by(ChangeLog.version, ChangeLog.id).all()
+
+    # Keep only the latest operation per row
+    latest = {}
+    for entry in log:
+        latest.pop((entry.entity, entry.entity_id), None)
+        latest[(entry.entity, entry.entity_id)] = entry.op
+
+    upserts = {}
+    for (entity, entity_id), op in latest.items():
+        if op == "upsert":
+            upserts.setdefault(entity, []).append(entity_id)
+    current = {entity: _load_rows(db, current_user, entity, ids) for entity, ids in upserts.items()}
+
+    changes = []
+    for (entity, entity_id), op in latest.items():
+        data = current.get(entity, {}).get(entity_id) if op == "upsert" else None
+        # A row deleted after this version was read is reported as deleted now
+        changes.append({
+            "entity": entity,
+            "id": entity_id,
+            "op": "upsert" if data is not None else "delete",
+            "data": data
+        })
+
+    return {"version": version, "full": False, "changes": changes}
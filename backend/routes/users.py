@@ -1,26 +1,42 @@
 """User-related routes for social features"""
-from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_, or_
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import desc, and_, or_, select, func, exists, true
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
 
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-from models.database import get_db
+from models.database import get_db, SessionLocal
 from models.models import User, Follow, Rating, DiaryEntry, Book, ReadBook
 from routes.auth import get_current_user
+from utils.cache import get_cache
+from utils.response_cache import RESPONSE_CACHE_TTL, bump_user_generation
+from utils.changelog import record_change
+from utils.library_export import export_csv, export_ndjson
+from utils.recommendations import recommend_for_user
+from utils.feed import drop_from_timeline
+from utils.user_search import search_users as find_users, autocomplete_users
+from utils.follow_graph import get_follow_graph, note_follow, suggestions_from_db
+from utils.reading_stats import get_reading_stats
+from utils.events import publish_follow
+from utils.jobs import defer
+from utils.account_deletion import delete_account
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+TOP_RATED_LIMIT = 10
+MAX_FOLLOW_PAGE = 100
+
+_profile_cache = get_cache("profiles", default_ttl=RESPONSE_CACHE_TTL)
+
 
 class UserSearchResult(BaseModel):
     id: int
     username: str
     is_private: bool
+    is_following: bool = False
+    follows_you: bool = False
 
     class Config:
         from_attributes = True
@@ -52,17 +68,123 @@ class UserProfileWithBooksResponse(UserProfileResponse):
     top_rated_books: List[TopRatedBook] = []
 
 
+class RecommendedBook(BaseModel):
+    score: float
+    because_book_id: int
+    book: dict
+
+
+class RecommendationsResponse(BaseModel):
+    results: List[RecommendedBook]
+
+
+class SuggestedUser(UserSearchResult):
+    mutual_count: int
+
+
+class FollowListUser(BaseModel):
+    id: int
+    username: str
+    is_private: bool
+    is_following: bool
+    follows_you: bool
+    is_friend: bool
+    followed_at: Optional[datetime]
+
+
+class FollowListResponse(BaseModel):
+    results: List[FollowListUser]
+    next_cursor: Optional[int]
+
+
 class PrivacyUpdate(BaseModel):
     is_private: bool
 
 
+def get_profile_snapshot(db: Session, user: User) -> dict:
+    """
+    Viewer-independent part of a user's profile
+
+    Follow/read counts and the top rated books with their reviews come from
+    a single query and are cached per data_version, which every rating,
+    diary, read-book, follow and privacy write for the user bumps.
+    """
+    cache_key = f"{user.id}:{user.data_version or 0}"
+    snapshot = _profile_cache.get(cache_key)
+    if snapshot is not None:
+        return snapshot
+    
+    # Follows with an account that is deleted but not yet purged don't count
+    counts = select(
+        select(func.count()).select_from(Follow).join(User, User.id == Follow.follower_id).where(
+            Follow.followed_id == user.id, User.deleted_at.is_(None)
+        ).scalar_subquery().label("followers_count"),
+        select(func.count()).select_from(Follow).join(User, User.id == Follow.followed_id).where(
+            Follow.follower_id == user.id, User.deleted_at.is_(None)
+        ).scalar_subquery().label("following_count"),
+        select(func.count()).select_from(ReadBook).where(ReadBook.user_id == user.id).scalar_subquery().label("books_read_count"),
+    ).subquery()
+    
+    review = select(DiaryEntry.entry_text).where(
+        DiaryEntry.user_id == Rating.user_id,
+        DiaryEntry.book_id == Rating.book_id
+    ).limit(1).scalar_subquery()
+    
+    top_rated = select(
+        Rating.rating,
+        Rating.created_at,
+        Book.id.label("book_id"),
+        Book.open_library_id,
+        Book.title,
+        Book.author,
+        Book.cover_image_url,
+        review.label("review")
+    ).select_from(Rating).join(Book, Book.id == Rating.book_id).where(
+        Rating.user_id == user.id
+    ).order_by(desc(Rating.rating), desc(Rating.created_at)).limit(TOP_RATED_LIMIT).subquery()
+    
+    # One row per top rated book, or a single row of counts with NULL book
+    # columns when the user has rated nothing
+    rows = db.execute(
+        select(counts, top_rated)
+        .select_from(counts.outerjoin(top_rated, true()))
+        .order_by(desc(top_rated.c.rating), desc(top_rated.c.created_at))
+    ).all()
+    
+    first = rows[0]
+    snapshot = {
+        "followers_count": first.followers_count,
+        "following_count": first.following_count,
+        "books_read_count": first.books_read_count,
+        "top_rated_books": [
+            {
+                "book_id": row.book_id,
+                "open_library_id": row.open_library_id,
+                "title": row.title,
+                "author": row.author,
+                "cover_image_url": row.cover_image_url,
+                "rating": row.rating,
+                "review": row.review
+            }
+            for row in rows if row.book_id is not None
+        ]
+    }
+    _profile_cache.set(cache_key, snapshot)
+    return snapshot
+
+
 @router.get("/search")
 async def search_users(
     q: str,
     authorization: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    """Search for users by username"""
+    """
+    Search for users by username
+
+    Exact and prefix matches rank first, then people you follow or who
+    follow you.
+    """
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Authentication required")
     
@@ -73,21 +195,27 @@ async def search_users(
         raise HTTPException(status_code=400, detail="Search query is required")
     
     # Search for users matching the query (excluding current user)
-    users = db.query(User).filter(
-        User.username.ilike(f"%{q}%"),
-        User.id != current_user.id
-    ).limit(20).all()
+    return {"results": find_users(db, current_user.id, q, limit=20)}
+
+
+@router.get("/autocomplete")
+async def autocomplete(
+    q: str,
+    limit: int = 8,
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Usernames starting with q, for type-ahead"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
     
-    return {
-        "results": [
-            {
-                "id": user.id,
-                "username": user.username,
-                "is_private": bool(user.is_private)
-            }
-            for user in users
-        ]
-    }
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+    
+    if not q or len(q.strip()) == 0:
+        return {"results": []}
+    
+    return {"results": autocomplete_users(db, current_user.id, q, min(max(limit, 1), 20))}
 
 
 @router.get("/me/profile", response_model=UserProfileResponse)
@@ -102,26 +230,149 @@ async def get_own_profile(
     token = authorization.split(" ")[1]
     current_user = get_current_user(token, db)
     
-    # Get follower and following counts
-    followers_count = db.query(Follow).filter(Follow.followed_id == current_user.id).count()
-    following_count = db.query(Follow).filter(Follow.follower_id == current_user.id).count()
-    
-    # Get books read count
-    books_read_count = db.query(ReadBook).filter(ReadBook.user_id == current_user.id).count()
+    snapshot = get_profile_snapshot(db, current_user)
     
     return {
         "id": current_user.id,
         "username": current_user.username,
         "is_private": bool(current_user.is_private),
-        "followers_count": followers_count,
-        "following_count": following_count,
-        "books_read_count": books_read_count,
+        "followers_count": snapshot["followers_count"],
+        "following_count": snapshot["following_count"],
+        "books_read_count": snapshot["books_read_count"],
         "is_following": False,
         "is_friend": False,
         "can_view": True
     }
 
 
+@router.get("/me/recommendations", response_model=RecommendationsResponse)
+async def get_recommendations(
+    limit: int = 20,
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Get books recommended from the current user's ratings and read books
+
+    Each result names the book of theirs that contributed most to it.
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+    
+    return {"results": recommend_for_user(db, current_user.id, min(max(limit, 1), 100))}
+
+
+@router.get("/me/mutuals")
+async def get_mutuals(
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Get the users you follow who follow you back"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+    
+    follows_back = aliased(Follow)
+    users = db.query(User).join(
+        Follow, and_(Follow.followed_id == User.id, Follow.follower_id == current_user.id)
+    ).join(
+        follows_back, and_(follows_back.follower_id == User.id, follows_back.followed_id == current_user.id)
+    ).filter(User.deleted_at.is_(None)).order_by(User.username).all()
+    return {
+        "results": [
+            {
+                "id": user.id,
+                "username": user.username,
+                "is_private": bool(user.is_private),
+                "is_following": True,
+                "follows_you": True
+            }
+            for user in users
+        ]
+    }
+
+
+@router.get("/me/suggestions")
+async def get_follow_suggestions(
+    limit: int = 10,
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Suggest people followed by the people you follow, most shared connections first"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+    
+    limit = min(max(limit, 1), 50)
+    graph = get_follow_graph()
+    if graph is not None:
+        graph.sync_user(db, current_user.id)
+        suggestions = graph.suggestions(current_user.id, limit)
+    else:
+        # This instance is still loading the graph
+        suggestions = suggestions_from_db(db, current_user.id, limit)
+    
+    candidate_ids = [user_id for user_id, _ in suggestions]
+    users = {
+        user.id: user for user in db.query(User).filter(
+            User.id.in_(candidate_ids),
+            User.deleted_at.is_(None)
+        )
+    } if suggestions else {}
+    followers = {
+        follower for (follower,) in db.query(Follow.follower_id).filter(
+            Follow.followed_id == current_user.id,
+            Follow.follower_id.in_(candidate_ids)
+        )
+    } if suggestions else set()
+    return {
+        "results": [
+            {
+                "id": user_id,
+                "username": users[user_id].username,
+                "is_private": bool(users[user_id].is_private),
+                "is_following": False,
+                "follows_you": user_id in followers,
+                "mutual_count": count
+            }
+            for user_id, count in suggestions if user_id in users
+        ]
+    }
+
+
+@router.delete("/me")
+async def delete_my_account(
+    response: Response,
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Delete your account and everything in it
+
+    The account is locked out and hidden immediately. Small accounts are
+    removed before responding (200); larger ones are removed in the
+    background (202).
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+    
+    if delete_account(db, current_user):
+        return {"message": "Account deleted"}
+    
+    response.status_code = 202
+    return {"message": "Account deletion scheduled"}
+
+
 @router.put("/me/privacy")
 async def update_privacy_setting(
     privacy_data: PrivacyUpdate,
@@ -136,6 +387,7 @@ async def update_privacy_setting(
     current_user = get_current_user(token, db)
     
     current_user.is_private = 1 if privacy_data.is_private else 0
+    bump_user_generation(current_user)
     db.commit()
     db.refresh(current_user)
     
@@ -145,6 +397,184 @@ async def update_privacy_setting(
     }
 
 
+@router.get("/me/export")
+async def export_library(
+    format: str = "ndjson",
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Download every book the user has read, rated or reviewed as NDJSON or CSV"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+    user_id = current_user.id
+    
+    if format == "ndjson":
+        exporter, media_type = export_ndjson, "application/x-ndjson"
+    elif format == "csv":
+        exporter, media_type = export_csv, "text/csv"
+    else:
+        raise HTTPException(status_code=400, detail="Format must be ndjson or csv")
+    
+    def stream():
+        # The request's session may be closed before the stream finishes
+        export_db = SessionLocal()
+        try:
+            yield from exporter(export_db, user_id)
+        finally:
+            export_db.close()
+    
+    return StreamingResponse(
+        stream(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="blueberrybooks-library.{format}"'}
+    )
+
+
+def _follow_list(db: Session, viewer: User, user_id: int, direction: str, limit: int, before: Optional[int]) -> dict:
+    """
+    One page of a user's followers or following, newest follow first
+
+    The viewer's relationship to every listed user is computed in the same
+    query. ``before`` is the follow id from the previous page's next_cursor.
+    """
+    target = db.query(User).filter(User.id == user_id, User.deleted_at.is_(None)).first()
+    if not target:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    # Same rule as the profile: private lists are visible to followers only
+    if target.is_private and viewer.id != user_id:
+        follows_target = db.query(exists().where(
+            Follow.follower_id == viewer.id,
+            Follow.followed_id == user_id
+        )).scalar()
+        if not follows_target:
+            raise HTTPException(status_code=403, detail="This profile is private")
+    
+    if direction == "followers":
+        owner_column, listed_column = Follow.followed_id, Follow.follower_id
+    else:
+        owner_column, listed_column = Follow.follower_id, Follow.followed_id
+    
+    is_following = exists().where(Follow.follower_id == viewer.id, Follow.followed_id == User.id).correlate(User)
+    follows_you = exists().where(Follow.follower_id == User.id, Follow.followed_id == viewer.id).correlate(User)
+    
+    query = db.query(
+        Follow.id.label("follow_id"),
+        Follow.created_at,
+        User.id,
+        User.username,
+        User.is_private,
+        is_following.label("is_following"),
+        follows_you.label("follows_you")
+    ).join(User, User.id == listed_column).filter(owner_column == user_id, User.deleted_at.is_(None))
+    
+    if before is not None:
+        # Compare against the cursor row's stored timestamp rather than a
+        # re-serialized one, which SQLite would compare as a different string
+        if db.query(exists().where(Follow.id == before)).scalar():
+            cursor_created = select(Follow.created_at).where(Follow.id == before).scalar_subquery()
+            query = query.filter(or_(
+                Follow.created_at < cursor_created,
+                and_(Follow.created_at == cursor_created, Follow.id < before)
+            ))
+        else:
+            # The cursor follow was removed; ids grow with created_at
+            query = query.filter(Follow.id < before)
+    
+    rows = query.order_by(Follow.created_at.desc(), Follow.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    return {
+        "results": [
+            {
+                "id": row.id,
+                "username": row.username,
+                "is_private": bool(row.is_private),
+                "is_following": bool(row.is_following),
+                "follows_you": bool(row.follows_you),
+                "is_friend": bool(row.is_following) and bool(row.follows_you),
+                "followed_at": row.created_at
+            }
+            for row in rows
+        ],
+        "next_cursor": rows[-1].follow_id if has_more else None
+    }
+
+
+@router.get("/{user_id}/followers", response_model=FollowListResponse)
+async def get_followers(
+    user_id: int,
+    limit: int = 20,
+    before: Optional[int] = None,
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Get the users following a user, with your relationship to each"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+    
+    return _follow_list(db, current_user, user_id, "followers", min(max(limit, 1), MAX_FOLLOW_PAGE), before)
+
+
+@router.get("/{user_id}/following", response_model=FollowListResponse)
+async def get_following(
+    user_id: int,
+    limit: int = 20,
+    before: Optional[int] = None,
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Get the users a user follows, with your relationship to each"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+    
+    return _follow_list(db, current_user, user_id, "following", min(max(limit, 1), MAX_FOLLOW_PAGE), before)
+
+
+@router.get("/{user_id}/stats")
+async def get_user_stats(
+    user_id: int,
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Get a user's reading statistics
+
+    Books read per year and month, rating distribution, reading streaks,
+    top authors and diary word counts. Private profiles' stats are visible
+    to their followers only.
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    token = authorization.split(" ")[1]
+    current_user = get_current_user(token, db)
+    
+    target = db.query(User).filter(User.id == user_id, User.deleted_at.is_(None)).first()
+    if not target:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    if target.is_private and current_user.id != user_id:
+        follows_target = db.query(exists().where(
+            Follow.follower_id == current_user.id,
+            Follow.followed_id == user_id
+        )).scalar()
+        if not follows_target:
+            raise HTTPException(status_code=403, detail="This profile is private")
+    
+    return {"user_id": target.id, "username": target.username, **get_reading_stats(db, target)}
+
+
 @router.get("/{user_id}/profile", response_model=UserProfileWithBooksResponse)
 async def get_user_profile(
     user_id: int,
@@ -158,22 +588,26 @@ async def get_user_profile(
     token = authorization.split(" ")[1]
     current_user = get_current_user(token, db)
     
-    # Get the target user
-    target_user = db.query(User).filter(User.id == user_id).first()
-    if not target_user:
+    # Get the target user along with both follow directions relative to the viewer
+    row = db.query(
+        User,
+        exists().where(
+            Follow.follower_id == current_user.id,
+            Follow.followed_id == User.id
+        ).label("is_following"),
+        exists().where(
+            Follow.follower_id == User.id,
+            Follow.followed_id == current_user.id
+        ).label("follows_back")
+    ).filter(User.id == user_id, User.deleted_at.is_(None)).first()
+    if not row:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Check if current user is following target user
-    is_following = db.query(Follow).filter(
-        Follow.follower_id == current_user.id,
-        Follow.followed_id == user_id
-    ).first() is not None
+    target_user = row.User
+    is_following = bool(row.is_following)
     
-    # Check if target user is following current user (friendship)
-    is_friend = is_following and db.query(Follow).filter(
-        Follow.follower_id == user_id,
-        Follow.followed_id == current_user.id
-    ).first() is not None
+    # Mutual follow (friendship)
+    is_friend = is_following and bool(row.follows_back)
     
     # Check if current user can view the profile
     # Can view if: profile is public, or current user is following, or viewing own profile
@@ -183,53 +617,20 @@ async def get_user_profile(
         current_user.id == user_id
     )
     
-    # Get follower and following counts
-    followers_count = db.query(Follow).filter(Follow.followed_id == user_id).count()
-    following_count = db.query(Follow).filter(Follow.follower_id == user_id).count()
-    
-    # Get books read count (always visible if can_view)
-    books_read_count = db.query(ReadBook).filter(ReadBook.user_id == user_id).count() if can_view else 0
-    
-    # Get top 10 rated books with reviews if can_view
-    top_rated_books = []
-    if can_view:
-        # Get top 10 ratings
-        ratings = db.query(Rating).filter(
-            Rating.user_id == user_id
-        ).order_by(desc(Rating.rating), desc(Rating.created_at)).limit(10).all()
-        
-        for rating in ratings:
-            book = db.query(Book).filter(Book.id == rating.book_id).first()
-            if not book:
-                continue
-            
-            # Get diary entry (review) for this book
-            diary_entry = db.query(DiaryEntry).filter(
-                DiaryEntry.user_id == user_id,
-                DiaryEntry.book_id == rating.book_id
-            ).first()
-            
-            top_rated_books.append({
-                "book_id": book.id,
-                "open_library_id": book.open_library_id,
-                "title": book.title,
-                "author": book.author,
-                "cover_image_url": book.cover_image_url,
-                "rating": rating.rating,
-                "review": diary_entry.entry_text if diary_entry else None
-            })
+    snapshot = get_profile_snapshot(db, target_user)
     
     return {
         "id": target_user.id,
         "username": target_user.username,
         "is_private": bool(target_user.is_private),
-        "followers_count": followers_count,
-        "following_count": following_count,
-        "books_read_count": books_read_count,
+        "followers_count": snapshot["followers_count"],
+        "following_count": snapshot["following_count"],
+        # Read count and top rated books are only visible if can_view
+        "books_read_count": snapshot["books_read_count"] if can_view else 0,
         "is_following": is_following,
         "is_friend": is_friend,
         "can_view": can_view,
-        "top_rated_books": top_rated_books
+        "top_rated_books": snapshot["top_rated_books"] if can_view else []
     }
 
 
@@ -251,7 +652,7 @@ async def follow_user(
         raise HTTPException(status_code=400, detail="Cannot follow yourself")
     
     # Check if user exists
-    target_user = db.query(User).filter(User.id == user_id).first()
+    target_user = db.query(User).filter(User.id == user_id, User.deleted_at.is_(None)).first()
     if not target_user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -270,7 +671,18 @@ async def follow_user(
         followed_id=user_id
     )
     db.add(new_follow)
+    # The follow appears in the follower's following list and the followed user's followers list
+    record_change(db, current_user, "follow", new_follow)
+    record_change(db, target_user, "follow", new_follow)
+    defer(db, "feed.backfill", {"follower_id": current_user.id, "followed_id": user_id},
+          dedupe_key=f"feed.backfill:{current_user.id}:{user_id}")
+    follows_back = db.query(exists().where(
+        Follow.follower_id == user_id,
+        Follow.followed_id == current_user.id
+    )).scalar()
+    publish_follow(db, current_user, user_id, following=True, is_friend=bool(follows_back))
     db.commit()
+    note_follow(current_user.id, user_id, following=True)
     
     return {"message": "Successfully followed user"}
 
@@ -297,8 +709,14 @@ async def unfollow_user(
     if not follow:
         raise HTTPException(status_code=404, detail="Not following this user")
     
+    followed_user = follow.followed
     db.delete(follow)
+    record_change(db, current_user, "follow", follow, "delete")
+    record_change(db, followed_user, "follow", follow, "delete")
+    drop_from_timeline(db, current_user.id, user_id)
+    publish_follow(db, current_user, user_id, following=False)
     db.commit()
+    note_follow(current_user.id, user_id, following=False)
     
     return {"message": "Successfully unfollowed user"}
 
@@ -0,0 +1,192 @@
+"""Account deletion
+
+Deleting an account marks the user row deleted first, which locks the
+account out and hides it from search, profiles, feeds and follow lists
+at once.
+Its rows are then removed with set-based DELETE statements, never loaded
+into the session:
+
+- accounts with at most ACCOUNT_DELETE_INLINE_ROWS rows are purged in the
+  request's own transaction
+- larger ones are purged by a background job, ACCOUNT_DELETE_CHUNK rows
+  per table per transaction, so no statement locks an unbounded range
+
+Figures other users see stay right: each removed rating is subtracted from
+its book's rating stats, and every follower and followed user gets a
+follow delete in their change log (which bumps their data_version and so
+invalidates their cached profiles). The user row goes last; on PostgreSQL
+its ON DELETE CASCADE foreign keys remove anything written meanwhile.
+
+The account's own cached responses, profile and stats are dropped as soon
+as it is marked deleted. Ids are never reused, and tokens must also match
+the username, so nothing keyed on the old id can reach a later account.
+"""
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import delete, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from models.models import Activity, ChangeLog, DiaryEntry, Follow, Rating, ReadBook, TimelineEntry, User
+from utils.cache import get_cache
+from utils.follow_graph import note_user_removed
+from utils.jobs import enqueue, job_handler
+from utils.rating_stats import apply_rating_changes
+
+ACCOUNT_DELETE_INLINE_ROWS = int(os.getenv("ACCOUNT_DELETE_INLINE_ROWS", "5000"))
+ACCOUNT_DELETE_CHUNK = 1000
+# A purge job hands over to a fresh job well within its lease
+JOB_TIME_BUDGET = 120
+# Namespaces whose keys start with "{user_id}:"
+USER_CACHE_NAMESPACES = ["responses", "profiles", "reading_stats"]
+
+
+def count_user_rows(db: Session, user_id: int) -> int:
+    """Rows that deleting the account would remove, in one query"""
+    counts = [
+        select(func.count()).select_from(model).where(column == user_id).scalar_subquery()
+        for model, column in [
+            (Follow, Follow.follower_id),
+            (Follow, Follow.followed_id),
+            (Rating, Rating.user_id),
+            (ReadBook, ReadBook.user_id),
+            (DiaryEntry, DiaryEntry.user_id),
+            (Activity, Activity.user_id),
+            (TimelineEntry, TimelineEntry.owner_id),
+            (ChangeLog, ChangeLog.user_id),
+        ]
+    ]
+    return sum(db.execute(select(*counts)).one())
+
+
+def _log_follow_deletes(db: Session, follow_ids, counterpart_column):
+    """Bump each counterpart's data_version and log the follow's removal for them"""
+    counterparts = select(counterpart_column).where(Follow.id.in_(follow_ids))
+    db.execute(update(User).where(User.id.in_(counterparts)).values(data_version=User.data_version + 1))
+    db.execute(insert(ChangeLog).from_select(
+        ["user_id", "version", "entity", "entity_id", "op"],
+        select(
+            counterpart_column, User.data_version, literal("follow"), Follow.id, literal("delete")
+        ).join(User, User.id == counterpart_column).where(Follow.id.in_(follow_ids))
+    ))
+
+
+def _delete_follows(db: Session, user_id: int, limit: Optional[int]) -> int:
+    deleted = 0
+    for own_column, counterpart_column in (
+        (Follow.follower_id, Follow.followed_id),
+        (Follow.followed_id, Follow.follower_id),
+    ):
+        follow_ids = db.execute(select(Follow.id).where(own_column == user_id).limit(limit)).scalars().all()
+        if follow_ids:
+            _log_follow_deletes(db, follow_ids, counterpart_column)
+            deleted += db.execute(delete(Follow).where(Follow.id.in_(follow_ids))).rowcount
+    return deleted
+
+
+def _delete_activities(db: Session, user_id: int, limit: Optional[int]) -> int:
+    activity_ids = db.execute(select(Activity.id).where(Activity.user_id == user_id).limit(limit)).scalars().all()
+    if not activity_ids:
+        return 0
+    # Copies in followers' timelines; SQLite doesn't enforce the cascade
+    db.execute(delete(TimelineEntry).where(TimelineEntry.activity_id.in_(activity_ids)))
+    return db.execute(delete(Activity).where(Activity.id.in_(activity_ids))).rowcount
+
+
+def _delete_timeline(db: Session, user_id: int, limit: Optional[int]) -> int:
+    activity_ids = select(TimelineEntry.activity_id).where(TimelineEntry.owner_id == user_id).limit(limit)
+    return db.execute(delete(TimelineEntry).where(
+        TimelineEntry.owner_id == user_id,
+        TimelineEntry.activity_id.in_(activity_ids)
+    )).rowcount
+
+
+def _delete_ratings(db: Session, user_id: int, limit: Optional[int]) -> int:
+    rating_ids = select(Rating.id).where(Rating.user_id == user_id).limit(limit)
+    # Decrement by what was actually deleted, so a reclaimed job can't subtract twice
+    removed = db.execute(
+        delete(Rating).where(Rating.id.in_(rating_ids)).returning(Rating.book_id, Rating.rating)
+    ).all()
+    apply_rating_changes(db, [(book_id, rating, None) for book_id, rating in removed])
+    return len(removed)
+
+
+def _delete_owned(model, column):
+    def delete_rows(db: Session, user_id: int, limit: Optional[int]) -> int:
+        ids = select(model.id).where(column == user_id).limit(limit)
+        return db.execute(delete(model).where(model.id.in_(ids))).rowcount
+    return delete_rows
+
+
+# Follows go first so the account leaves other users' lists and feeds soonest
+PURGE_STEPS = [
+    _delete_follows,
+    _delete_activities,
+    _delete_timeline,
+    _delete_ratings,
+    _delete_owned(ReadBook, ReadBook.user_id),
+    _delete_owned(DiaryEntry, DiaryEntry.user_id),
+    _delete_owned(ChangeLog, ChangeLog.user_id),
+]
+
+
+def purge_user(db: Session, user_id: int, chunk: Optional[int] = None,
+               deadline: Optional[float] = None) -> bool:
+    """
+    Delete every row of a user, then the user
+
+    With a chunk size each batch is committed separately; otherwise the
+    caller's transaction holds everything. Returns False if the deadline
+    (a time.monotonic() value) passed before the purge finished.
+    """
+    for step in PURGE_STEPS:
+        while True:
+            deleted = step(db, user_id, chunk)
+            if chunk is None or deleted < chunk:
+                break
+            db.commit()
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+    db.execute(delete(User).where(User.id == user_id))
+    if chunk is not None:
+        db.commit()
+    return True
+
+
+@job_handler("users.delete")
+def purge_user_job(db: Session, user_id: int):
+    """Purge a deleted account in chunks, continuing in a new job past the time budget"""
+    finished = purge_user(db, user_id, ACCOUNT_DELETE_CHUNK, time.monotonic() + JOB_TIME_BUDGET)
+    if not finished:
+        enqueue(db, "users.delete", {"user_id": user_id}, priority=150)
+
+
+def delete_account(db: Session, user: User) -> bool:
+    """
+    Delete a user's account, committing db
+
+    Returns:
+        True if everything was removed now, False if the purge was left to
+        a background job (the account is locked out and hidden either way)
+    """
+    user_id = user.id
+    # A statement rather than an attribute change: the row may be gone by commit
+    db.execute(update(User).where(User.id == user_id).values(deleted_at=datetime.now(timezone.utc)))
+    # Their cached profiles count this account's follows until the purge reaches them
+    counterparts = select(Follow.followed_id).where(Follow.follower_id == user_id).union(
+        select(Follow.follower_id).where(Follow.followed_id == user_id)
+    )
+    db.execute(update(User).where(User.id.in_(counterparts)).values(data_version=User.data_version + 1))
+    if count_user_rows(db, user_id) <= ACCOUNT_DELETE_INLINE_ROWS:
+        purge_user(db, user_id)
+        finished = True
+    else:
+        enqueue(db, "users.delete", {"user_id": user_id}, dedupe_key=f"users.delete:{user_id}", priority=150)
+        finished = False
+    db.commit()
+    note_user_removed(user_id)
+    for namespace in USER_CACHE_NAMESPACES:
+        get_cache(namespace).clear(f"{user_id}:")
+    return finished
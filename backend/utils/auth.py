@@ -1,30 +1,52 @@
-"""Authentication utilities"""
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+"""Authentication utilities
+
+passlib/bcrypt and python-jose (with its cryptography backend) are imported
+on first use rather than with this module, keeping them off the cold-start
+path of requests that never hash a password or decode a token.
+"""
 from datetime import datetime, timedelta
+from functools import lru_cache
+import hashlib
 import os
+import time
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from utils.cache import get_cache
+from utils.metrics import PASSWORD_HASH_SECONDS
 
 # JWT settings
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30 days
+TOKEN_CACHE_TTL = 5 * 60
+
+# Decoded tokens are kept in process memory: a network round trip to a shared
+# backend would cost more than verifying the signature again.
+_token_cache = get_cache("auth_tokens", backend="memory")
+
+
+@lru_cache(maxsize=None)
+def _pwd_context():
+    """Password hashing context"""
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    with PASSWORD_HASH_SECONDS.time("verify"):
+        return _pwd_context().verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    with PASSWORD_HASH_SECONDS.time("hash"):
+        return _pwd_context().hash(password)
 
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """Create a JWT access token"""
+    from jose import jwt
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -37,9 +59,21 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 
 def decode_access_token(token: str):
     """Decode and verify a JWT token"""
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+    payload = _token_cache.get(cache_key)
+    if payload is not None and payload.get("exp", 0) > time.time():
+        return payload
+    
+    from jose import JWTError, jwt
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError:
         return None
+    
+    # Never cache a token past its own expiry
+    ttl = min(TOKEN_CACHE_TTL, payload.get("exp", 0) - time.time())
+    if ttl > 0:
+        _token_cache.set(cache_key, payload, ttl=ttl)
+    return payload
 
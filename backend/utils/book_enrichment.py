@@ -0,0 +1,42 @@
+"""Background enrichment of books created from search results
+
+Books added by an import are created from Open Library search documents,
+which carry no description and sometimes no ISBN or cover. A job fetches
+each work record afterwards and fills in whatever is still missing, so the
+import itself makes one search request per book instead of two.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from sqlalchemy.orm import Session
+
+from models.models import Book
+from utils.jobs import job_handler
+from utils.open_library import get_book_details
+
+LOOKUP_WORKERS = 8
+ENRICHED_FIELDS = ["description", "isbn", "cover_image_url", "published_year"]
+
+
+@job_handler("books.enrich")
+def enrich_books(db: Session, book_ids: List[int]):
+    """Fill missing details of books from their Open Library work records"""
+    books = db.query(Book).filter(Book.id.in_(book_ids), Book.description.is_(None)).all()
+    if not books:
+        return
+
+    with ThreadPoolExecutor(max_workers=LOOKUP_WORKERS) as pool:
+        details = list(pool.map(get_book_details, [book.open_library_id for book in books]))
+
+    for book, book_data in zip(books, details):
+        if not book_data:
+            continue
+        for field in ENRICHED_FIELDS:
+            value = book_data.get(field)
+            if field == "published_year":
+                value = int(value) if value and str(value).isdigit() else None
+            if value and getattr(book, field) is None:
+                setattr(book, field, value)
+        # Mark the book as done even when Open Library has no description
+        if book.description is None:
+            book.description = ""
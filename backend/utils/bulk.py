@@ -0,0 +1,50 @@
+"""Bulk upsert helpers"""
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+
+def _dialect_insert(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def upsert_rows(
+    db: Session,
+    model,
+    rows: List[Dict],
+    conflict_columns: List[str],
+    update_columns: List[str],
+    returning: Optional[List] = None
+) -> List:
+    """
+    INSERT ... ON CONFLICT in a single statement
+
+    Rows colliding on conflict_columns get update_columns overwritten (and
+    updated_at touched, if the model has one); with no update_columns they
+    are left alone.
+
+    Returns:
+        Ids of the rows that were inserted or updated, or rows of the
+        ``returning`` columns when given
+    """
+    if not rows:
+        return []
+    insert = _dialect_insert(db)
+    stmt = insert(model)
+    if update_columns:
+        values = {column: stmt.excluded[column] for column in update_columns}
+        if hasattr(model, "updated_at"):
+            values["updated_at"] = func.now()
+        stmt = stmt.on_conflict_do_update(index_elements=conflict_columns, set_=values)
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=conflict_columns)
+    # Passing rows as parameters lets SQLAlchemy batch them into multi-row
+    # VALUES while reusing one compiled statement
+    if returning:
+        return db.execute(stmt.returning(*returning), rows).all()
+    return list(db.execute(stmt.returning(model.id), rows).scalars())
@@ -0,0 +1,565 @@
+"""Pluggable cache subsystem
+
+One namespaced cache API backed by one of:
+
+- ``memory``: in-process LRU bounded by entry count and bytes
+- ``sqlite``: a local SQLite file that survives process restarts
+- ``redis``: any server speaking the Redis protocol (RESP), shared by all
+  instances
+
+The backend is picked with ``CACHE_BACKEND`` and ``CACHE_URL``. Values are
+pickled, so the byte size of every entry is known regardless of backend.
+Backend failures are counted and treated as misses; a broken cache never
+fails a request.
+"""
+import os
+import pickle
+from abc import ABC, abstractmethod
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_URL = os.getenv("CACHE_URL", "")
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+# On Vercel only /tmp is writable
+DEFAULT_SQLITE_PATH = (
+    "/tmp/blueberrybooks-cache.db" if os.getenv("VERCEL") else "./blueberrybooks-cache.db"
+)
+
+
+class CacheBackend(ABC):
+    """Byte-oriented key/value store with optional per-entry TTL"""
+
+    @abstractmethod
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        ...
+
+    @abstractmethod
+    def set_many(self, items: Dict[str, bytes], ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, keys: List[str]) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self, prefix: str = "") -> None:
+        ...
+
+    @abstractmethod
+    def keys(self, prefix: str = "") -> List[str]:
+        ...
+
+    def size_bytes(self) -> Optional[int]:
+        """Total bytes stored, or None when the backend cannot tell cheaply"""
+        return None
+
+
+class MemoryBackend(CacheBackend):
+    """In-process LRU"""
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                value, expires_at = entry
+                if expires_at is not None and expires_at <= now:
+                    self._remove(key)
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, items: Dict[str, bytes], ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            for key, value in items.items():
+                self._remove(key)
+                self._entries[key] = (value, expires_at)
+                self._bytes += len(key) + len(value)
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, keys: List[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def clear(self, prefix: str = "") -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._remove(key)
+
+    def keys(self, prefix: str = "") -> List[str]:
+        now = time.time()
+        with self._lock:
+            return [
+                key for key, (_, expires_at) in self._entries.items()
+                if key.startswith(prefix) and (expires_at is None or expires_at > now)
+            ]
+
+    def size_bytes(self) -> Optional[int]:
+        return self._bytes
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(key) + len(entry[0])
+
+
+class SQLiteBackend(CacheBackend):
+    """Persistent cache in a local SQLite file, evicted least-recently-used by bytes"""
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed_at ON cache_entries (accessed_at)"
+        )
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        if not keys:
+            return {}
+        now = time.time()
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, value, expires_at FROM cache_entries WHERE key IN ({placeholders})",
+                keys,
+            ).fetchall()
+            found = {}
+            expired = []
+            for key, value, expires_at in rows:
+                if expires_at is not None and expires_at <= now:
+                    expired.append((key,))
+                else:
+                    found[key] = value
+            if expired:
+                self._conn.executemany("DELETE FROM cache_entries WHERE key = ?", expired)
+            if found:
+                self._conn.executemany(
+                    "UPDATE cache_entries SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+        return found
+
+    def set_many(self, items: Dict[str, bytes], ttl: Optional[float] = None) -> None:
+        if not items:
+            return
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        rows = [
+            (key, sqlite3.Binary(value), len(key) + len(value), expires_at, now)
+            for key, value in items.items()
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cache_entries (key, value, size, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._evict(now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM cache_entries ORDER BY accessed_at"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM cache_entries WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def delete(self, keys: List[str]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM cache_entries WHERE key = ?", [(k,) for k in keys])
+
+    def clear(self, prefix: str = "") -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+            )
+
+    def keys(self, prefix: str = "") -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key FROM cache_entries WHERE substr(key, 1, ?) = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (len(prefix), prefix, time.time()),
+            ).fetchall()
+        return [key for key, in rows]
+
+    def size_bytes(self) -> Optional[int]:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+
+
+class RedisError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+
+class RedisBackend(CacheBackend):
+    """
+    Minimal RESP client, enough for a cache
+
+    Speaks the plain Redis protocol over one pooled socket, so it works with
+    Redis, Valkey, KeyDB, Upstash and any local stand-in server.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", timeout: float = 2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.username = parsed.username
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.use_ssl = parsed.scheme == "rediss"
+        self.timeout = timeout
+        self._sock = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> None:
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        if self.use_ssl:
+            import ssl
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+        self._sock = sock
+        self._reader = sock.makefile("rb")
+        if self.password:
+            auth = [b"AUTH", self.username.encode(), self.password.encode()] if self.username \
+                else [b"AUTH", self.password.encode()]
+            self._send([auth])
+            self._read_reply()
+        if self.db:
+            self._send([[b"SELECT", str(self.db).encode()]])
+            self._read_reply()
+
+    def _close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+    @staticmethod
+    def _encode(args: List[bytes]) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(out)
+
+    def _send(self, commands: List[List[bytes]]) -> None:
+        self._sock.sendall(b"".join(self._encode(cmd) for cmd in commands))
+
+    def _read_reply(self) -> Any:
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by cache server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            raise RedisError(payload.decode(errors="replace"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RedisError(f"Unexpected reply type {kind!r}")
+
+    def _read_replies(self, count: int) -> List[Any]:
+        """Read count replies, keeping error replies in place so none are left unread"""
+        replies = []
+        for _ in range(count):
+            try:
+                replies.append(self._read_reply())
+            except RedisError as error:
+                replies.append(error)
+        return replies
+
+    def pipeline(self, commands: List[List[bytes]]) -> List[Any]:
+        """
+        Send several commands in one round trip and return their replies
+
+        Raises the first error reply once every reply has been read. Any
+        other failure closes the socket, since replies may be left on it.
+        """
+        with self._lock:
+            for attempt in (0, 1):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    self._send(commands)
+                    replies = self._read_replies(len(commands))
+                except OSError:
+                    self._close()
+                    if attempt:
+                        raise
+                    continue
+                except Exception:
+                    self._close()
+                    raise
+                for reply in replies:
+                    if isinstance(reply, RedisError):
+                        raise reply
+                return replies
+        return []
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        if not keys:
+            return {}
+        values = self.pipeline([[b"MGET"] + [k.encode() for k in keys]])[0]
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, items: Dict[str, bytes], ttl: Optional[float] = None) -> None:
+        if not items:
+            return
+        commands = []
+        for key, value in items.items():
+            cmd = [b"SET", key.encode(), value]
+            if ttl:
+                cmd += [b"PX", str(int(ttl * 1000)).encode()]
+            commands.append(cmd)
+        self.pipeline(commands)
+
+    def delete(self, keys: List[str]) -> None:
+        if keys:
+            self.pipeline([[b"DEL"] + [k.encode() for k in keys]])
+
+    def _scan(self, prefix: str) -> Iterable[List[bytes]]:
+        """Batches of the keys starting with prefix"""
+        cursor = b"0"
+        pattern = prefix.replace("*", "\\*").replace("?", "\\?").encode() + b"*"
+        while True:
+            cursor, keys = self.pipeline([[b"SCAN", cursor, b"MATCH", pattern, b"COUNT", b"500"]])[0]
+            if keys:
+                yield keys
+            if cursor == b"0":
+                break
+
+    def clear(self, prefix: str = "") -> None:
+        for keys in self._scan(prefix):
+            self.pipeline([[b"DEL"] + keys])
+
+    def keys(self, prefix: str = "") -> List[str]:
+        # SCAN may return a key more than once
+        return list({key.decode() for keys in self._scan(prefix) for key in keys})
+
+
+class Cache:
+    """Namespaced view over a backend with hit-rate and byte statistics"""
+
+    def __init__(self, namespace: str, backend: CacheBackend, default_ttl: Optional[float] = None):
+        self.namespace = namespace
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self._prefix = f"{namespace}:"
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.errors = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def _key(self, key: str) -> str:
+        return self._prefix + key
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        try:
+            raw = self.backend.get_many([self._key(k) for k in keys])
+        except Exception as e:
+            print(f"Cache error reading {self.namespace}: {e}")
+            self.errors += 1
+            raw = {}
+        found = {}
+        for key in keys:
+            value = raw.get(self._key(key))
+            if value is None:
+                continue
+            try:
+                found[key] = pickle.loads(value)
+            except Exception:
+                continue
+            self.bytes_read += len(value)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        encoded = {
+            self._key(k): pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL)
+            for k, v in items.items()
+        }
+        try:
+            self.backend.set_many(encoded, ttl if ttl is not None else self.default_ttl)
+        except Exception as e:
+            print(f"Cache error writing {self.namespace}: {e}")
+            self.errors += 1
+            return
+        self.sets += len(encoded)
+        self.bytes_written += sum(len(v) for v in encoded.values())
+
+    def delete(self, *keys: str) -> None:
+        try:
+            self.backend.delete([self._key(k) for k in keys])
+        except Exception as e:
+            print(f"Cache error deleting from {self.namespace}: {e}")
+            self.errors += 1
+
+    def clear(self, prefix: str = "") -> None:
+        """Drop every entry in this namespace, or only those whose key starts with prefix"""
+        try:
+            self.backend.clear(self._prefix + prefix)
+        except Exception as e:
+            print(f"Cache error clearing {self.namespace}: {e}")
+            self.errors += 1
+
+    def keys(self, prefix: str = "") -> List[str]:
+        """Keys in this namespace starting with prefix (empty when the backend fails)"""
+        try:
+            keys = self.backend.keys(self._prefix + prefix)
+        except Exception as e:
+            print(f"Cache error listing {self.namespace}: {e}")
+            self.errors += 1
+            return []
+        return [key[len(self._prefix):] for key in keys]
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "sets": self.sets,
+            "errors": self.errors,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+        }
+
+
+_backends: Dict[str, CacheBackend] = {}
+_caches: Dict[str, Cache] = {}
+_registry_lock = threading.Lock()
+
+
+def create_backend(kind: str, url: str = "") -> CacheBackend:
+    """Build a backend by name"""
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "sqlite":
+        return SQLiteBackend(url or DEFAULT_SQLITE_PATH)
+    if kind == "redis":
+        return RedisBackend(url or "redis://localhost:6379/0")
+    raise ValueError(f"Unknown cache backend: {kind}")
+
+
+def _get_backend(kind: str) -> CacheBackend:
+    if kind not in _backends:
+        url = CACHE_URL if kind == CACHE_BACKEND else ""
+        _backends[kind] = create_backend(kind, url)
+    return _backends[kind]
+
+
+def get_cache(namespace: str, default_ttl: Optional[float] = None, backend: Optional[str] = None) -> Cache:
+    """
+    Get the cache for a namespace
+
+    Args:
+        namespace: Key prefix, also the unit of statistics
+        default_ttl: Seconds before entries expire, None to keep until evicted
+        backend: Force a backend kind instead of the configured CACHE_BACKEND
+    """
+    with _registry_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            cache = Cache(namespace, _get_backend(backend or CACHE_BACKEND), default_ttl)
+            _caches[namespace] = cache
+        return cache
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Statistics for every namespace created so far"""
+    with _registry_lock:
+        caches = list(_caches.values())
+    stats = {cache.namespace: cache.stats() for cache in caches}
+    for kind, backend in list(_backends.items()):
+        try:
+            size = backend.size_bytes()
+        except Exception:
+            size = None
+        stats[f"backend:{kind}"] = {
+            "size_bytes": size,
+            "evictions": getattr(backend, "evictions", None),
+        }
+    return stats
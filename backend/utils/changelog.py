@@ -0,0 +1,48 @@
+"""Per-user change log for incremental sync"""
+from typing import List
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from models.models import ChangeLog, User
+from utils.response_cache import bump_user_generation
+
+
+def record_change(db: Session, user: User, entity: str, obj, op: str = "upsert") -> None:
+    """
+    Log a write to one of the user's synced rows
+
+    Bumps the user's data_version (which also invalidates their cached
+    responses) and tags the log row with the new value, all inside the
+    caller's transaction. The bump locks the user row until commit, so log
+    rows become visible in version order and a client that has seen
+    version N has seen every change up to N.
+
+    Args:
+        db: Session holding the uncommitted write
+        user: Owner of the change; follows are logged for both users
+        entity: diary_entry, rating, read_book or follow
+        obj: The written row; new rows are flushed to obtain their id
+        op: "upsert" or "delete"
+    """
+    bump_user_generation(user)
+    # Flushing applies the bump (and assigns new ids) before the log row reads it back
+    db.flush()
+    _insert_log_rows(db, user, entity, [obj.id], op)
+
+
+def record_changes(db: Session, user: User, entity: str, entity_ids: List[int], op: str = "upsert") -> None:
+    """Log a bulk write of many rows of one entity under a single version bump"""
+    if not entity_ids:
+        return
+    bump_user_generation(user)
+    db.flush()
+    _insert_log_rows(db, user, entity, entity_ids, op)
+
+
+def _insert_log_rows(db: Session, user: User, entity: str, entity_ids: List[int], op: str) -> None:
+    version = db.execute(select(User.data_version).where(User.id == user.id)).scalar_one()
+    db.execute(insert(ChangeLog), [
+        {"user_id": user.id, "version": version, "entity": entity, "entity_id": entity_id, "op": op}
+        for entity_id in entity_ids
+    ])
@@ -0,0 +1,168 @@
+"""Cold-start benchmark for the API entry point
+
+Runs fresh interpreters the way a serverless instance starts and reports:
+
+- the ``python -X importtime`` cost of ``api.index``, broken down by the
+  package that spends it (self time, so nothing is counted twice)
+- time to first response: interpreter start, app import and one request
+  through the ASGI app, with routers loaded lazily as on Vercel
+
+Each figure is the median of --runs processes. The exit status is 1 when
+a median exceeds its budget, so CI can fail on import-time regressions.
+
+Usage:
+    python -m utils.cold_start
+    python -m utils.cold_start --path /api/books/popular --runs 5
+    python -m utils.cold_start --import-budget-ms 900 --response-budget-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_MODULE = "api.index"
+# Generous for a laptop or CI runner; tighten once a baseline is known
+IMPORT_BUDGET_MS = float(os.getenv("COLD_START_IMPORT_BUDGET_MS", "1500"))
+RESPONSE_BUDGET_MS = float(os.getenv("COLD_START_RESPONSE_BUDGET_MS", "3000"))
+# A route that loads the largest router but needs no token or database
+DEFAULT_PATH = "/api/users/me/profile"
+
+# Run in the child: import the app, then send one GET through it
+_FIRST_RESPONSE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+from api.index import app
+imported = time.perf_counter()
+
+async def get(target):
+    path, _, query = target.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": query.encode(), "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+    }
+    statuses = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    await app(scope, receive, send)
+    return statuses[0]
+
+status = asyncio.run(get(sys.argv[1]))
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "request_ms": (time.perf_counter() - imported) * 1000,
+    "status": status,
+}))
+"""
+
+
+def _child_env(lazy: bool) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["LAZY_ROUTERS"] = "1" if lazy else "0"
+    env["JOB_WORKERS"] = "0"
+    env["PYTHONPATH"] = BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def parse_importtime(output: str) -> List[Tuple[str, int, int]]:
+    """(module, self us, cumulative us) from -X importtime output"""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def import_profile(lazy: bool) -> Tuple[float, Dict[str, float]]:
+    """Import time of the entry module and self time per top-level package, in ms"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {ENTRY_MODULE}"],
+        cwd=BACKEND_DIR, env=_child_env(lazy), capture_output=True, text=True, check=True
+    )
+    rows = parse_importtime(result.stderr)
+    total = next(cumulative for name, _, cumulative in rows if name == ENTRY_MODULE)
+    by_package: Dict[str, float] = defaultdict(float)
+    for name, self_us, _ in rows:
+        by_package[name.split(".")[0]] += self_us / 1000
+    return total / 1000, dict(by_package)
+
+
+def first_response(path: str, lazy: bool) -> Dict:
+    """Wall time from process start to the first response, with its parts"""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", _FIRST_RESPONSE, path],
+        cwd=BACKEND_DIR, env=_child_env(lazy), capture_output=True, text=True, check=True
+    )
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    # Everything the process did, including interpreter start-up and exit
+    timings["total_ms"] = (time.perf_counter() - started) * 1000
+    return timings
+
+
+def run_benchmark(path: str = DEFAULT_PATH, runs: int = 3, lazy: bool = True) -> Dict:
+    """Median figures over runs fresh processes, after one warm-up"""
+    first_response(path, lazy)
+    imports = [import_profile(lazy) for _ in range(runs)]
+    responses = [first_response(path, lazy) for _ in range(runs)]
+
+    packages = defaultdict(list)
+    for _, by_package in imports:
+        for package, ms in by_package.items():
+            packages[package].append(ms)
+    return {
+        "import_ms": statistics.median(total for total, _ in imports),
+        "packages": {package: statistics.median(times) for package, times in packages.items()},
+        "response": {
+            key: statistics.median(response[key] for response in responses)
+            for key in ("import_ms", "request_ms", "total_ms")
+        },
+        "status": responses[-1]["status"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure API cold-start time")
+    parser.add_argument("--path", default=DEFAULT_PATH, help="request to time after the import")
+    parser.add_argument("--runs", type=int, default=3, help="fresh processes per measurement")
+    parser.add_argument("--top", type=int, default=15, help="packages to list in the breakdown")
+    parser.add_argument("--eager", action="store_true", help="load every router at import (LAZY_ROUTERS=0)")
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--response-budget-ms", type=float, default=RESPONSE_BUDGET_MS)
+    args = parser.parse_args()
+
+    result = run_benchmark(args.path, args.runs, lazy=not args.eager)
+    print(f"Import of {ENTRY_MODULE}: {result['import_ms']:.0f} ms (budget {args.import_budget_ms:.0f} ms)")
+    print("Self time by package:")
+    top = sorted(result["packages"].items(), key=lambda item: -item[1])[:args.top]
+    for package, ms in top:
+        print(f"  {package:<28}{ms:8.1f} ms")
+    response = result["response"]
+    print(f"First response to GET {args.path} ({result['status']}): {response['total_ms']:.0f} ms "
+          f"(import {response['import_ms']:.0f} ms, request {response['request_ms']:.0f} ms; "
+          f"budget {args.response_budget_ms:.0f} ms)")
+
+    failures = []
+    if result["import_ms"] > args.import_budget_ms:
+        failures.append("import")
+    if response["total_ms"] > args.response_budget_ms:
+        failures.append("first response")
+    if failures:
+        print(f"FAILED: {' and '.join(failures)} over budget")
+        sys.exit(1)
+    print("Within budget")
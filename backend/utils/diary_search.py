@@ -0,0 +1,101 @@
+"""Full-text search over diary entries
+
+Uses the index created by ``models.migrate_diary_search``: FTS5 on SQLite,
+a GIN-indexed tsvector column on PostgreSQL.
+"""
+import html
+import re
+from typing import Dict, List
+
+from sqlalchemy import DateTime, text
+from sqlalchemy.orm import Session
+
+# Control characters never appear in diary text, so they mark match
+# boundaries safely until the snippet has been HTML-escaped
+_MATCH_START = "\x02"
+_MATCH_END = "\x03"
+
+_SQLITE_SEARCH = text(f"""
+    SELECT d.id, d.book_id, d.created_at, d.updated_at,
+           snippet(diary_entries_fts, 0, '{_MATCH_START}', '{_MATCH_END}', '…', 16) AS snippet,
+           -bm25(diary_entries_fts) AS score,
+           b.open_library_id, b.title, b.author, b.cover_image_url
+    FROM diary_entries_fts
+    JOIN diary_entries d ON d.id = diary_entries_fts.rowid
+    LEFT JOIN books b ON b.id = d.book_id
+    WHERE diary_entries_fts MATCH :query AND d.user_id = :user_id
+    ORDER BY bm25(diary_entries_fts)
+    LIMIT :limit
+""").columns(created_at=DateTime(timezone=True), updated_at=DateTime(timezone=True))
+
+_POSTGRESQL_SEARCH = text(f"""
+    SELECT d.id, d.book_id, d.created_at, d.updated_at,
+           ts_headline('english', d.entry_text, q.query,
+                       'StartSel={_MATCH_START}, StopSel={_MATCH_END}, MaxFragments=2, MaxWords=24, MinWords=8') AS snippet,
+           ts_rank(d.entry_tsv, q.query) AS score,
+           b.open_library_id, b.title, b.author, b.cover_image_url
+    FROM diary_entries d
+    CROSS JOIN websearch_to_tsquery('english', :query) AS q(query)
+    LEFT JOIN books b ON b.id = d.book_id
+    WHERE d.user_id = :user_id AND d.entry_tsv @@ q.query
+    ORDER BY score DESC
+    LIMIT :limit
+""").columns(created_at=DateTime(timezone=True), updated_at=DateTime(timezone=True))
+
+
+def _fts5_query(query: str) -> str:
+    """
+    Turn free text into a safe FTS5 expression
+
+    Every word is quoted so punctuation can't form FTS5 syntax; the last
+    word is a prefix match so results appear while the user is typing.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _highlight(snippet: str) -> str:
+    escaped = html.escape(snippet or "")
+    return escaped.replace(_MATCH_START, "<mark>").replace(_MATCH_END, "</mark>")
+
+
+def search_diary_entries(db: Session, user_id: int, query: str, limit: int = 20) -> List[Dict]:
+    """
+    Search one user's diary entries
+
+    Returns:
+        Entries ordered by relevance, each with an HTML-escaped snippet in
+        which matched terms are wrapped in <mark> tags
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        query = _fts5_query(query)
+        if not query:
+            return []
+        statement = _SQLITE_SEARCH
+    else:
+        statement = _POSTGRESQL_SEARCH
+
+    rows = db.execute(statement, {"query": query, "user_id": user_id, "limit": limit}).mappings().all()
+
+    return [
+        {
+            "id": row["id"],
+            "book_id": row["book_id"],
+            "snippet": _highlight(row["snippet"]),
+            "score": float(row["score"] or 0),
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+            "book": {
+                "id": row["book_id"],
+                "open_library_id": row["open_library_id"],
+                "title": row["title"],
+                "author": row["author"],
+                "cover_image_url": row["cover_image_url"]
+            } if row["title"] is not None else None
+        }
+        for row in rows
+    ]
@@ -0,0 +1,280 @@
+"""Real-time social events
+
+New followers and the ratings, reviews and read marks of followed users are
+published as events once the transaction that wrote them commits, and
+streamed to connected users over Server-Sent Events (routes/events.py).
+
+Each worker process holds its own connections. Events are published
+through a backend picked with ``EVENTS_BACKEND``:
+
+- ``memory``: delivered within this process only
+- ``redis``: published on a Redis channel every worker subscribes to, so
+  events reach connections on all workers (``EVENTS_URL``, defaulting to
+  ``CACHE_URL``)
+
+Every worker picks its own recipients. An event names explicit recipients
+or the followers of its actor; the latter are matched against the followed
+ids each connection loaded when it opened, kept current by follow events.
+
+Each connection's queue holds at most EVENTS_QUEUE_SIZE events. A client
+that falls further behind has its backlog dropped and receives a single
+``resync`` event, telling it to refetch instead of replaying.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models.models import User
+from utils.cache import CACHE_URL, RedisBackend
+
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "memory")
+EVENTS_URL = os.getenv("EVENTS_URL", "") or CACHE_URL or "redis://localhost:6379/0"
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+# Open streams per user on one worker; more than a few means leaked tabs
+EVENTS_MAX_CONNECTIONS = int(os.getenv("EVENTS_MAX_CONNECTIONS", "5"))
+EVENTS_HEARTBEAT = int(os.getenv("EVENTS_HEARTBEAT", "15"))
+EVENTS_CHANNEL = b"blueberrybooks:events"
+
+# Items listed in one activity event; bulk writes report the rest as a count
+MAX_EVENT_ITEMS = 10
+PENDING_KEY = "pending_events"
+
+
+class Subscription:
+    """One open stream: a bounded queue fed from any thread"""
+
+    def __init__(self, user_id: int, following: Set[int], loop: asyncio.AbstractEventLoop):
+        self.user_id = user_id
+        self.following = following
+        self.loop = loop
+        self.queue: "asyncio.Queue[dict]" = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        self.dropped = 0
+
+    def _put(self, payload: dict):
+        # Runs on the connection's event loop
+        if self.queue.full():
+            # Drop the backlog rather than let a stalled client grow it
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync"})
+            return
+        self.queue.put_nowait(payload)
+
+    def deliver(self, payload: dict):
+        try:
+            self.loop.call_soon_threadsafe(self._put, payload)
+        except RuntimeError:
+            # Loop already closed; the stream is going away
+            pass
+
+
+class Broker:
+    """This worker's open streams, indexed by user and by followed user"""
+
+    def __init__(self):
+        self._by_user: Dict[int, Set[Subscription]] = {}
+        self._watchers: Dict[int, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int, following: Set[int]) -> Optional[Subscription]:
+        """Register a stream, or None when the user already has too many open"""
+        subscription = Subscription(user_id, set(following), asyncio.get_running_loop())
+        with self._lock:
+            streams = self._by_user.setdefault(user_id, set())
+            if len(streams) >= EVENTS_MAX_CONNECTIONS:
+                return None
+            streams.add(subscription)
+            for followed in subscription.following:
+                self._watchers.setdefault(followed, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._discard(self._by_user, subscription.user_id, subscription)
+            for followed in subscription.following:
+                self._discard(self._watchers, followed, subscription)
+
+    @staticmethod
+    def _discard(index: Dict[int, Set[Subscription]], key: int, subscription: Subscription):
+        members = index.get(key)
+        if members is not None:
+            members.discard(subscription)
+            if not members:
+                del index[key]
+
+    def dispatch(self, message: dict):
+        """Deliver a published message to the matching streams on this worker"""
+        with self._lock:
+            follow = message.get("follow")
+            if follow is not None:
+                follower, followed, following = follow
+                for subscription in self._by_user.get(follower, ()):
+                    if following:
+                        subscription.following.add(followed)
+                        self._watchers.setdefault(followed, set()).add(subscription)
+                    else:
+                        subscription.following.discard(followed)
+                        self._discard(self._watchers, followed, subscription)
+
+            targets: Set[Subscription] = set()
+            for user_id in message.get("recipients", ()):
+                targets.update(self._by_user.get(user_id, ()))
+            if message.get("followers_of") is not None:
+                targets.update(self._watchers.get(message["followers_of"], ()))
+
+        if message.get("event") is not None:
+            for subscription in targets:
+                subscription.deliver(message["event"])
+
+    def connection_count(self) -> int:
+        with self._lock:
+            return sum(len(streams) for streams in self._by_user.values())
+
+
+class MemoryEventBackend:
+    """Delivers straight to this process's broker"""
+
+    def __init__(self, broker: Broker):
+        self.broker = broker
+
+    def start(self):
+        pass
+
+    def publish(self, message: dict):
+        self.broker.dispatch(message)
+
+
+class RedisEventBackend:
+    """PUBLISH on a shared channel; a listener thread per worker feeds its broker"""
+
+    def __init__(self, broker: Broker, url: str):
+        self.broker = broker
+        self.url = url
+        self._publisher = RedisBackend(url)
+        self._listener: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start listening; deferred until this worker has a stream open"""
+        with self._start_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, daemon=True)
+                self._listener.start()
+
+    def publish(self, message: dict):
+        self._publisher.pipeline([[b"PUBLISH", EVENTS_CHANNEL, json.dumps(message).encode()]])
+
+    def _listen(self):
+        while True:
+            # No read timeout: the subscription is idle between events
+            connection = RedisBackend(self.url, timeout=None)
+            try:
+                connection._connect()
+                connection._send([[b"SUBSCRIBE", EVENTS_CHANNEL]])
+                connection._read_reply()
+                while True:
+                    reply = connection._read_reply()
+                    if reply and reply[0] == b"message":
+                        self.broker.dispatch(json.loads(reply[2]))
+            except Exception as e:
+                print(f"Event listener error: {e}")
+                connection._close()
+                time.sleep(1)
+
+
+def create_event_backend(kind: str, broker: Broker):
+    """Build an event backend by name"""
+    if kind == "memory":
+        return MemoryEventBackend(broker)
+    if kind == "redis":
+        return RedisEventBackend(broker, EVENTS_URL)
+    raise ValueError(f"Unknown events backend: {kind}")
+
+
+broker = Broker()
+_backend = create_event_backend(EVENTS_BACKEND, broker)
+
+
+def subscribe(user_id: int, following: Set[int]) -> Optional[Subscription]:
+    """Open a stream for user_id; must be called on the event loop serving it"""
+    _backend.start()
+    return broker.subscribe(user_id, following)
+
+
+def unsubscribe(subscription: Subscription):
+    broker.unsubscribe(subscription)
+
+
+def publish(message: dict):
+    """Publish now; failures are logged, never raised into the request"""
+    try:
+        _backend.publish(message)
+    except Exception as e:
+        print(f"Event publish error: {e}")
+
+
+def publish_after_commit(db: Session, message: dict):
+    """Publish once db's current transaction commits; dropped on rollback"""
+    db.info.setdefault(PENDING_KEY, []).append(message)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session: Session):
+    for message in session.info.pop(PENDING_KEY, []):
+        publish(message)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session: Session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def publish_follow(db: Session, follower: User, followed_id: int, following: bool, is_friend: bool = False):
+    """
+    Tell the followed user about a new follower, after commit
+
+    Unfollows notify nobody but keep the follower's open streams matching
+    the right activity.
+    """
+    publish_after_commit(db, {
+        "follow": [follower.id, followed_id, following],
+        "recipients": [followed_id] if following else [],
+        "event": {
+            "type": "follow",
+            "user": {"id": follower.id, "username": follower.username},
+            "is_friend": is_friend,
+            "created_at": _now()
+        } if following else None
+    })
+
+
+def publish_activity(db: Session, user: User, verb: str, items: List[Dict]):
+    """Tell the user's followers about new activity, after commit"""
+    if not items:
+        return
+    publish_after_commit(db, {
+        "followers_of": user.id,
+        "event": {
+            "type": "activity",
+            "verb": verb,
+            "user": {"id": user.id, "username": user.username},
+            "items": [
+                {"book_id": item["book_id"], "rating": item.get("rating")}
+                for item in items[:MAX_EVENT_ITEMS]
+            ],
+            "count": len(items),
+            "created_at": _now()
+        }
+    })
@@ -0,0 +1,175 @@
+"""Activity feed of followed users
+
+Ratings, reviews and read marks are recorded as activities. For most users
+each activity is copied into every follower's timeline as it is written
+(fan-out on write), so reading a feed is one index range scan. Users with
+more than FEED_FANOUT_LIMIT followers skip the copy; their activities are
+pulled from the activities table when a follower reads their feed (fan-out
+on read) and merged in. Followers with an open event stream are also
+notified as soon as the write commits (utils/events.py).
+
+Visibility is decided at read time: only activities of users the reader
+currently follows are returned, which is also what makes a private
+profile's activity visible (private profiles are visible to followers).
+Imported reading history is not recorded, so an import doesn't flood
+followers' feeds.
+"""
+import os
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, exists, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from models.models import Activity, Book, Follow, TimelineEntry, User
+from utils.events import publish_activity
+from utils.jobs import job_handler
+
+FEED_FANOUT_LIMIT = int(os.getenv("FEED_FANOUT_LIMIT", "1000"))
+# Recent activities copied into a timeline when its owner follows someone
+FEED_BACKFILL = 20
+EXCERPT_LENGTH = 280
+
+
+def remove_activities(db: Session, verb: str, object_ids: List[int]):
+    """Remove the activities for deleted or rewritten objects from every timeline"""
+    if not object_ids:
+        return
+    activity_ids = select(Activity.id).where(Activity.verb == verb, Activity.object_id.in_(object_ids))
+    db.execute(delete(TimelineEntry).where(TimelineEntry.activity_id.in_(activity_ids)))
+    db.execute(delete(Activity).where(Activity.verb == verb, Activity.object_id.in_(object_ids)))
+
+
+def record_activities(db: Session, user: User, verb: str, items: List[Dict]):
+    """
+    Record activities and fan them out to the user's followers
+
+    Each item has object_id and book_id, and optionally rating and text.
+    An earlier activity for the same object is replaced, so editing a
+    rating or review moves it to the top of the feed instead of repeating it.
+    """
+    if not items:
+        return
+    remove_activities(db, verb, [item["object_id"] for item in items])
+
+    followers = db.query(func.count(Follow.id)).filter(Follow.followed_id == user.id).scalar()
+    fanned_out = followers <= FEED_FANOUT_LIMIT
+    activity_ids = db.execute(insert(Activity).returning(Activity.id), [
+        {
+            "user_id": user.id,
+            "verb": verb,
+            "object_id": item["object_id"],
+            "book_id": item["book_id"],
+            "rating": item.get("rating"),
+            "excerpt": (item.get("text") or "")[:EXCERPT_LENGTH] or None,
+            "fanned_out": fanned_out
+        }
+        for item in items
+    ]).scalars().all()
+
+    if fanned_out and followers:
+        db.execute(insert(TimelineEntry).from_select(
+            ["owner_id", "activity_id"],
+            select(Follow.follower_id, Activity.id).join(
+                Activity, Activity.user_id == Follow.followed_id
+            ).where(
+                Follow.followed_id == user.id,
+                Activity.id.in_(activity_ids)
+            )
+        ))
+
+    publish_activity(db, user, verb, items)
+
+
+def record_activity(db: Session, user: User, verb: str, object_id: int, book_id: int,
+                    rating: Optional[int] = None, text: Optional[str] = None):
+    """Record a single activity; see record_activities"""
+    record_activities(db, user, verb, [
+        {"object_id": object_id, "book_id": book_id, "rating": rating, "text": text}
+    ])
+
+
+@job_handler("feed.backfill")
+def backfill_timeline(db: Session, follower_id: int, followed_id: int):
+    """Copy a newly followed user's recent activities into the follower's timeline"""
+    # When run as a job, activities fanned out since the follow are already there
+    recent = select(Activity.id).where(
+        Activity.user_id == followed_id,
+        Activity.fanned_out.is_(True),
+        ~exists().where(TimelineEntry.owner_id == follower_id, TimelineEntry.activity_id == Activity.id)
+    ).order_by(Activity.id.desc()).limit(FEED_BACKFILL)
+    db.execute(insert(TimelineEntry).from_select(
+        ["owner_id", "activity_id"],
+        select(literal(follower_id), recent.subquery().c.id)
+    ))
+
+
+def drop_from_timeline(db: Session, follower_id: int, followed_id: int):
+    """Remove an unfollowed user's activities from the follower's timeline"""
+    db.execute(delete(TimelineEntry).where(
+        TimelineEntry.owner_id == follower_id,
+        TimelineEntry.activity_id.in_(select(Activity.id).where(Activity.user_id == followed_id))
+    ))
+
+
+def load_feed(db: Session, viewer_id: int, limit: int = 20, before: Optional[int] = None) -> Dict:
+    """
+    One page of the viewer's feed, newest first
+
+    Args:
+        before: cursor from the previous page; only older activities are returned
+
+    Returns:
+        Items and the cursor for the next page (None on the last page)
+    """
+    followed = select(Follow.followed_id).join(User, User.id == Follow.followed_id).where(
+        Follow.follower_id == viewer_id, User.deleted_at.is_(None)
+    )
+
+    pushed = db.query(Activity).join(
+        TimelineEntry, TimelineEntry.activity_id == Activity.id
+    ).filter(
+        TimelineEntry.owner_id == viewer_id,
+        Activity.user_id.in_(followed)
+    )
+    pulled = db.query(Activity).filter(
+        Activity.user_id.in_(followed),
+        Activity.fanned_out.is_(False)
+    )
+    if before is not None:
+        pushed = pushed.filter(TimelineEntry.activity_id < before)
+        pulled = pulled.filter(Activity.id < before)
+
+    # Each source is a keyset scan; merging the two newest pages gives the
+    # newest page overall
+    activities = pushed.order_by(TimelineEntry.activity_id.desc()).limit(limit + 1).all()
+    activities += pulled.order_by(Activity.id.desc()).limit(limit + 1).all()
+    activities = sorted({activity.id: activity for activity in activities}.values(),
+                        key=lambda activity: activity.id, reverse=True)
+    has_more = len(activities) > limit
+    activities = activities[:limit]
+
+    user_ids = {activity.user_id for activity in activities}
+    book_ids = {activity.book_id for activity in activities}
+    usernames = dict(db.query(User.id, User.username).filter(User.id.in_(user_ids))) if user_ids else {}
+    books = {book.id: book for book in db.query(Book).filter(Book.id.in_(book_ids))} if book_ids else {}
+
+    items = []
+    for activity in activities:
+        book = books.get(activity.book_id)
+        items.append({
+            "id": activity.id,
+            "verb": activity.verb,
+            "created_at": activity.created_at,
+            "user": {"id": activity.user_id, "username": usernames.get(activity.user_id)},
+            "book": {
+                "id": book.id,
+                "open_library_id": book.open_library_id,
+                "title": book.title,
+                "author": book.author,
+                "cover_image_url": book.cover_image_url
+            } if book else None,
+            "rating": activity.rating,
+            "excerpt": activity.excerpt
+        })
+
+    return {"items": items, "next_cursor": activities[-1].id if has_more else None}
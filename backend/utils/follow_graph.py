@@ -0,0 +1,294 @@
+"""In-memory follow graph
+
+Both directions of every follow are held as sorted int32 arrays per user,
+so friends-of-friends suggestions are counted in memory instead of with a
+three-way join on follows. Lookups that only touch the viewer's own follows
+(mutuals, friends who read a book) are single indexed joins and don't use it.
+
+Each instance keeps its own copy, built from shared state in the cache:
+
+- a snapshot (packed edge list, 8 bytes per follow) rebuilt from the
+  follows table by the ``follow_graph.rebuild`` job once it is older than
+  FOLLOW_GRAPH_REBUILD seconds (or, when there is none, by the loading
+  instance's background thread)
+- a delta per follow, unfollow or account removal since then, published
+  by the instance that committed it
+
+Instances catch up every FOLLOW_GRAPH_TTL seconds on a background thread,
+applying only the deltas they haven't seen, so a request never waits for
+a load or scans follows. Until an instance's first load finishes,
+suggestions come from a query instead. Reads that need to be exact for the
+viewer call ``sync_user`` first, which reloads just their own edges.
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, aliased
+
+from models.models import Follow
+from utils.cache import get_cache
+from utils.jobs import enqueue, job_handler
+
+FOLLOW_GRAPH_TTL = int(os.getenv("FOLLOW_GRAPH_TTL", "60"))
+FOLLOW_GRAPH_REBUILD = int(os.getenv("FOLLOW_GRAPH_REBUILD", "3600"))
+# A snapshot this old is dropped, and the next instance to load rebuilds it
+SNAPSHOT_MAX_AGE = 24 * 60 * 60
+# Allowance for clock skew between instances and for follows committed during a scan
+DELTA_SLACK = 60
+SNAPSHOT_KEY = "snapshot"
+DELTA_PREFIX = "delta:"
+
+_snapshot_cache = get_cache("follow_graph")
+
+
+def _insert(values: array, value: int) -> bool:
+    position = bisect_left(values, value)
+    if position < len(values) and values[position] == value:
+        return False
+    values.insert(position, value)
+    return True
+
+
+def _remove(values: array, value: int) -> bool:
+    position = bisect_left(values, value)
+    if position < len(values) and values[position] == value:
+        del values[position]
+        return True
+    return False
+
+
+class FollowGraph:
+    """Adjacency index over follows in both directions"""
+
+    def __init__(self):
+        self._following: Dict[int, array] = {}
+        self._followers: Dict[int, array] = {}
+        self._lock = threading.Lock()
+        # When the snapshot it came from was built, and when deltas were last applied
+        self.built_at = 0.0
+        self.loaded_at = 0.0
+        self.applied = set()
+
+    @classmethod
+    def from_edges(cls, edges: array, built_at: float) -> "FollowGraph":
+        """
+        Build from a flat array of follower, followed pairs
+
+        Pairs must be sorted by follower, then followed, so every adjacency
+        array comes out sorted without a sort.
+        """
+        graph = cls()
+        for index in range(0, len(edges), 2):
+            follower, followed = edges[index], edges[index + 1]
+            graph._following.setdefault(follower, array("i")).append(followed)
+            graph._followers.setdefault(followed, array("i")).append(follower)
+        graph.built_at = built_at
+        return graph
+
+    def to_snapshot(self) -> dict:
+        edges = array("i")
+        for follower in sorted(self._following):
+            for followed in self._following[follower]:
+                edges.append(follower)
+                edges.append(followed)
+        if sys.byteorder == "big":
+            edges.byteswap()
+        return {"edges": edges.tobytes(), "built_at": self.built_at}
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict) -> "FollowGraph":
+        edges = array("i")
+        edges.frombytes(snapshot["edges"])
+        if sys.byteorder == "big":
+            edges.byteswap()
+        return cls.from_edges(edges, snapshot["built_at"])
+
+    def add(self, follower: int, followed: int):
+        with self._lock:
+            _insert(self._following.setdefault(follower, array("i")), followed)
+            _insert(self._followers.setdefault(followed, array("i")), follower)
+
+    def remove(self, follower: int, followed: int):
+        with self._lock:
+            _remove(self._following.get(follower, array("i")), followed)
+            _remove(self._followers.get(followed, array("i")), follower)
+
+    def following(self, user_id: int) -> array:
+        return self._following.get(user_id, array("i"))
+
+    def followers(self, user_id: int) -> array:
+        return self._followers.get(user_id, array("i"))
+
+    def suggestions(self, user_id: int, limit: int = 10) -> List[tuple]:
+        """
+        Friends of friends the user doesn't follow yet
+
+        Returns:
+            (user_id, number of followed users who follow them) pairs, most
+            shared connections first
+        """
+        following = self.following(user_id)
+        exclude = set(following)
+        exclude.add(user_id)
+        counts = Counter()
+        for followed in following:
+            counts.update(candidate for candidate in self.following(followed) if candidate not in exclude)
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    def sync_user(self, db: Session, user_id: int):
+        """Reload one user's edges in both directions from the database"""
+        following = {followed for (followed,) in db.query(Follow.followed_id).filter(Follow.follower_id == user_id)}
+        followers = {follower for (follower,) in db.query(Follow.follower_id).filter(Follow.followed_id == user_id)}
+        for followed in set(self.following(user_id)) - following:
+            self.remove(user_id, followed)
+        for followed in following - set(self.following(user_id)):
+            self.add(user_id, followed)
+        for follower in set(self.followers(user_id)) - followers:
+            self.remove(follower, user_id)
+        for follower in followers - set(self.followers(user_id)):
+            self.add(follower, user_id)
+
+
+_graph: Optional[FollowGraph] = None
+_refresh_lock = threading.Lock()
+_refreshing = False
+
+
+def _delta_time(key: str) -> float:
+    return float(key.split(":")[1])
+
+
+def _apply(graph: FollowGraph, op: str, first: int, second: int):
+    if op == "follow":
+        graph.add(first, second)
+    elif op == "unfollow":
+        graph.remove(first, second)
+    elif op == "remove_user":
+        for followed in list(graph.following(first)):
+            graph.remove(first, followed)
+        for follower in list(graph.followers(first)):
+            graph.remove(follower, first)
+
+
+def _publish(op: str, first: int, second: int = 0):
+    """Record a committed change for other instances to apply on their next catch-up"""
+    key = f"{DELTA_PREFIX}{time.time():017.6f}:{uuid.uuid4().hex[:8]}"
+    _snapshot_cache.set(key, (op, first, second), ttl=SNAPSHOT_MAX_AGE + DELTA_SLACK)
+
+
+def _apply_deltas(graph: FollowGraph):
+    """Apply the shared deltas written since the graph's snapshot that it hasn't seen, oldest first"""
+    keys = sorted(
+        key for key in _snapshot_cache.keys(DELTA_PREFIX)
+        if key not in graph.applied and _delta_time(key) >= graph.built_at - DELTA_SLACK
+    )
+    for key, (op, first, second) in sorted(_snapshot_cache.get_many(keys).items()):
+        _apply(graph, op, first, second)
+        graph.applied.add(key)
+
+
+@job_handler("follow_graph.rebuild")
+def rebuild_snapshot(db: Session) -> FollowGraph:
+    """
+    Scan follows into a new shared snapshot and drop the deltas it includes
+
+    Deltas from the last DELTA_SLACK seconds before the scan started are
+    kept, since the scan may have missed them; applying them again is a
+    no-op.
+    """
+    built_at = time.time()
+    edges = array("i")
+    for follower, followed in db.query(Follow.follower_id, Follow.followed_id).order_by(
+        Follow.follower_id, Follow.followed_id
+    ).yield_per(10000):
+        edges.append(follower)
+        edges.append(followed)
+    graph = FollowGraph.from_edges(edges, built_at)
+    _snapshot_cache.set(SNAPSHOT_KEY, graph.to_snapshot(), ttl=SNAPSHOT_MAX_AGE)
+    _snapshot_cache.delete(*[
+        key for key in _snapshot_cache.keys(DELTA_PREFIX) if _delta_time(key) < built_at - DELTA_SLACK
+    ])
+    return graph
+
+
+def _refresh():
+    """Bring this instance's graph up to date; runs on a background thread"""
+    global _graph, _refreshing
+    from models.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        graph = _graph
+        snapshot = _snapshot_cache.get(SNAPSHOT_KEY)
+        if snapshot is None:
+            # First instance up, or the snapshot expired: nothing to load from
+            graph = rebuild_snapshot(db)
+        elif graph is None or graph.built_at != snapshot["built_at"]:
+            graph = FollowGraph.from_snapshot(snapshot)
+        _apply_deltas(graph)
+        graph.loaded_at = time.time()
+        _graph = graph
+
+        if time.time() - graph.built_at > FOLLOW_GRAPH_REBUILD:
+            enqueue(db, "follow_graph.rebuild", dedupe_key="follow_graph.rebuild", priority=150)
+            db.commit()
+    except Exception as e:
+        print(f"Error refreshing follow graph: {e}")
+    finally:
+        db.close()
+        with _refresh_lock:
+            _refreshing = False
+
+
+def get_follow_graph() -> Optional[FollowGraph]:
+    """
+    This instance's graph, or None until its first load has finished
+
+    A graph last brought up to date more than FOLLOW_GRAPH_TTL seconds ago
+    is returned as is while a background thread catches it up.
+    """
+    global _refreshing
+    graph = _graph
+    if graph is None or time.time() - graph.loaded_at > FOLLOW_GRAPH_TTL:
+        with _refresh_lock:
+            if not _refreshing:
+                _refreshing = True
+                threading.Thread(target=_refresh, name="follow-graph-refresh", daemon=True).start()
+    return graph
+
+
+def suggestions_from_db(db: Session, user_id: int, limit: int = 10) -> List[tuple]:
+    """FollowGraph.suggestions as a query, for an instance whose graph isn't loaded yet"""
+    theirs = aliased(Follow)
+    mine = select(Follow.followed_id).where(Follow.follower_id == user_id)
+    shared = func.count()
+    return [tuple(row) for row in db.query(theirs.followed_id, shared).join(
+        Follow, Follow.followed_id == theirs.follower_id
+    ).filter(
+        Follow.follower_id == user_id,
+        theirs.followed_id != user_id,
+        theirs.followed_id.not_in(mine)
+    ).group_by(theirs.followed_id).order_by(shared.desc(), theirs.followed_id).limit(limit)]
+
+
+def note_user_removed(user_id: int):
+    """Drop a deleted account's edges from this instance and publish the removal"""
+    if _graph is not None:
+        _apply(_graph, "remove_user", user_id, 0)
+    _publish("remove_user", user_id)
+
+
+def note_follow(follower: int, followed: int, following: bool):
+    """Apply a committed follow or unfollow to this instance and publish it"""
+    op = "follow" if following else "unfollow"
+    if _graph is not None:
+        _apply(_graph, op, follower, followed)
+    _publish(op, follower, followed)
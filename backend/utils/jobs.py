@@ -0,0 +1,328 @@
+"""Durable background jobs
+
+Work that doesn't have to finish before the response (Open Library
+enrichment, leaderboard refreshes, timeline backfills, counter
+reconciliation) is enqueued as a row in the jobs table, in the same
+transaction as the write that caused it, and run later by either:
+
+- a pool of JOB_WORKERS threads started with the app on long-running
+  servers (api/index.py), woken as soon as a job is committed
+- ``python -m utils.jobs`` or ``GET /api/jobs/drain`` (for Vercel cron),
+  which run due jobs until none are left or JOB_DRAIN_SECONDS have passed
+
+Due jobs run lowest priority number first. A failing job is retried with
+exponential backoff until max_attempts, then kept as failed with its last
+error. Enqueuing with a dedupe_key does nothing while a job with that key
+is queued or running, and re-arms it once it has finished.
+
+Handlers are registered with ``@job_handler("kind")`` and called as
+``handler(db, **payload)``; the job's session is committed after they
+return.
+
+Usage:
+    python -m utils.jobs                              # drain due jobs
+    python -m utils.jobs --enqueue rating_stats.rebuild
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import and_, event, or_, update
+from sqlalchemy.orm import Session
+
+from models.database import SessionLocal
+from models.models import Job
+from utils.bulk import _dialect_insert
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "0" if os.getenv("VERCEL") else "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "5"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_DRAIN_SECONDS = float(os.getenv("JOB_DRAIN_SECONDS", "50"))
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "7"))
+BACKOFF_BASE = 10
+BACKOFF_MAX = 60 * 60
+# Due jobs considered per claim; losing a race moves on to the next
+CLAIM_CANDIDATES = 10
+
+# Modules whose @job_handler registrations must be loaded before running jobs
+HANDLER_MODULES = [
+    "utils.leaderboards",
+    "utils.feed",
+    "utils.rating_stats",
+    "utils.book_enrichment",
+    "utils.account_deletion",
+    "utils.follow_graph",
+]
+ENQUEUED_KEY = "jobs_enqueued"
+
+_handlers: Dict[str, Callable] = {}
+_pool: Optional["JobWorkerPool"] = None
+
+
+def job_handler(kind: str):
+    """Register a function as the handler for a job kind"""
+    def register(function: Callable) -> Callable:
+        _handlers[kind] = function
+        return function
+    return register
+
+
+def load_handlers():
+    for module in HANDLER_MODULES:
+        importlib.import_module(module)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def enqueue(db: Session, kind: str, payload: Optional[Dict] = None, dedupe_key: Optional[str] = None,
+            priority: int = 100, delay: float = 0, max_attempts: int = 5):
+    """
+    Add a job in db's current transaction
+
+    It becomes visible to workers when the caller commits, so a job is
+    never run for a write that was rolled back.
+    """
+    values = {
+        "kind": kind,
+        "payload": json.dumps(payload or {}),
+        "priority": priority,
+        "dedupe_key": dedupe_key,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "run_at": _now() + timedelta(seconds=delay),
+        "locked_until": None,
+        "last_error": None,
+        "finished_at": None
+    }
+    stmt = _dialect_insert(db)(Job).values(**values)
+    if dedupe_key is not None:
+        # Re-arm a finished job with this key; leave a pending one alone
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Job.dedupe_key],
+            set_={column: value for column, value in values.items() if column != "dedupe_key"},
+            where=Job.status.in_(["done", "failed"])
+        )
+    db.execute(stmt)
+    db.info[ENQUEUED_KEY] = True
+
+
+def workers_running() -> bool:
+    """Whether this process has a worker pool that will pick jobs up promptly"""
+    return _pool is not None
+
+
+def defer(db: Session, kind: str, payload: Optional[Dict] = None, **options):
+    """
+    Enqueue when this process has workers to run the job soon, otherwise
+    run the handler now in db's transaction
+
+    For work that should leave the request path where possible but can't
+    wait for the next cron drain on serverless instances.
+    """
+    if workers_running():
+        enqueue(db, kind, payload, **options)
+    else:
+        _handlers[kind](db, **(payload or {}))
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_workers(session: Session):
+    if session.info.pop(ENQUEUED_KEY, False) and _pool is not None:
+        _pool.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_enqueued(session: Session):
+    session.info.pop(ENQUEUED_KEY, None)
+
+
+def _claimable(now: datetime):
+    return or_(
+        and_(Job.status == "queued", Job.run_at <= now),
+        # Workers that died mid-job leave it running past its lease
+        and_(Job.status == "running", Job.locked_until < now)
+    )
+
+
+def claim_job(db: Session) -> Optional[Job]:
+    """
+    Take the next due job
+
+    Each candidate is claimed with a conditional UPDATE, so concurrent
+    workers on any number of instances never run the same job twice.
+    """
+    now = _now()
+    candidates = db.query(Job.id).filter(_claimable(now)).order_by(
+        Job.priority, Job.run_at, Job.id
+    ).limit(CLAIM_CANDIDATES).all()
+    for (job_id,) in candidates:
+        claimed = db.execute(update(Job).where(Job.id == job_id, _claimable(now)).values(
+            status="running",
+            attempts=Job.attempts + 1,
+            locked_until=now + timedelta(seconds=JOB_LEASE_SECONDS)
+        )).rowcount
+        db.commit()
+        if claimed:
+            return db.get(Job, job_id)
+    return None
+
+
+def _backoff(attempts: int) -> float:
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def run_job(db: Session, job: Job) -> bool:
+    """Run a claimed job and record the outcome; True if it succeeded"""
+    job_id, kind, attempts, max_attempts = job.id, job.kind, job.attempts, job.max_attempts
+    try:
+        handler = _handlers.get(kind)
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind {kind!r}")
+        handler(db, **json.loads(job.payload))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Job {job_id} ({kind}) failed on attempt {attempts}: {e}")
+        if attempts >= max_attempts:
+            outcome = {"status": "failed", "finished_at": _now()}
+        else:
+            outcome = {"status": "queued", "run_at": _now() + timedelta(seconds=_backoff(attempts))}
+        db.execute(update(Job).where(Job.id == job_id).values(
+            locked_until=None, last_error=f"{type(e).__name__}: {e}"[:2000], **outcome
+        ))
+        db.commit()
+        return False
+
+    db.execute(update(Job).where(Job.id == job_id).values(
+        status="done", locked_until=None, last_error=None, finished_at=_now()
+    ))
+    db.commit()
+    return True
+
+
+def run_next() -> Optional[bool]:
+    """Claim and run one job in a fresh session; None if nothing was due"""
+    db = SessionLocal()
+    try:
+        job = claim_job(db)
+        if job is None:
+            return None
+        return run_job(db, job)
+    finally:
+        db.close()
+
+
+def prune_jobs(db: Session) -> int:
+    """Delete jobs that finished more than JOB_RETENTION_DAYS ago"""
+    cutoff = _now() - timedelta(days=JOB_RETENTION_DAYS)
+    deleted = db.query(Job).filter(
+        Job.status.in_(["done", "failed"]),
+        Job.finished_at < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def drain(max_seconds: float = JOB_DRAIN_SECONDS) -> Dict:
+    """Run due jobs until none are left or max_seconds have passed"""
+    load_handlers()
+    deadline = time.monotonic() + max_seconds
+    counts = {"succeeded": 0, "failed": 0}
+    while time.monotonic() < deadline:
+        outcome = run_next()
+        if outcome is None:
+            break
+        counts["succeeded" if outcome else "failed"] += 1
+
+    db = SessionLocal()
+    try:
+        counts["pruned"] = prune_jobs(db)
+    finally:
+        db.close()
+    return counts
+
+
+class JobWorkerPool:
+    """Threads that run jobs as they are committed, polling as a fallback"""
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        load_handlers()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                outcome = run_next()
+            except Exception as e:
+                # Database unavailable; try again after the poll interval
+                print(f"Job worker error: {e}")
+                outcome = None
+            if outcome is None:
+                self._wake.wait(JOB_POLL_INTERVAL)
+                self._wake.clear()
+
+
+def start_workers() -> Optional[JobWorkerPool]:
+    """Start this process's worker pool, unless JOB_WORKERS is 0"""
+    global _pool
+    if JOB_WORKERS <= 0 or _pool is not None:
+        return _pool
+    _pool = JobWorkerPool(JOB_WORKERS)
+    _pool.start()
+    return _pool
+
+
+def stop_workers():
+    global _pool
+    if _pool is not None:
+        _pool.stop()
+        _pool = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run or enqueue background jobs")
+    parser.add_argument("--enqueue", metavar="KIND", help="enqueue a job of this kind instead of draining")
+    parser.add_argument("--payload", default="{}", help="JSON arguments for --enqueue")
+    parser.add_argument("--seconds", type=float, default=JOB_DRAIN_SECONDS, help="time budget for draining")
+    args = parser.parse_args()
+
+    if args.enqueue:
+        db = SessionLocal()
+        try:
+            enqueue(db, args.enqueue, json.loads(args.payload), dedupe_key=args.enqueue)
+            db.commit()
+            print(f"Enqueued {args.enqueue}")
+        finally:
+            db.close()
+    else:
+        result = drain(args.seconds)
+        print(f"Ran {result['succeeded'] + result['failed']} jobs ({result['failed']} failed), "
+              f"pruned {result['pruned']}")
@@ -0,0 +1,177 @@
+"""Precomputed top-rated and most-read leaderboards
+
+Rankings are aggregated periodically into leaderboard_entries and served
+from there. Each refresh replaces every leaderboard in one transaction, so
+readers see either the previous snapshot or the new one, never a mix.
+
+Top-rated books are ordered by Bayesian average: each book's ratings are
+blended with LEADERBOARD_MIN_VOTES ratings at the window's mean, and books
+with fewer ratings than that are left out, so a single 5-star rating can't
+top the board.
+
+Usage (e.g. from cron):
+    python -m utils.leaderboards
+"""
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+
+from models.models import BookRatingStats, LeaderboardEntry, Rating, ReadBook
+from utils.jobs import enqueue, job_handler
+
+WINDOWS = {"all": None, "30d": timedelta(days=30), "7d": timedelta(days=7)}
+LEADERBOARD_MIN_VOTES = int(os.getenv("LEADERBOARD_MIN_VOTES", "3"))
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "50"))
+# Reading a snapshot older than this enqueues a refresh
+LEADERBOARD_MAX_AGE = int(os.getenv("LEADERBOARD_MAX_AGE", "900"))
+
+_refresh_lock = threading.Lock()
+
+
+def _top_rated(db: Session, since: Optional[datetime], computed_at: datetime) -> List[LeaderboardEntry]:
+    if since is None:
+        # All-time totals are already materialized per book
+        aggregates = db.query(
+            BookRatingStats.book_id.label("book_id"),
+            BookRatingStats.rating_count.label("votes"),
+            BookRatingStats.rating_sum.label("total")
+        ).subquery()
+    else:
+        aggregates = db.query(
+            Rating.book_id.label("book_id"),
+            func.count(Rating.id).label("votes"),
+            func.sum(Rating.rating).label("total")
+        ).filter(
+            func.coalesce(Rating.updated_at, Rating.created_at) >= since
+        ).group_by(Rating.book_id).subquery()
+
+    votes, total = db.query(func.sum(aggregates.c.votes), func.sum(aggregates.c.total)).one()
+    if not votes:
+        return []
+    mean = float(total) / votes
+
+    prior = LEADERBOARD_MIN_VOTES
+    score = (prior * mean + aggregates.c.total) / (prior + aggregates.c.votes)
+    rows = db.query(aggregates.c.book_id, aggregates.c.votes, score.label("score")).filter(
+        aggregates.c.votes >= max(prior, 1)
+    ).order_by(score.desc(), aggregates.c.votes.desc(), aggregates.c.book_id).limit(LEADERBOARD_SIZE).all()
+
+    return [
+        LeaderboardEntry(kind="top_rated", rank=rank, book_id=row.book_id, score=round(float(row.score), 4),
+                         rating_count=row.votes, computed_at=computed_at)
+        for rank, row in enumerate(rows, 1)
+    ]
+
+
+def _most_read(db: Session, since: Optional[datetime], computed_at: datetime) -> List[LeaderboardEntry]:
+    reads = func.count(ReadBook.id)
+    query = db.query(ReadBook.book_id, reads.label("reads"))
+    if since is not None:
+        query = query.filter(ReadBook.read_at >= since)
+    rows = query.group_by(ReadBook.book_id).order_by(
+        reads.desc(), ReadBook.book_id
+    ).limit(LEADERBOARD_SIZE).all()
+
+    return [
+        LeaderboardEntry(kind="most_read", rank=rank, book_id=row.book_id, score=row.reads,
+                         read_count=row.reads, computed_at=computed_at)
+        for rank, row in enumerate(rows, 1)
+    ]
+
+
+@job_handler("leaderboards.refresh")
+def refresh_leaderboards(db: Session) -> int:
+    """
+    Recompute every leaderboard and swap the snapshot in atomically
+
+    Returns:
+        Number of entries written, or 0 if a concurrent refresh won
+    """
+    computed_at = datetime.now(timezone.utc)
+    entries = []
+    for period, length in WINDOWS.items():
+        since = computed_at - length if length else None
+        for entry in _top_rated(db, since, computed_at) + _most_read(db, since, computed_at):
+            entry.period = period
+            entries.append(entry)
+
+    db.query(LeaderboardEntry).delete()
+    db.add_all(entries)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another instance swapped in its snapshot first; keep that one
+        db.rollback()
+        return 0
+    return len(entries)
+
+
+def _snapshot_age(db: Session) -> Optional[timedelta]:
+    computed_at = db.query(func.max(LeaderboardEntry.computed_at)).scalar()
+    if computed_at is None:
+        return None
+    if computed_at.tzinfo is None:
+        computed_at = computed_at.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - computed_at
+
+
+def get_leaderboard(db: Session, period: str) -> Dict:
+    """
+    Read one window's leaderboards from the snapshot
+
+    A stale snapshot is still served, and a refresh job is enqueued for the
+    job workers or the next cron drain. Only when there is no snapshot at
+    all is it computed first, by at most one request per instance.
+    """
+    age = _snapshot_age(db)
+    if age is None:
+        if _refresh_lock.acquire(blocking=False):
+            try:
+                refresh_leaderboards(db)
+            finally:
+                _refresh_lock.release()
+    elif age > timedelta(seconds=LEADERBOARD_MAX_AGE):
+        enqueue(db, "leaderboards.refresh", dedupe_key="leaderboards.refresh", priority=50)
+        db.commit()
+
+    entries = db.query(LeaderboardEntry).options(joinedload(LeaderboardEntry.book)).filter(
+        LeaderboardEntry.period == period
+    ).order_by(LeaderboardEntry.kind, LeaderboardEntry.rank).all()
+
+    boards = {"top_rated": [], "most_read": []}
+    for entry in entries:
+        boards[entry.kind].append({
+            "rank": entry.rank,
+            "score": entry.score,
+            "rating_count": entry.rating_count,
+            "read_count": entry.read_count,
+            "book": {
+                "id": entry.book.id,
+                "open_library_id": entry.book.open_library_id,
+                "title": entry.book.title,
+                "author": entry.book.author,
+                "cover_image_url": entry.book.cover_image_url
+            }
+        })
+
+    return {
+        "window": period,
+        "computed_at": entries[0].computed_at if entries else None,
+        "min_votes": LEADERBOARD_MIN_VOTES,
+        **boards
+    }
+
+
+if __name__ == "__main__":
+    from models.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(f"Wrote {refresh_leaderboards(db)} leaderboard entries")
+    finally:
+        db.close()
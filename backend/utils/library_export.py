@@ -0,0 +1,86 @@
+"""Streaming export of a user's library
+
+One row per book the user has read, rated or reviewed, joined server-side
+and fetched in chunks so memory use does not depend on library size.
+"""
+import csv
+import io
+import json
+from typing import Dict, Iterator
+
+from sqlalchemy import and_, select, union
+from sqlalchemy.orm import Session
+
+from models.models import Book, DiaryEntry, Rating, ReadBook
+
+EXPORT_CHUNK_SIZE = 500
+
+EXPORT_COLUMNS = [
+    "open_library_id",
+    "title",
+    "author",
+    "isbn",
+    "published_year",
+    "read_at",
+    "rating",
+    "rated_at",
+    "review",
+    "reviewed_at",
+]
+
+
+def iter_library_rows(db: Session, user_id: int) -> Iterator[Dict]:
+    """Yield export rows using a server-side cursor"""
+    book_ids = union(
+        select(ReadBook.book_id).where(ReadBook.user_id == user_id),
+        select(Rating.book_id).where(Rating.user_id == user_id),
+        select(DiaryEntry.book_id).where(DiaryEntry.user_id == user_id),
+    ).subquery()
+
+    query = (
+        select(
+            Book.open_library_id,
+            Book.title,
+            Book.author,
+            Book.isbn,
+            Book.published_year,
+            ReadBook.read_at,
+            Rating.rating,
+            Rating.created_at.label("rated_at"),
+            DiaryEntry.entry_text.label("review"),
+            DiaryEntry.created_at.label("reviewed_at"),
+        )
+        .select_from(book_ids)
+        .join(Book, Book.id == book_ids.c.book_id)
+        .outerjoin(ReadBook, and_(ReadBook.book_id == Book.id, ReadBook.user_id == user_id))
+        .outerjoin(Rating, and_(Rating.book_id == Book.id, Rating.user_id == user_id))
+        .outerjoin(DiaryEntry, and_(DiaryEntry.book_id == Book.id, DiaryEntry.user_id == user_id))
+        .order_by(Book.id)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+
+    for row in db.execute(query):
+        yield {
+            column: value.isoformat() if hasattr(value, "isoformat") else value
+            for column, value in row._mapping.items()
+        }
+
+
+def export_ndjson(db: Session, user_id: int) -> Iterator[str]:
+    """One JSON object per line"""
+    for row in iter_library_rows(db, user_id):
+        yield json.dumps(row) + "\n"
+
+
+def export_csv(db: Session, user_id: int) -> Iterator[str]:
+    """CSV with a header row, emitted in chunks"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for count, row in enumerate(iter_library_rows(db, user_id), 1):
+        writer.writerow(row)
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,292 @@
+"""Bulk import of reading history from Goodreads and StoryGraph CSV exports
+
+Rows are read one at a time and processed in batches. Each batch resolves its
+books with one local query, falls back to concurrent Open Library lookups for
+the rest, then upserts read marks, ratings and reviews in one transaction.
+
+Usage:
+    python -m utils.library_import <username> <export.csv>
+"""
+import csv
+import io
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from models.models import Book, DiaryEntry, Rating, ReadBook, User
+from utils.bulk import upsert_rows
+from utils.changelog import record_changes
+from utils.jobs import enqueue
+from utils.open_library import find_book
+from utils.rating_stats import apply_rating_changes, current_ratings
+
+IMPORT_BATCH_SIZE = 500
+LOOKUP_WORKERS = 16
+MAX_REPORTED_UNRESOLVED = 50
+
+_DATE_FORMATS = ("%Y/%m/%d", "%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y")
+
+
+def _clean_isbn(value: Optional[str]) -> Optional[str]:
+    # Goodreads wraps ISBNs as ="0143127748" to stop spreadsheets mangling them
+    digits = re.sub(r"[^0-9Xx]", "", value or "")
+    return digits.upper() if len(digits) in (10, 13) else None
+
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    value = (value or "").strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_rating(value: Optional[str]) -> Optional[int]:
+    try:
+        rating = round(float(value or 0))
+    except ValueError:
+        return None
+    # Goodreads uses 0 for unrated
+    return rating if 1 <= rating <= 5 else None
+
+
+def _clean_review(value: Optional[str]) -> Optional[str]:
+    text = re.sub(r"<br\s*/?>", "\n", value or "").strip()
+    return text or None
+
+
+def normalize_row(row: Dict[str, str]) -> Optional[Dict]:
+    """
+    Map a Goodreads or StoryGraph export row to a common shape
+
+    Returns:
+        Normalized row, or None for books not on the read shelf
+    """
+    if "Exclusive Shelf" in row:
+        # Goodreads
+        if (row.get("Exclusive Shelf") or "").strip() != "read":
+            return None
+        isbns = [_clean_isbn(row.get("ISBN13")), _clean_isbn(row.get("ISBN"))]
+        return {
+            "title": (row.get("Title") or "").strip(),
+            "author": (row.get("Author") or "").strip(),
+            "isbns": [isbn for isbn in isbns if isbn],
+            "rating": _parse_rating(row.get("My Rating")),
+            "read_at": _parse_date(row.get("Date Read")),
+            "review": _clean_review(row.get("My Review")),
+        }
+    if "Read Status" in row:
+        # StoryGraph
+        if (row.get("Read Status") or "").strip() != "read":
+            return None
+        isbn = _clean_isbn(row.get("ISBN/UID"))
+        return {
+            "title": (row.get("Title") or "").strip(),
+            "author": (row.get("Authors") or "").split(",")[0].strip(),
+            "isbns": [isbn] if isbn else [],
+            "rating": _parse_rating(row.get("Star Rating")),
+            "read_at": _parse_date(row.get("Last Date Read")),
+            "review": _clean_review(row.get("Review")),
+        }
+    return None
+
+
+def _batches(rows: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _resolve_books(db: Session, rows: List[Dict]) -> Dict[int, int]:
+    """
+    Map row index to book id for every row that can be resolved
+
+    Books already in the database are matched by ISBN in one query; the rest
+    are looked up on Open Library concurrently and inserted in one statement.
+    """
+    isbns = {isbn for row in rows for isbn in row["isbns"]}
+    by_isbn = {}
+    if isbns:
+        for book_id, isbn in db.query(Book.id, Book.isbn).filter(Book.isbn.in_(isbns)):
+            by_isbn[isbn] = book_id
+
+    resolved = {}
+    missing = []
+    for index, row in enumerate(rows):
+        book_id = next((by_isbn[isbn] for isbn in row["isbns"] if isbn in by_isbn), None)
+        if book_id is not None:
+            resolved[index] = book_id
+        elif row["isbns"] or row["title"]:
+            missing.append(index)
+
+    if not missing:
+        return resolved
+
+    def lookup(index: int) -> Optional[Dict]:
+        row = rows[index]
+        for isbn in row["isbns"]:
+            book = find_book(isbn=isbn)
+            if book:
+                return book
+        return find_book(title=row["title"], author=row["author"]) if row["title"] else None
+
+    with ThreadPoolExecutor(max_workers=LOOKUP_WORKERS) as pool:
+        found = dict(zip(missing, pool.map(lookup, missing)))
+
+    new_books = {}
+    for book in found.values():
+        if book and book["open_library_id"]:
+            new_books.setdefault(book["open_library_id"], {
+                "open_library_id": book["open_library_id"],
+                "title": book["title"],
+                "author": book.get("author"),
+                "isbn": book.get("isbn"),
+                "cover_image_url": book.get("cover_image_url"),
+                "published_year": book.get("published_year"),
+            })
+    created = upsert_rows(db, Book, list(new_books.values()), ["open_library_id"], [])
+    if created:
+        # Search documents have no description; fetch the rest after the import
+        enqueue(db, "books.enrich", {"book_ids": created}, priority=200)
+
+    by_work = dict(
+        db.query(Book.open_library_id, Book.id).filter(Book.open_library_id.in_(new_books))
+    ) if new_books else {}
+    for index, book in found.items():
+        if book and book["open_library_id"] in by_work:
+            resolved[index] = by_work[book["open_library_id"]]
+    return resolved
+
+
+def _import_batch(db: Session, user: User, rows: List[Dict]) -> Dict:
+    resolved = _resolve_books(db, rows)
+
+    # Later rows for the same book win
+    by_book = {}
+    for index, book_id in resolved.items():
+        by_book[book_id] = rows[index]
+
+    dated = [
+        {"user_id": user.id, "book_id": book_id, "read_at": row["read_at"]}
+        for book_id, row in by_book.items() if row["read_at"]
+    ]
+    undated = [
+        {"user_id": user.id, "book_id": book_id}
+        for book_id, row in by_book.items() if not row["read_at"]
+    ]
+    read_ids = upsert_rows(db, ReadBook, dated, ["user_id", "book_id"], ["read_at"])
+    read_ids += upsert_rows(db, ReadBook, undated, ["user_id", "book_id"], [])
+
+    ratings = {book_id: row["rating"] for book_id, row in by_book.items() if row["rating"]}
+    previous = current_ratings(db, user.id, ratings)
+    rating_ids = upsert_rows(db, Rating, [
+        {"user_id": user.id, "book_id": book_id, "rating": rating}
+        for book_id, rating in ratings.items()
+    ], ["user_id", "book_id"], ["rating"])
+    apply_rating_changes(db, [(book_id, previous.get(book_id), rating) for book_id, rating in ratings.items()])
+
+    # Diary entries have no unique constraint to upsert against
+    reviews = {book_id: row["review"] for book_id, row in by_book.items() if row["review"]}
+    diary_ids = []
+    if reviews:
+        existing = dict(db.query(DiaryEntry.book_id, DiaryEntry.id).filter(
+            DiaryEntry.user_id == user.id,
+            DiaryEntry.book_id.in_(reviews)
+        ))
+        updates = [{"id": existing[book_id], "entry_text": text} for book_id, text in reviews.items() if book_id in existing]
+        if updates:
+            db.execute(update(DiaryEntry), updates)
+            diary_ids += [item["id"] for item in updates]
+        new_entries = [
+            {"user_id": user.id, "book_id": book_id, "entry_text": text}
+            for book_id, text in reviews.items() if book_id not in existing
+        ]
+        if new_entries:
+            diary_ids += db.execute(insert(DiaryEntry).returning(DiaryEntry.id), new_entries).scalars().all()
+
+    record_changes(db, user, "read_book", read_ids)
+    record_changes(db, user, "rating", rating_ids)
+    record_changes(db, user, "diary_entry", diary_ids)
+    db.commit()
+
+    return {
+        "imported": len(by_book),
+        "unresolved": [rows[i]["title"] for i in range(len(rows)) if i not in resolved],
+    }
+
+
+def import_library(db: Session, user: User, stream: TextIO, batch_size: int = IMPORT_BATCH_SIZE) -> Iterator[Dict]:
+    """
+    Import a CSV export for a user
+
+    Yields:
+        A progress dict after every committed batch, then a final summary
+        with ``done`` set
+    """
+    progress = {"processed": 0, "imported": 0, "skipped": 0, "unresolved": []}
+    skipped = 0
+
+    def read_rows() -> Iterator[Dict]:
+        nonlocal skipped
+        for raw in csv.DictReader(stream):
+            row = normalize_row(raw)
+            if row is None:
+                skipped += 1
+            else:
+                yield row
+
+    for batch in _batches(read_rows(), batch_size):
+        try:
+            result = _import_batch(db, user, batch)
+        except Exception:
+            db.rollback()
+            raise
+        progress["processed"] += len(batch)
+        progress["imported"] += result["imported"]
+        progress["skipped"] = skipped
+        room = MAX_REPORTED_UNRESOLVED - len(progress["unresolved"])
+        progress["unresolved"] += result["unresolved"][:max(room, 0)]
+        yield dict(progress)
+
+    progress["skipped"] = skipped
+    yield {**progress, "done": True}
+
+
+if __name__ == "__main__":
+    from models.database import SessionLocal
+
+    if len(sys.argv) != 3:
+        print("Usage: python -m utils.library_import <username> <export.csv>")
+        sys.exit(1)
+
+    username, path = sys.argv[1], sys.argv[2]
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == username, User.deleted_at.is_(None)).first()
+        if not user:
+            print(f"ERROR: User {username} not found")
+            sys.exit(1)
+        with io.open(path, encoding="utf-8-sig", newline="") as f:
+            for progress in import_library(db, user, f):
+                print(
+                    f"Processed {progress['processed']} rows: {progress['imported']} imported, "
+                    f"{progress['skipped']} skipped"
+                )
+        if progress["unresolved"]:
+            print("Could not find:")
+            for title in progress["unresolved"]:
+                print(f"  - {title}")
+    finally:
+        db.close()
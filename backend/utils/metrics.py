@@ -0,0 +1,360 @@
+"""Process metrics in the Prometheus text exposition format
+
+Request latency per route template and status, requests in flight,
+database query and connection timings, Open Library calls, password
+hashing and cache hit ratios, served at ``GET /metrics``.
+
+Counters, gauges and histograms are written without locks: every thread
+updates its own shard of each metric, and a scrape adds the shards up.
+Values that already exist elsewhere (pool sizes, cache statistics, open
+event streams) are read when scraped instead of being tracked twice.
+
+Each worker process reports its own figures; Prometheus should scrape
+every worker (or every instance) and sum them.
+"""
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from utils.profiling import record_span
+
+# Bearer token required by /metrics when set
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# PlainTextResponse appends the charset
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+# bcrypt is deliberately slow; its cost factor puts it in the tens to hundreds of ms
+HASH_BUCKETS = (0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1, 2)
+
+# (labels, value) samples of one metric family
+Samples = List[Tuple[Dict[str, str], float]]
+
+_metrics: List["Metric"] = []
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, Samples]]]] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    text = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return "{" + text + "}" if text else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named metric whose values are kept per thread and summed on scrape"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._local = threading.local()
+        self._shards: List[Dict[tuple, object]] = []
+        _metrics.append(self)
+
+    def _shard(self) -> Dict[tuple, object]:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            # list.append is atomic; only ever done once per thread
+            self._shards.append(values)
+            return values
+
+    def _check(self, labels: tuple):
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {labels}")
+
+    def _merged(self) -> Dict[tuple, object]:
+        raise NotImplementedError
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        shard = self._shard()
+        current = shard.get(labels)
+        if current is None:
+            self._check(labels)
+            current = 0
+        shard[labels] = current + amount
+
+    def _merged(self) -> Dict[tuple, float]:
+        totals: Dict[tuple, float] = {}
+        for shard in list(self._shards):
+            for labels, value in list(shard.items()):
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in sorted(self._merged().items()):
+            yield f"{self.name}{_labels(zip(self.labels, labels))} {_number(value)}"
+
+
+class Gauge(Counter):
+    """Value that goes up and down, such as requests in flight"""
+
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    """Observations counted into cumulative buckets, with their sum"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            self._check(labels)
+            # One slot per bucket, one for +Inf, then the sum
+            counts = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def time(self, *labels: str) -> "_Timer":
+        """Context manager observing the duration of its block"""
+        return _Timer(self, labels)
+
+    def _merged(self) -> Dict[tuple, List[float]]:
+        totals: Dict[tuple, List[float]] = {}
+        for shard in list(self._shards):
+            for labels, counts in list(shard.items()):
+                merged = totals.setdefault(labels, [0] * len(counts))
+                for index, count in enumerate(list(counts)):
+                    merged[index] += count
+        return totals
+
+    def samples(self) -> Iterable[str]:
+        bounds = self.buckets + (float("inf"),)
+        for labels, counts in sorted(self._merged().items()):
+            pairs = list(zip(self.labels, labels))
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(pairs + [('le', _number(bound))])} {cumulative}"
+            yield f"{self.name}_sum{_labels(pairs)} {_number(counts[-1])}"
+            yield f"{self.name}_count{_labels(pairs)} {cumulative}"
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+def collector(function: Callable[[], Iterable[Tuple[str, str, str, Samples]]]):
+    """Register a function returning (name, kind, help, samples) families read at scrape time"""
+    _collectors.append(function)
+    return function
+
+
+HTTP_REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being served, including open event streams")
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to serve a request, by route template and status",
+    ["method", "route", "status"]
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Time to execute a SQL statement, by statement type",
+    ["statement"], QUERY_BUCKETS
+)
+DB_CHECKOUTS = Counter("db_pool_checkouts_total", "Connections checked out of the pool")
+DB_CONNECTION_HELD_SECONDS = Histogram(
+    "db_pool_connection_held_seconds", "Time a connection stays checked out of the pool"
+)
+OPEN_LIBRARY_SECONDS = Histogram(
+    "open_library_request_duration_seconds", "Open Library API call latency", ["endpoint"]
+)
+OPEN_LIBRARY_REQUESTS = Counter(
+    "open_library_requests_total", "Open Library API calls by outcome (ok, http_4xx, http_5xx, error)",
+    ["endpoint", "outcome"]
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_duration_seconds", "Time spent hashing or verifying a password", ["operation"], HASH_BUCKETS
+)
+
+
+class MetricsMiddleware:
+    """Times every HTTP request and labels it with the route that served it"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            # The router records the matched route in the shared scope
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, scope["method"], template, str(status))
+
+
+_engines: List = []
+_STATEMENTS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+
+def _statement_kind(statement: str) -> str:
+    words = statement[:16].split(None, 1)
+    kind = words[0].upper() if words else ""
+    return kind if kind in _STATEMENTS else "OTHER"
+
+
+def instrument_engine(engine):
+    """Time queries and pool checkouts of a SQLAlchemy engine"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            DB_QUERY_SECONDS.observe(elapsed, _statement_kind(statement))
+            record_span("sql", statement, elapsed)
+
+    @event.listens_for(engine.pool, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["metrics_checked_out"] = time.perf_counter()
+        DB_CHECKOUTS.inc()
+
+    @event.listens_for(engine.pool, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop("metrics_checked_out", None)
+        if started is not None:
+            DB_CONNECTION_HELD_SECONDS.observe(time.perf_counter() - started)
+
+    _engines.append(engine)
+
+
+@collector
+def _pool_metrics():
+    checked_out: Samples = []
+    idle: Samples = []
+    overflow: Samples = []
+    for engine in _engines:
+        pool = engine.pool
+        # Only queue pools report sizes
+        if hasattr(pool, "checkedout"):
+            labels = {"pool": type(pool).__name__}
+            checked_out.append((labels, pool.checkedout()))
+            idle.append((labels, pool.checkedin()))
+            overflow.append((labels, max(pool.overflow(), 0)))
+    return [
+        ("db_pool_checked_out", "gauge", "Connections currently checked out", checked_out),
+        ("db_pool_idle", "gauge", "Connections idle in the pool", idle),
+        ("db_pool_overflow", "gauge", "Connections open beyond the pool size", overflow),
+    ]
+
+
+@collector
+def _cache_metrics():
+    from utils.cache import cache_stats
+
+    families = {
+        "cache_hits_total": ("counter", "Cache lookups that found a value", []),
+        "cache_misses_total": ("counter", "Cache lookups that found nothing", []),
+        "cache_errors_total": ("counter", "Cache backend errors", []),
+        "cache_hit_ratio": ("gauge", "Hits over lookups since start", []),
+        "cache_backend_size_bytes": ("gauge", "Bytes stored by a cache backend", []),
+        "cache_backend_evictions_total": ("counter", "Entries evicted by a cache backend", []),
+    }
+    for name, stats in cache_stats().items():
+        if name.startswith("backend:"):
+            labels = {"backend": name[len("backend:"):]}
+            if stats["size_bytes"] is not None:
+                families["cache_backend_size_bytes"][2].append((labels, stats["size_bytes"]))
+            if stats["evictions"] is not None:
+                families["cache_backend_evictions_total"][2].append((labels, stats["evictions"]))
+            continue
+        labels = {"namespace": name}
+        families["cache_hits_total"][2].append((labels, stats["hits"]))
+        families["cache_misses_total"][2].append((labels, stats["misses"]))
+        families["cache_errors_total"][2].append((labels, stats["errors"]))
+        families["cache_hit_ratio"][2].append((labels, stats["hit_rate"]))
+    return [(name, kind, documentation, samples) for name, (kind, documentation, samples) in families.items()]
+
+
+@collector
+def _event_metrics():
+    # Only when the events router has been loaded in this process
+    events = sys.modules.get("utils.events")
+    if events is None:
+        return []
+    return [("events_connections", "gauge", "Open event streams on this worker",
+             [({}, events.broker.connection_count())])]
+
+
+def render_metrics() -> str:
+    """Every metric in the text exposition format"""
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    for function in _collectors:
+        try:
+            families = list(function())
+        except Exception as e:
+            print(f"Metrics collector error: {e}")
+            continue
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(sorted(labels.items()))} {_number(value)}")
+    return "\n".join(lines) + "\n"
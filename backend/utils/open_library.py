@@ -1,9 +1,58 @@
 """Open Library API integration"""
-import requests
+import time
 from typing import Optional, Dict, List
 
+from utils.cache import get_cache
+from utils.metrics import OPEN_LIBRARY_REQUESTS, OPEN_LIBRARY_SECONDS
+from utils.profiling import record_span
+
 OPEN_LIBRARY_API_BASE = "https://openlibrary.org"
 
+# Search results drift as the catalogue changes; work records almost never do
+SEARCH_CACHE_TTL = 60 * 60
+DETAILS_CACHE_TTL = 7 * 24 * 60 * 60
+
+_cache = get_cache("open_library")
+
+
+def _get(url: str, endpoint: str, **kwargs):
+    """GET from Open Library, timed per endpoint; requests is imported on the first cache miss"""
+    import requests
+
+    outcome = "error"
+    started = time.perf_counter()
+    try:
+        response = requests.get(url, timeout=10, **kwargs)
+        outcome = "ok" if response.ok else f"http_{response.status_code // 100}xx"
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        OPEN_LIBRARY_SECONDS.observe(elapsed, endpoint)
+        OPEN_LIBRARY_REQUESTS.inc(endpoint, outcome)
+        record_span("open_library", f"GET {url} ({outcome})", elapsed)
+
+
+def _book_from_search_doc(doc: Dict) -> Dict:
+    """Convert a search.json document into our book dictionary"""
+    book = {
+        "open_library_id": doc.get("key", "").replace("/works/", ""),
+        "title": doc.get("title", "Unknown Title"),
+        "author": ", ".join(doc.get("author_name", ["Unknown Author"])),
+        "isbn": doc.get("isbn", [None])[0] if doc.get("isbn") else None,
+        "published_year": doc.get("first_publish_year"),
+        "cover_image_url": None
+    }
+    
+    # Get cover image if available
+    if doc.get("cover_i"):
+        book["cover_image_url"] = f"https://covers.openlibrary.org/b/id/{doc['cover_i']}-L.jpg"
+    elif doc.get("isbn"):
+        isbn = doc.get("isbn", [None])[0]
+        if isbn:
+            book["cover_image_url"] = f"https://covers.openlibrary.org/b/isbn/{isbn}-L.jpg"
+    
+    return book
+
 
 def search_books(query: str, limit: int = 20) -> List[Dict]:
     """
@@ -16,37 +65,24 @@ def search_books(query: str, limit: int = 20) -> List[Dict]:
     Returns:
         List of book dictionaries with relevant information
     """
+    cache_key = f"search:{limit}:{query.strip().lower()}"
+    cached = _cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
         url = f"{OPEN_LIBRARY_API_BASE}/search.json"
         params = {
             "q": query,
             "limit": limit
         }
-        response = requests.get(url, params=params, timeout=10)
+        response = _get(url, "search", params=params)
         response.raise_for_status()
         data = response.json()
         
-        books = []
-        for doc in data.get("docs", []):
-            book = {
-                "open_library_id": doc.get("key", "").replace("/works/", ""),
-                "title": doc.get("title", "Unknown Title"),
-                "author": ", ".join(doc.get("author_name", ["Unknown Author"])),
-                "isbn": doc.get("isbn", [None])[0] if doc.get("isbn") else None,
-                "published_year": doc.get("first_publish_year"),
-                "cover_image_url": None
-            }
-            
-            # Get cover image if available
-            if doc.get("cover_i"):
-                book["cover_image_url"] = f"https://covers.openlibrary.org/b/id/{doc['cover_i']}-L.jpg"
-            elif doc.get("isbn"):
-                isbn = doc.get("isbn", [None])[0]
-                if isbn:
-                    book["cover_image_url"] = f"https://covers.openlibrary.org/b/isbn/{isbn}-L.jpg"
-            
-            books.append(book)
+        books = [_book_from_search_doc(doc) for doc in data.get("docs", [])]
         
+        _cache.set(cache_key, books, ttl=SEARCH_CACHE_TTL)
         return books
     except Exception as e:
         print(f"Error searching books: {e}")
@@ -63,9 +99,14 @@ def get_book_details(open_library_id: str) -> Optional[Dict]:
     Returns:
         Dictionary with book details or None if not found
     """
+    cache_key = f"work:{open_library_id}"
+    cached = _cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
         url = f"{OPEN_LIBRARY_API_BASE}/works/{open_library_id}.json"
-        response = requests.get(url, timeout=10)
+        response = _get(url, "works")
         response.raise_for_status()
         data = response.json()
         
@@ -89,8 +130,52 @@ def get_book_details(open_library_id: str) -> Optional[Dict]:
         if book["isbn"]:
             book["cover_image_url"] = f"https://covers.openlibrary.org/b/isbn/{book['isbn']}-L.jpg"
         
+        _cache.set(cache_key, book, ttl=DETAILS_CACHE_TTL)
         return book
     except Exception as e:
         print(f"Error getting book details: {e}")
         return None
 
+
+
+def find_book(isbn: Optional[str] = None, title: Optional[str] = None, author: Optional[str] = None) -> Optional[Dict]:
+    """
+    Find the single best matching work by ISBN, or by title and author
+    
+    Args:
+        isbn: ISBN-10 or ISBN-13, tried first when given
+        title: Title to match when there is no ISBN
+        author: Optional author to narrow a title match
+    
+    Returns:
+        Book dictionary in the same shape as search_books results, or None
+    """
+    if isbn:
+        params = {"isbn": isbn}
+    elif title:
+        params = {"title": title}
+        if author:
+            params["author"] = author
+    else:
+        return None
+    
+    cache_key = "find:" + "&".join(f"{k}={v.strip().lower()}" for k, v in sorted(params.items()))
+    cached = _cache.get(cache_key)
+    if cached is not None:
+        return cached or None
+    
+    try:
+        url = f"{OPEN_LIBRARY_API_BASE}/search.json"
+        response = _get(url, "search", params={**params, "limit": 1})
+        response.raise_for_status()
+        docs = response.json().get("docs", [])
+        book = _book_from_search_doc(docs[0]) if docs else None
+        if book and isbn:
+            book["isbn"] = isbn
+        
+        # Remember misses too (as an empty dict) so re-imports don't retry them
+        _cache.set(cache_key, book or {}, ttl=SEARCH_CACHE_TTL)
+        return book
+    except Exception as e:
+        print(f"Error finding book: {e}")
+        return None
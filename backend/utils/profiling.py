@@ -0,0 +1,393 @@
+"""On-demand profiling of single requests
+
+A request is profiled when it carries a valid ``X-Profile`` header (an
+expiry time signed with PROFILE_SECRET, made with ``python -m
+utils.profiling --sign``) or is picked at random with probability
+PROFILE_SAMPLE_RATE. Nothing is profiled, and the middleware isn't even
+installed, unless PROFILE_SECRET is set.
+
+While a profiled request runs, a sampler thread records the Python stack
+of every thread working on it every PROFILE_INTERVAL_MS: the event loop
+while the request's task is the one running, and the threadpool workers
+running its sync dependencies and endpoint (found through the context
+anyio runs them in). SQL statements and Open Library calls made under the
+request are recorded with their timings.
+
+The result is kept in the ``request_profiles`` cache namespace (shared by
+all instances with the redis backend) as a speedscope file, a collapsed
+stack file for flamegraph.pl and a JSON summary, listed and downloaded
+through ``/api/profiles``. The response carries the id in ``X-Profile-Id``.
+
+Usage:
+    python -m utils.profiling                     # list recent profiles
+    python -m utils.profiling --sign              # X-Profile value valid for 15 minutes
+    python -m utils.profiling --sign --minutes 60
+"""
+import argparse
+import asyncio
+import contextvars
+import hashlib
+import hmac
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from utils.cache import get_cache
+
+PROFILE_SECRET = os.getenv("PROFILE_SECRET", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "2"))
+PROFILE_TTL = int(os.getenv("PROFILE_TTL", str(24 * 60 * 60)))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+# Sampling stops after this long, so a profiled event stream can't grow forever
+PROFILE_MAX_SECONDS = 30
+PROFILE_HEADER = b"x-profile"
+MAX_SPANS = 1000
+MAX_SPAN_TEXT = 500
+# Each profile's summary is its own key, so concurrent requests can't drop each other's
+SUMMARY_PREFIX = "summary:"
+
+PROFILING_ENABLED = bool(PROFILE_SECRET)
+
+_profiles_cache = get_cache("request_profiles", default_ttl=PROFILE_TTL)
+_current: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar(
+    "current_profile", default=None
+)
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_STDLIB_DIR = os.path.dirname(os.__file__)
+# A threadpool worker in these is between jobs, still holding its last job's context
+_IDLE_WORKER_CODE = {queue.Queue.get.__code__, queue.Queue.task_done.__code__}
+
+
+def sign_profile_header(minutes: float = 15) -> str:
+    """An X-Profile value that is accepted until it expires"""
+    expires = str(int(time.time() + minutes * 60))
+    signature = hmac.new(PROFILE_SECRET.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+
+def _valid_signature(value: str) -> bool:
+    expires, _, signature = value.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    expected = hmac.new(PROFILE_SECRET.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature, expected)
+
+
+def record_span(kind: str, detail: str, seconds: float):
+    """Note a timed SQL statement or upstream call against the current profile, if any"""
+    profile = _current.get()
+    if profile is not None and len(profile.spans) < MAX_SPANS:
+        end = time.perf_counter() - profile.started
+        profile.spans.append((kind, detail[:MAX_SPAN_TEXT], max(end - seconds, 0.0), seconds))
+
+
+_labels: Dict[object, Tuple[str, str, int]] = {}
+
+
+def _frame_label(code) -> Tuple[str, str, int]:
+    """(name, file, line) of a code object, with paths shortened"""
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if "site-packages" + os.sep in filename:
+            filename = filename.split("site-packages" + os.sep, 1)[1]
+        elif filename.startswith(_BACKEND_DIR + os.sep):
+            filename = filename[len(_BACKEND_DIR) + 1:]
+        elif filename.startswith(_STDLIB_DIR + os.sep):
+            filename = filename[len(_STDLIB_DIR) + 1:]
+        label = _labels[code] = (code.co_name, filename, code.co_firstlineno)
+    return label
+
+
+def _worker_run_code():
+    # Where anyio's threadpool workers call context.run(func); private, so optional
+    try:
+        from anyio._backends._asyncio import WorkerThread
+        return WorkerThread.run.__code__
+    except Exception:
+        return None
+
+
+class RequestProfile:
+    """Stack samples and timed spans of one request"""
+
+    def __init__(self, method: str, path: str, task: Optional[asyncio.Task]):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.status: Optional[int] = None
+        self.created_at = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.task = task
+        self.loop_thread = threading.get_ident()
+        self.loop = task.get_loop() if task is not None else None
+        # (stack from root to leaf, seconds) pairs in the order taken
+        self.samples: List[Tuple[tuple, float]] = []
+        self.spans: List[Tuple[str, str, float, float]] = []
+
+    def _stack(self, thread_id: int, frame, worker_code) -> Optional[tuple]:
+        """The thread's stack if it is working on this request, else None"""
+        stack = []
+        if thread_id == self.loop_thread:
+            if self.loop is None or asyncio.current_task(self.loop) is not self.task:
+                return None
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+        else:
+            child = None
+            while frame is not None and frame.f_code is not worker_code:
+                stack.append(_frame_label(frame.f_code))
+                child = frame.f_code
+                frame = frame.f_back
+            if frame is None or child is None or child in _IDLE_WORKER_CODE:
+                return None
+            context = frame.f_locals.get("context")
+            if context is None or context.get(_current) is not self:
+                return None
+        stack.reverse()
+        return tuple(stack)
+
+    def sample(self, frames: Dict[int, object], weight: float, worker_code) -> bool:
+        """Record this round's stacks; False once PROFILE_MAX_SECONDS have passed"""
+        if time.perf_counter() - self.started > PROFILE_MAX_SECONDS:
+            return False
+        for thread_id, frame in frames.items():
+            stack = self._stack(thread_id, frame, worker_code)
+            if stack:
+                self.samples.append((stack, weight))
+        return True
+
+    def summary(self) -> Dict:
+        sql = [span for span in self.spans if span[0] == "sql"]
+        upstream = [span for span in self.spans if span[0] == "open_library"]
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 2),
+            "samples": len(self.samples),
+            "sql_statements": len(sql),
+            "sql_ms": round(sum(span[3] for span in sql) * 1000, 2),
+            "open_library_calls": len(upstream),
+            "open_library_ms": round(sum(span[3] for span in upstream) * 1000, 2),
+        }
+
+    def details(self) -> Dict:
+        return {
+            **self.summary(),
+            "spans": [
+                {
+                    "kind": kind,
+                    "detail": detail,
+                    "start_ms": round(start * 1000, 3),
+                    "duration_ms": round(seconds * 1000, 3)
+                }
+                for kind, detail, start, seconds in self.spans
+            ]
+        }
+
+    def collapsed(self) -> str:
+        """Folded stacks, one "root;...;leaf milliseconds" line each"""
+        weights: Counter = Counter()
+        for stack, weight in self.samples:
+            weights[stack] += weight
+        return "".join(
+            ";".join(f"{name} ({filename}:{line})" for name, filename, line in stack)
+            + f" {max(round(weight * 1000), 1)}\n"
+            for stack, weight in weights.most_common()
+        )
+
+    def speedscope(self) -> Dict:
+        """speedscope file: sampled stacks, and SQL and Open Library spans on a timeline"""
+        frames: List[Dict] = []
+        index: Dict[tuple, int] = {}
+
+        def frame_index(label: tuple) -> int:
+            if label not in index:
+                index[label] = len(frames)
+                name, filename, line = label
+                frames.append({"name": name, "file": filename, "line": line})
+            return index[label]
+
+        samples = [[frame_index(label) for label in stack] for stack, _ in self.samples]
+        weights = [round(weight * 1000, 3) for _, weight in self.samples]
+
+        events = []
+        last_end = 0.0
+        for kind, detail, start, seconds in sorted(self.spans, key=lambda span: span[2]):
+            # Spans must not overlap on an evented timeline
+            start = max(start, last_end)
+            end = max(start + seconds, start)
+            frame = frame_index((f"{kind}: {detail}", kind, 0))
+            events.append({"type": "O", "frame": frame, "at": round(start * 1000, 3)})
+            events.append({"type": "C", "frame": frame, "at": round(end * 1000, 3)})
+            last_end = end
+
+        name = f"{self.method} {self.path}"
+        duration_ms = round(self.duration * 1000, 3)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "blueberrybooks",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": f"{name} (stacks)",
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": round(sum(weights), 3),
+                    "samples": samples,
+                    "weights": weights
+                },
+                {
+                    "type": "evented",
+                    "name": f"{name} (SQL and Open Library)",
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": max(duration_ms, events[-1]["at"] if events else 0),
+                    "events": events
+                }
+            ]
+        }
+
+
+class Sampler:
+    """Thread that samples the stacks of active profiles; runs only while there are any"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._profiles: List[RequestProfile] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, profile: RequestProfile):
+        with self._lock:
+            self._profiles.append(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+
+    def remove(self, profile: RequestProfile):
+        with self._lock:
+            # Already gone if it ran past PROFILE_MAX_SECONDS
+            if profile in self._profiles:
+                self._profiles.remove(profile)
+
+    def _run(self):
+        worker_code = _worker_run_code()
+        own_thread = threading.get_ident()
+        last = time.perf_counter()
+        while True:
+            with self._lock:
+                profiles = list(self._profiles)
+                if not profiles:
+                    self._thread = None
+                    return
+            now = time.perf_counter()
+            frames = sys._current_frames()
+            frames.pop(own_thread, None)
+            finished = [profile for profile in profiles if not profile.sample(frames, now - last, worker_code)]
+            last = now
+            del frames
+            for profile in finished:
+                self.remove(profile)
+            time.sleep(self.interval)
+
+
+_sampler = Sampler(PROFILE_INTERVAL_MS / 1000)
+
+
+def store_profile(profile: RequestProfile):
+    """Save a finished profile; its summary is written last so it is only listed once complete"""
+    try:
+        _profiles_cache.set_many({
+            f"{profile.id}:details": profile.details(),
+            f"{profile.id}:speedscope": profile.speedscope(),
+            f"{profile.id}:collapsed": profile.collapsed(),
+        })
+        _profiles_cache.set(SUMMARY_PREFIX + profile.id, profile.summary())
+    except Exception as e:
+        print(f"Error storing profile {profile.id}: {e}")
+
+
+def list_profiles() -> List[Dict]:
+    """Summaries of the most recent profiles, newest first"""
+    summaries = _profiles_cache.get_many(_profiles_cache.keys(SUMMARY_PREFIX)).values()
+    return sorted(summaries, key=lambda summary: summary["created_at"], reverse=True)[:PROFILE_KEEP]
+
+
+def get_profile(profile_id: str, kind: str):
+    """A stored profile as details, speedscope or collapsed; None if gone"""
+    return _profiles_cache.get(f"{profile_id}:{kind}")
+
+
+def _wants_profile(scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            return _valid_signature(value.decode("latin-1"))
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class ProfilingMiddleware:
+    """Profiles requests that ask for it with a signed header, or a random sample"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"], asyncio.current_task())
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message = {
+                    **message,
+                    "headers": list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]
+                }
+            await send(message)
+
+        token = _current.set(profile)
+        _sampler.add(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _sampler.remove(profile)
+            _current.reset(token)
+            profile.duration = time.perf_counter() - profile.started
+            # Off the event loop: the cache may be a network round trip away
+            await asyncio.get_running_loop().run_in_executor(None, store_profile, profile)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Request profiling helpers")
+    parser.add_argument("--sign", action="store_true", help="print an X-Profile header value")
+    parser.add_argument("--minutes", type=float, default=15, help="how long a signed header stays valid")
+    args = parser.parse_args()
+
+    if not PROFILE_SECRET:
+        print("PROFILE_SECRET is not set; profiling is disabled")
+        sys.exit(1)
+    if args.sign:
+        print(f"X-Profile: {sign_profile_header(args.minutes)}")
+    else:
+        for entry in list_profiles():
+            print(f"{entry['id']}  {entry['created_at']}  {entry['method']} {entry['path']}  "
+                  f"{entry['status']}  {entry['duration_ms']} ms")
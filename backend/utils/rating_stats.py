@@ -0,0 +1,121 @@
+"""Materialized per-book rating aggregates
+
+book_rating_stats holds each book's rating count, sum and 1-5 histogram.
+Every rating write reports what it changed and the book's row is adjusted
+by the difference in the same transaction, so reads are a primary key
+lookup instead of an aggregate over ratings.
+
+Usage (recompute everything from the ratings table):
+    python -m utils.rating_stats
+    python -m utils.jobs --enqueue rating_stats.rebuild   # in the background
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.orm import Session
+
+from models.models import BookRatingStats, Rating
+from utils.bulk import _dialect_insert
+from utils.jobs import job_handler
+
+HISTOGRAM_COLUMNS = {value: f"count_{value}" for value in range(1, 6)}
+STAT_COLUMNS = ["rating_count", "rating_sum"] + list(HISTOGRAM_COLUMNS.values())
+
+
+def current_ratings(db: Session, user_id: int, book_ids: Iterable[int]) -> Dict[int, int]:
+    """Map book id to the user's existing rating, for writers about to upsert"""
+    book_ids = list(book_ids)
+    if not book_ids:
+        return {}
+    return dict(db.query(Rating.book_id, Rating.rating).filter(
+        Rating.user_id == user_id,
+        Rating.book_id.in_(book_ids)
+    ))
+
+
+def apply_rating_changes(db: Session, changes: Iterable[Tuple[int, Optional[int], Optional[int]]]):
+    """
+    Adjust stats for a set of rating writes
+
+    Args:
+        changes: (book_id, old_rating, new_rating) tuples; old_rating is None
+            for a new rating and new_rating is None for a deleted one
+    """
+    deltas = {}
+    for book_id, old, new in changes:
+        if old == new:
+            continue
+        delta = deltas.setdefault(book_id, dict.fromkeys(STAT_COLUMNS, 0))
+        if old is not None:
+            delta["rating_count"] -= 1
+            delta["rating_sum"] -= old
+            delta[HISTOGRAM_COLUMNS[old]] -= 1
+        if new is not None:
+            delta["rating_count"] += 1
+            delta["rating_sum"] += new
+            delta[HISTOGRAM_COLUMNS[new]] += 1
+    if not deltas:
+        return
+
+    # Adding to the stored values in SQL keeps concurrent writers from
+    # overwriting each other's changes
+    stmt = _dialect_insert(db)(BookRatingStats)
+    values = {column: getattr(BookRatingStats, column) + stmt.excluded[column] for column in STAT_COLUMNS}
+    values["updated_at"] = func.now()
+    stmt = stmt.on_conflict_do_update(index_elements=["book_id"], set_=values)
+    db.execute(stmt, [{"book_id": book_id, **delta} for book_id, delta in deltas.items()])
+
+
+def serialize_stats(stats: Optional[BookRatingStats]) -> dict:
+    """Count, average and histogram for a stats row, or empty stats for None"""
+    count = stats.rating_count if stats else 0
+    return {
+        "count": count,
+        "average": round(stats.rating_sum / count, 2) if count else None,
+        "histogram": {
+            value: getattr(stats, column) if stats else 0
+            for value, column in HISTOGRAM_COLUMNS.items()
+        }
+    }
+
+
+def get_rating_stats(db: Session, book_ids: List[int]) -> Dict[int, dict]:
+    """Serialized stats for each of book_ids, including books with no ratings"""
+    if not book_ids:
+        return {}
+    rows = {
+        stats.book_id: stats
+        for stats in db.query(BookRatingStats).filter(BookRatingStats.book_id.in_(book_ids))
+    }
+    return {book_id: serialize_stats(rows.get(book_id)) for book_id in book_ids}
+
+
+@job_handler("rating_stats.rebuild")
+def rebuild_rating_stats(db: Session) -> int:
+    """
+    Recompute every book's stats from the ratings table
+
+    Returns:
+        Number of books with ratings
+    """
+    aggregates = select(
+        Rating.book_id,
+        func.count(Rating.id),
+        func.sum(Rating.rating),
+        *[func.sum(case((Rating.rating == value, 1), else_=0)) for value in HISTOGRAM_COLUMNS]
+    ).group_by(Rating.book_id)
+
+    db.query(BookRatingStats).delete()
+    result = db.execute(insert(BookRatingStats).from_select(["book_id"] + STAT_COLUMNS, aggregates))
+    db.commit()
+    return result.rowcount
+
+
+if __name__ == "__main__":
+    from models.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(f"Rebuilt rating stats for {rebuild_rating_stats(db)} books")
+    finally:
+        db.close()
@@ -0,0 +1,219 @@
+"""Per-user reading statistics
+
+Books read per year and month, rating distribution, reading streaks, top
+authors and diary word counts. Every figure comes from a grouped aggregate
+in SQL, so only a few hundred summary rows leave the database however long
+a user's history is.
+
+Results are cached per data_version, which every rating, diary and
+read-book write for the user bumps in the same transaction. Reads between
+writes are a single cache lookup; the first read after a write recomputes.
+"""
+import math
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, extract, func, union
+from sqlalchemy.orm import Session
+
+from models.models import Book, DiaryEntry, Rating, ReadBook, User
+from utils.cache import get_cache
+from utils.response_cache import RESPONSE_CACHE_TTL
+
+TOP_AUTHORS = 10
+
+_stats_cache = get_cache("reading_stats", default_ttl=RESPONSE_CACHE_TTL)
+
+
+def _as_date(value) -> date:
+    # func.date() gives a date on PostgreSQL and an ISO string on SQLite
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def _word_count(column):
+    """Whitespace-separated words in a text column, counted in SQL"""
+    text = column
+    for separator in ("\r", "\n", "\t"):
+        text = func.replace(text, separator, " ")
+    # Collapse runs of any length to one space: each space becomes a marker
+    # pair, the pairs in a run merge into one, and that one becomes a space
+    text = func.replace(text, " ", "\x01\x02")
+    text = func.replace(text, "\x02\x01", "")
+    text = func.replace(text, "\x01\x02", " ")
+    text = func.trim(text)
+    return case(
+        (func.length(text) == 0, 0),
+        else_=func.length(text) - func.length(func.replace(text, " ", "")) + 1
+    )
+
+
+def rating_distribution(histogram: Dict[int, int]) -> Dict:
+    """Count, mean, median and standard deviation of a 1-5 histogram"""
+    count = sum(histogram.values())
+    if not count:
+        return {"count": 0, "average": None, "median": None, "stdev": None, "histogram": histogram}
+
+    mean = sum(value * n for value, n in histogram.items()) / count
+    variance = sum(n * (value - mean) ** 2 for value, n in histogram.items()) / count
+
+    # Middle value(s) of the sorted ratings, read off the cumulative counts
+    def nth(position: int) -> int:
+        seen = 0
+        for value in sorted(histogram):
+            seen += histogram[value]
+            if seen > position:
+                return value
+        return max(histogram)
+
+    median = (nth((count - 1) // 2) + nth(count // 2)) / 2
+    return {
+        "count": count,
+        "average": round(mean, 2),
+        "median": median,
+        "stdev": round(math.sqrt(variance), 2),
+        "histogram": histogram
+    }
+
+
+def _longest_run(values: List[int]) -> Tuple[int, Optional[int], Optional[int]]:
+    """Longest run of consecutive integers in a sorted list: (length, first, last)"""
+    best = (0, None, None)
+    start = None
+    for index, value in enumerate(values):
+        if index == 0 or value != values[index - 1] + 1:
+            start = value
+        length = value - start + 1
+        if length > best[0]:
+            best = (length, start, value)
+    return best
+
+
+def _longest_run_start(ordinals: List[int]) -> int:
+    """First value of the run ending at the last element"""
+    start = len(ordinals) - 1
+    while start > 0 and ordinals[start - 1] == ordinals[start] - 1:
+        start -= 1
+    return ordinals[start]
+
+
+def _streaks(days: List[date], today: date) -> Dict:
+    """Longest and current runs of consecutive days, and longest run of months"""
+    ordinals = [day.toordinal() for day in days]
+    length, first, last = _longest_run(ordinals)
+
+    current = 0
+    if ordinals and ordinals[-1] >= today.toordinal() - 1:
+        current = ordinals[-1] - _longest_run_start(ordinals) + 1
+
+    months = sorted({day.year * 12 + day.month - 1 for day in days})
+    month_length, first_month, last_month = _longest_run(months)
+
+    def month_label(index: Optional[int]) -> Optional[str]:
+        return None if index is None else f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+    return {
+        "longest_days": length,
+        "longest_days_start": date.fromordinal(first) if first is not None else None,
+        "longest_days_end": date.fromordinal(last) if last is not None else None,
+        "current_days": current,
+        "longest_months": month_length,
+        "longest_months_start": month_label(first_month),
+        "longest_months_end": month_label(last_month)
+    }
+
+
+def compute_reading_stats(db: Session, user_id: int, today: Optional[date] = None) -> Dict:
+    """Aggregate a user's full reading history"""
+    read_year = extract("year", ReadBook.read_at)
+    read_month = extract("month", ReadBook.read_at)
+    by_month = db.query(read_year, read_month, func.count(ReadBook.id)).filter(
+        ReadBook.user_id == user_id,
+        ReadBook.read_at.isnot(None)
+    ).group_by(read_year, read_month).order_by(read_year, read_month).all()
+
+    read_by_year: Dict[int, int] = {}
+    for year, month, count in by_month:
+        read_by_year[int(year)] = read_by_year.get(int(year), 0) + count
+
+    histogram = dict.fromkeys(range(1, 6), 0)
+    for value, count in db.query(Rating.rating, func.count(Rating.id)).filter(
+        Rating.user_id == user_id
+    ).group_by(Rating.rating):
+        histogram[value] = count
+
+    # A day counts towards a streak if a book was finished or a diary entry written
+    active_days = union(
+        db.query(func.date(ReadBook.read_at).label("day")).filter(
+            ReadBook.user_id == user_id, ReadBook.read_at.isnot(None)
+        ).statement,
+        db.query(func.date(DiaryEntry.created_at).label("day")).filter(
+            DiaryEntry.user_id == user_id, DiaryEntry.created_at.isnot(None)
+        ).statement
+    ).subquery()
+    days = sorted(_as_date(day) for (day,) in db.query(active_days.c.day))
+
+    author_rating = func.avg(Rating.rating)
+    top_authors = db.query(
+        Book.author,
+        func.count(ReadBook.id).label("books_read"),
+        author_rating.label("average_rating")
+    ).join(ReadBook, ReadBook.book_id == Book.id).outerjoin(
+        Rating, (Rating.book_id == Book.id) & (Rating.user_id == user_id)
+    ).filter(
+        ReadBook.user_id == user_id,
+        Book.author.isnot(None),
+        Book.author != ""
+    ).group_by(Book.author).order_by(
+        func.count(ReadBook.id).desc(), author_rating.desc(), Book.author
+    ).limit(TOP_AUTHORS).all()
+
+    words = _word_count(DiaryEntry.entry_text)
+    diary_year = extract("year", DiaryEntry.created_at)
+    diary_by_year = db.query(
+        diary_year,
+        func.count(DiaryEntry.id),
+        func.sum(words),
+        func.max(words)
+    ).filter(DiaryEntry.user_id == user_id).group_by(diary_year).order_by(diary_year).all()
+    entries = sum(count for _, count, _, _ in diary_by_year)
+    total_words = sum(int(total or 0) for _, _, total, _ in diary_by_year)
+
+    return {
+        "books_read": sum(read_by_year.values()),
+        "read_by_year": [{"year": year, "count": count} for year, count in sorted(read_by_year.items())],
+        "read_by_month": [
+            {"year": int(year), "month": int(month), "count": count} for year, month, count in by_month
+        ],
+        "ratings": rating_distribution(histogram),
+        "streaks": _streaks(days, today or date.today()),
+        "top_authors": [
+            {
+                "author": author,
+                "books_read": books_read,
+                "average_rating": round(float(average), 2) if average is not None else None
+            }
+            for author, books_read, average in top_authors
+        ],
+        "diary": {
+            "entries": entries,
+            "words": total_words,
+            "average_words": round(total_words / entries, 1) if entries else 0,
+            "longest_entry_words": max((int(longest or 0) for _, _, _, longest in diary_by_year), default=0),
+            "words_by_year": [
+                {"year": int(year), "entries": count, "words": int(total or 0)}
+                for year, count, total, _ in diary_by_year if year is not None
+            ]
+        }
+    }
+
+
+def get_reading_stats(db: Session, user: User) -> Dict:
+    """Cached stats for user's current data_version"""
+    # The current streak depends on today's date as well as the data
+    today = date.today()
+    cache_key = f"{user.id}:{user.data_version or 0}:{today.isoformat()}"
+    stats = _stats_cache.get(cache_key)
+    if stats is None:
+        stats = compute_reading_stats(db, user.id, today)
+        _stats_cache.set(cache_key, stats)
+    return stats
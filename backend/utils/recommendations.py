@@ -0,0 +1,107 @@
+"""Similar books and personal recommendations from precomputed neighbors
+
+Neighbor lists are built offline by ``utils.train_recommendations`` and
+stored packed in book_neighbors. Serving only decodes them and sums the
+neighbors of the books a user has read, so it needs no NumPy.
+"""
+import heapq
+import sys
+from array import array
+from typing import Dict, List, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.models import Book, BookNeighbors, Rating, ReadBook
+
+# Most recent books a user has rated or read that seed their recommendations
+MAX_SEEDS = 200
+
+
+def unpack_neighbors(blob: bytes) -> List[Tuple[int, float]]:
+    """Decode a packed neighbor list into (book_id, similarity) pairs"""
+    count = len(blob) // 8
+    ids = array("i")
+    ids.frombytes(blob[:count * 4])
+    scores = array("f")
+    scores.frombytes(blob[count * 4:])
+    if sys.byteorder == "big":
+        ids.byteswap()
+        scores.byteswap()
+    return list(zip(ids, scores))
+
+
+def _book_summaries(db: Session, book_ids: List[int]) -> Dict[int, dict]:
+    if not book_ids:
+        return {}
+    return {
+        book.id: {
+            "id": book.id,
+            "open_library_id": book.open_library_id,
+            "title": book.title,
+            "author": book.author,
+            "cover_image_url": book.cover_image_url
+        }
+        for book in db.query(Book).filter(Book.id.in_(book_ids))
+    }
+
+
+def similar_books(db: Session, book_id: int, limit: int = 10) -> List[Dict]:
+    """Books most similar to book_id, best first"""
+    row = db.get(BookNeighbors, book_id)
+    if row is None:
+        return []
+    neighbors = unpack_neighbors(row.neighbors)[:limit]
+    books = _book_summaries(db, [neighbor_id for neighbor_id, _ in neighbors])
+    return [
+        {"score": round(score, 4), "book": books[neighbor_id]}
+        for neighbor_id, score in neighbors if neighbor_id in books
+    ]
+
+
+def recommend_for_user(db: Session, user_id: int, limit: int = 20) -> List[Dict]:
+    """
+    Books the user hasn't read, scored by similarity to the ones they have
+
+    Each seed book's neighbors contribute similarity times a weight: 1 for a
+    read mark, more or less for ratings above or below the user's average,
+    so books like the ones they disliked sink.
+    """
+    ratings = dict(db.query(Rating.book_id, Rating.rating).filter(Rating.user_id == user_id))
+    read_ids = [book_id for (book_id,) in db.query(ReadBook.book_id).filter(ReadBook.user_id == user_id)]
+    seen = set(ratings) | set(read_ids)
+    if not seen:
+        return []
+
+    mean = sum(ratings.values()) / len(ratings) if ratings else 0
+    recent = db.query(Rating.book_id).filter(Rating.user_id == user_id).order_by(
+        func.coalesce(Rating.updated_at, Rating.created_at).desc()
+    ).limit(MAX_SEEDS).all()
+    seeds = {book_id: 1.0 + (ratings[book_id] - mean) / 2 for (book_id,) in recent}
+    for book_id in read_ids:
+        if len(seeds) >= MAX_SEEDS:
+            break
+        seeds.setdefault(book_id, 1.0)
+
+    scores = {}
+    because = {}
+    for row in db.query(BookNeighbors).filter(BookNeighbors.book_id.in_(seeds)):
+        weight = seeds[row.book_id]
+        for neighbor_id, similarity in unpack_neighbors(row.neighbors):
+            if neighbor_id in seen:
+                continue
+            contribution = similarity * weight
+            scores[neighbor_id] = scores.get(neighbor_id, 0.0) + contribution
+            if contribution > because.get(neighbor_id, (0.0, None))[0]:
+                because[neighbor_id] = (contribution, row.book_id)
+
+    top = heapq.nlargest(limit, ((score, book_id) for book_id, score in scores.items() if score > 0))
+    books = _book_summaries(db, [book_id for _, book_id in top])
+    return [
+        {
+            "score": round(score, 4),
+            "because_book_id": because[book_id][1],
+            "book": books[book_id]
+        }
+        for score, book_id in top if book_id in books
+    ]
@@ -0,0 +1,42 @@
+"""Per-user versioned response cache
+
+Cached responses are keyed by (user_id, endpoint, params, user_generation).
+The generation is the user's ``data_version`` column, which every write to
+that user's diary, ratings or read books bumps in the same transaction.
+Invalidation is therefore a single column increment: entries built for an
+older generation are never looked up again and age out of the backend.
+"""
+import os
+from typing import Any, Optional, Tuple
+
+from models.models import User
+from utils.cache import get_cache
+
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(24 * 60 * 60)))
+
+_cache = get_cache("responses", default_ttl=RESPONSE_CACHE_TTL)
+
+
+def _make_key(user: User, endpoint: str, params: Tuple) -> str:
+    return f"{user.id}:{endpoint}:{params!r}:{user.data_version or 0}"
+
+
+def get_cached_response(user: User, endpoint: str, params: Tuple = ()) -> Optional[Any]:
+    """Return the cached response for this user's current generation, if any"""
+    return _cache.get(_make_key(user, endpoint, params))
+
+
+def set_cached_response(user: User, endpoint: str, value: Any, params: Tuple = ()) -> None:
+    """Store a response for this user's current generation"""
+    _cache.set(_make_key(user, endpoint, params), value)
+
+
+def bump_user_generation(user: User) -> None:
+    """
+    Invalidate every cached response for a user
+
+    Must be called before the write is committed so the bump is part of the
+    same transaction. The increment is evaluated in SQL, so concurrent
+    writes for the same user never share a generation.
+    """
+    user.data_version = User.data_version + 1
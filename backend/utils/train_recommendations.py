@@ -0,0 +1,248 @@
+"""Offline training job for item-item recommendations
+
+Builds a sparse user x book matrix from ratings and read marks, computes
+each book's top-K most similar books by cosine or adjusted-cosine
+similarity over a process pool, and writes the packed lists to
+book_neighbors in one transaction.
+
+Needs NumPy and SciPy, which the API itself does not:
+    pip install numpy scipy
+
+Usage:
+    python -m utils.train_recommendations                 # full rebuild
+    python -m utils.train_recommendations --incremental   # books touched since the last run
+    python -m utils.train_recommendations --benchmark 1000000
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    print("ERROR: The recommendation job needs numpy and scipy (pip install numpy scipy)")
+    raise
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.models import BookNeighbors, Rating, ReadBook
+from utils.bulk import upsert_rows
+
+TOP_K = 50
+BLOCK_SIZE = 256
+WRITE_BATCH_SIZE = 1000
+
+# Matrix value for a book marked read but not rated. For adjusted cosine,
+# where ratings are centered on the user's mean, it is a mild positive.
+READ_VALUE = {"cosine": 3.0, "adjusted": 0.5}
+
+# Set in each worker process by _init_worker
+_items = None
+_matrix = None
+_k = TOP_K
+
+
+def load_interactions(db: Session) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """
+    Every (user, book) pair with its rating, NaN where only marked read
+
+    Returns:
+        user ids, book ids and ratings as parallel arrays
+    """
+    rated = np.array(db.query(Rating.user_id, Rating.book_id, Rating.rating).all(), dtype=np.int64).reshape(-1, 3)
+    read = np.array(db.query(ReadBook.user_id, ReadBook.book_id).all(), dtype=np.int64).reshape(-1, 2)
+
+    # Drop read marks for books the user also rated
+    width = int(max(rated[:, 1].max(initial=0), read[:, 1].max(initial=0))) + 1
+    read = read[~np.isin(read[:, 0] * width + read[:, 1], rated[:, 0] * width + rated[:, 1])]
+
+    users = np.concatenate([rated[:, 0], read[:, 0]])
+    books = np.concatenate([rated[:, 1], read[:, 1]])
+    ratings = np.concatenate([rated[:, 2].astype(np.float32), np.full(len(read), np.nan, dtype=np.float32)])
+    return users, books, ratings
+
+
+def build_matrix(users: "np.ndarray", books: "np.ndarray", ratings: "np.ndarray", similarity: str = "adjusted"):
+    """
+    Column-normalized user x book matrix
+
+    Returns:
+        (matrix, book_ids) where column i of the matrix is book_ids[i]
+    """
+    user_ids, user_index = np.unique(users, return_inverse=True)
+    book_ids, book_index = np.unique(books, return_inverse=True)
+
+    rated = ~np.isnan(ratings)
+    values = np.where(rated, ratings, READ_VALUE[similarity]).astype(np.float32)
+    if similarity == "adjusted":
+        totals = np.bincount(user_index[rated], weights=ratings[rated], minlength=len(user_ids))
+        counts = np.bincount(user_index[rated], minlength=len(user_ids))
+        means = np.divide(totals, counts, out=np.zeros(len(user_ids)), where=counts > 0)
+        values[rated] -= means[user_index[rated]].astype(np.float32)
+
+    matrix = sparse.csc_matrix((values, (user_index, book_index)), shape=(len(user_ids), len(book_ids)))
+    matrix.eliminate_zeros()
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return (matrix @ sparse.diags(scale.astype(np.float32))).tocsc(), book_ids
+
+
+def _init_worker(items, matrix, k):
+    global _items, _matrix, _k
+    _items, _matrix, _k = items, matrix, k
+
+
+def _top_k_block(rows: "np.ndarray") -> List[Tuple[int, "np.ndarray", "np.ndarray"]]:
+    """Top-k neighbor columns and similarities for a block of book columns"""
+    similarities = (_items[rows] @ _matrix).tocsr()
+    results = []
+    for offset, row in enumerate(rows):
+        start, end = similarities.indptr[offset], similarities.indptr[offset + 1]
+        columns = similarities.indices[start:end]
+        scores = similarities.data[start:end]
+        keep = (columns != row) & (scores > 0)
+        columns, scores = columns[keep], scores[keep]
+        if len(scores) > _k:
+            best = np.argpartition(-scores, _k)[:_k]
+            columns, scores = columns[best], scores[best]
+        order = np.argsort(-scores, kind="stable")
+        results.append((int(row), columns[order], scores[order]))
+    return results
+
+
+def compute_neighbors(matrix, rows: Optional["np.ndarray"] = None, k: int = TOP_K,
+                      workers: Optional[int] = None) -> List[Tuple[int, "np.ndarray", "np.ndarray"]]:
+    """
+    Top-k most similar columns for each of rows (default: every column)
+
+    Blocks of rows are spread over a process pool; with one worker they run
+    in this process.
+    """
+    if rows is None:
+        rows = np.arange(matrix.shape[1])
+    items = matrix.T.tocsr()
+    blocks = [rows[i:i + BLOCK_SIZE] for i in range(0, len(rows), BLOCK_SIZE)]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        _init_worker(items, matrix, k)
+        return [result for block in blocks for result in _top_k_block(block)]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(items, matrix, k)) as pool:
+        return [result for block_results in pool.map(_top_k_block, blocks) for result in block_results]
+
+
+def pack_neighbors(book_ids: "np.ndarray", scores: "np.ndarray") -> bytes:
+    """Inverse of utils.recommendations.unpack_neighbors"""
+    return book_ids.astype("<i4").tobytes() + scores.astype("<f4").tobytes()
+
+
+def store_neighbors(db: Session, book_ids: "np.ndarray", results, computed_at: datetime):
+    rows = [
+        {
+            "book_id": int(book_ids[row]),
+            "neighbors": pack_neighbors(book_ids[columns], scores),
+            "computed_at": computed_at
+        }
+        for row, columns, scores in results
+    ]
+    for start in range(0, len(rows), WRITE_BATCH_SIZE):
+        upsert_rows(db, BookNeighbors, rows[start:start + WRITE_BATCH_SIZE], ["book_id"],
+                    ["neighbors", "computed_at"], returning=[BookNeighbors.book_id])
+
+
+def _changed_users(db: Session, since: datetime) -> "np.ndarray":
+    rating_users = db.query(Rating.user_id).filter(func.coalesce(Rating.updated_at, Rating.created_at) > since)
+    read_users = db.query(ReadBook.user_id).filter(ReadBook.read_at > since)
+    return np.array([user_id for (user_id,) in rating_users.union(read_users)], dtype=np.int64)
+
+
+def train(db: Session, incremental: bool = False, similarity: str = "adjusted", k: int = TOP_K,
+          workers: Optional[int] = None) -> Dict:
+    """
+    Recompute neighbor lists and store them
+
+    A full run rebuilds every list and removes lists for books nobody has
+    read any more. An incremental run only recomputes books read or rated
+    by users with activity since the previous run; other lists keep their
+    slightly stale scores until the next full run, which also picks up
+    deleted ratings.
+    """
+    # Taken before reading so writes made during the run are seen next time
+    computed_at = datetime.now(timezone.utc)
+    since = db.query(func.max(BookNeighbors.computed_at)).scalar() if incremental else None
+
+    users, books, ratings = load_interactions(db)
+    if len(users) == 0:
+        return {"books": 0, "updated": 0}
+    matrix, book_ids = build_matrix(users, books, ratings, similarity)
+
+    rows = None
+    if since is not None:
+        touched_books = np.unique(books[np.isin(users, _changed_users(db, since))])
+        rows = np.searchsorted(book_ids, touched_books)
+
+    results = compute_neighbors(matrix, rows, k, workers)
+    store_neighbors(db, book_ids, results, computed_at)
+    if since is None:
+        db.query(BookNeighbors).filter(BookNeighbors.computed_at < computed_at).delete()
+    db.commit()
+    return {"books": len(book_ids), "updated": len(results)}
+
+
+def benchmark(n_ratings: int, similarity: str = "adjusted", k: int = TOP_K, workers: Optional[int] = None):
+    """Train on synthetic long-tailed ratings and report timings"""
+    rng = np.random.default_rng(42)
+    n_users, n_books = max(n_ratings // 40, 1), max(n_ratings // 25, 1)
+
+    # Zipf-like popularity for books and activity for users
+    book_weights = 1.0 / np.arange(1, n_books + 1) ** 0.8
+    user_weights = 1.0 / np.arange(1, n_users + 1) ** 0.5
+    users = rng.choice(n_users, size=n_ratings, p=user_weights / user_weights.sum())
+    books = rng.choice(n_books, size=n_ratings, p=book_weights / book_weights.sum())
+    _, unique = np.unique(users.astype(np.int64) * n_books + books, return_index=True)
+    users, books = users[unique], books[unique]
+    ratings = rng.integers(1, 6, size=len(users)).astype(np.float32)
+    ratings[rng.random(len(users)) < 0.2] = np.nan  # read but not rated
+
+    started = time.perf_counter()
+    matrix, book_ids = build_matrix(users, books, ratings, similarity)
+    built = time.perf_counter()
+    results = compute_neighbors(matrix, None, k, workers)
+    trained = time.perf_counter()
+    packed = sum(len(pack_neighbors(book_ids[columns], scores)) for _, columns, scores in results)
+
+    print(f"{len(users)} interactions, {matrix.shape[0]} users, {matrix.shape[1]} books")
+    print(f"Matrix built in {built - started:.2f}s")
+    print(f"Neighbors computed in {trained - built:.2f}s with {workers or os.cpu_count()} workers")
+    print(f"Packed neighbor lists: {packed / 1024 / 1024:.1f} MB ({packed / max(len(results), 1):.0f} bytes per book)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train item-item book recommendations")
+    parser.add_argument("--incremental", action="store_true", help="only recompute books touched since the last run")
+    parser.add_argument("--similarity", choices=sorted(READ_VALUE), default="adjusted")
+    parser.add_argument("--k", type=int, default=TOP_K, help="neighbors kept per book")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="train on N synthetic ratings instead of the database")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark, args.similarity, args.k, args.workers)
+        sys.exit(0)
+
+    from models.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        result = train(db, args.incremental, args.similarity, args.k, args.workers)
+        print(f"Updated neighbors for {result['updated']} of {result['books']} books")
+    finally:
+        db.close()
@@ -0,0 +1,162 @@
+"""Ranked username search and autocomplete
+
+Substring matching uses the indexes created by ``models.migrate_user_search``:
+a pg_trgm GIN index on PostgreSQL, an FTS5 trigram table on SQLite. Queries
+shorter than a trigram can only be prefix matches, which use the B-tree.
+
+Matches are ranked exact, then prefix, then substring; within each, people
+the viewer follows or who follow the viewer come first, then shorter names.
+
+Autocomplete can also be served from an in-memory sorted list of usernames
+(set USER_PREFIX_INDEX=1), rebuilt every USER_PREFIX_INDEX_TTL seconds. It
+only narrows prefixes matching at most PREFIX_CANDIDATES names; broader ones
+are ranked in SQL, so a followed user is never cut before ranking.
+"""
+import bisect
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, case, exists, func, text
+from sqlalchemy.orm import Session
+
+from models.models import Follow, User
+
+MIN_SUBSTRING_LENGTH = 3
+USE_PREFIX_INDEX = os.getenv("USER_PREFIX_INDEX", "0") == "1"
+USER_PREFIX_INDEX_TTL = int(os.getenv("USER_PREFIX_INDEX_TTL", "300"))
+# Most names a prefix may match in memory and still be ranked from that list
+PREFIX_CANDIDATES = 100
+# Seconds before a missing users_fts table is looked for again
+FTS_RECHECK_SECONDS = 60
+
+_sqlite_fts_available = False
+_sqlite_fts_checked_at = 0.0
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _has_sqlite_fts(db: Session) -> bool:
+    """Whether users_fts exists; a miss is rechecked, since the migration may run later"""
+    global _sqlite_fts_available, _sqlite_fts_checked_at
+    if not _sqlite_fts_available and time.monotonic() - _sqlite_fts_checked_at > FTS_RECHECK_SECONDS:
+        _sqlite_fts_available = db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'")
+        ).first() is not None
+        _sqlite_fts_checked_at = time.monotonic()
+    return _sqlite_fts_available
+
+
+def _match_filter(db: Session, query: str, prefix_only: bool):
+    """Indexed filter for usernames containing (or starting with) query"""
+    lowered = func.lower(User.username)
+    if prefix_only or len(query) < MIN_SUBSTRING_LENGTH:
+        return lowered.like(f"{_escape_like(query)}%", escape="\\")
+    if db.get_bind().dialect.name == "sqlite" and _has_sqlite_fts(db):
+        phrase = '"' + query.replace('"', '""') + '"'
+        return User.id.in_(text("SELECT rowid FROM users_fts WHERE users_fts MATCH :phrase").bindparams(phrase=phrase))
+    return lowered.like(f"%{_escape_like(query)}%", escape="\\")
+
+
+def _ranked(db: Session, viewer_id: int, query: str, match_filter, limit: int) -> List[Dict]:
+    lowered = func.lower(User.username)
+    match_rank = case(
+        (lowered == query, 0),
+        (lowered.like(f"{_escape_like(query)}%", escape="\\"), 1),
+        else_=2
+    )
+    is_following = exists().where(and_(Follow.follower_id == viewer_id, Follow.followed_id == User.id))
+    follows_you = exists().where(and_(Follow.follower_id == User.id, Follow.followed_id == viewer_id))
+    proximity = case((is_following, 0), (follows_you, 0), else_=1)
+
+    rows = db.query(
+        User.id,
+        User.username,
+        User.is_private,
+        is_following.label("is_following"),
+        follows_you.label("follows_you")
+    ).filter(
+        match_filter,
+        User.id != viewer_id,
+        User.deleted_at.is_(None)
+    ).order_by(
+        match_rank, proximity, func.length(User.username), User.username
+    ).limit(limit).all()
+
+    return [
+        {
+            "id": row.id,
+            "username": row.username,
+            "is_private": bool(row.is_private),
+            "is_following": bool(row.is_following),
+            "follows_you": bool(row.follows_you)
+        }
+        for row in rows
+    ]
+
+
+def search_users(db: Session, viewer_id: int, query: str, limit: int = 20) -> List[Dict]:
+    """Users whose name contains query, best matches first"""
+    query = query.strip().lower()
+    return _ranked(db, viewer_id, query, _match_filter(db, query, prefix_only=False), limit)
+
+
+class PrefixIndex:
+    """Sorted in-memory list of lowercased usernames for prefix lookups"""
+
+    def __init__(self):
+        self._names: List[str] = []
+        self._ids: List[int] = []
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self, db: Session):
+        rows = sorted((username.lower(), user_id) for user_id, username in db.query(User.id, User.username).filter(User.deleted_at.is_(None)))
+        with self._lock:
+            self._names = [name for name, _ in rows]
+            self._ids = [user_id for _, user_id in rows]
+            self._built_at = time.monotonic()
+
+    def add(self, username: str, user_id: int):
+        """Make a new user findable before the next rebuild"""
+        with self._lock:
+            position = bisect.bisect_left(self._names, username.lower())
+            self._names.insert(position, username.lower())
+            self._ids.insert(position, user_id)
+
+    def lookup(self, db: Session, prefix: str, limit: int) -> Optional[List[int]]:
+        """Ids of every name starting with prefix, or None if there are more than limit"""
+        if time.monotonic() - self._built_at > USER_PREFIX_INDEX_TTL:
+            self._refresh(db)
+        with self._lock:
+            start = bisect.bisect_left(self._names, prefix)
+            end = bisect.bisect_left(self._names, prefix + "\uffff", lo=start)
+            if end - start > limit:
+                return None
+            return self._ids[start:end]
+
+
+prefix_index = PrefixIndex() if USE_PREFIX_INDEX else None
+
+
+def autocomplete_users(db: Session, viewer_id: int, prefix: str, limit: int = 8) -> List[Dict]:
+    """Users whose name starts with prefix, ranked like search_users"""
+    prefix = prefix.strip().lower()
+    candidates = prefix_index.lookup(db, prefix, PREFIX_CANDIDATES) if prefix_index is not None else None
+    if candidates is not None:
+        if not candidates:
+            return []
+        match_filter = User.id.in_(candidates)
+    else:
+        # Too many matches to cut in memory without dropping better-ranked ones
+        match_filter = _match_filter(db, prefix, prefix_only=True)
+    return _ranked(db, viewer_id, prefix, match_filter, limit)
+
+
+def note_new_user(username: str, user_id: Optional[int]):
+    """Called on registration so autocomplete sees the user immediately"""
+    if prefix_index is not None and user_id is not None:
+        prefix_index.add(username, user_id)
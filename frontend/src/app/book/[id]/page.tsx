@@ -55,11 +55,6 @@ function BookDetailContent() {
     
     if (addResponse.data) {
       bookId = addResponse.data.book_id;
-      // Get the book details from our database
-      const bookResponse = await apiClient.getBook(bookId);
-      if (bookResponse.data) {
-        setBook(bookResponse.data);
-      }
     } else {
       // If add failed, try to find existing book by checking read books
       // This is a workaround - in production, you'd want a better search endpoint
@@ -75,30 +70,23 @@ function BookDetailContent() {
       }
     }
 
-    // Check if user has marked it as read
-    const readBooksResponse = await apiClient.getUserReadBooks();
-    if (readBooksResponse.data) {
-      const found = readBooksResponse.data.find(
-        (b) => b.open_library_id === openLibraryId
-      );
-      setIsRead(!!found);
-    }
-
-    // Check for existing diary entry and rating if we have a book ID
+    // Book, read status, diary entry and rating in a single request
     if (bookId) {
-      const [diaryResponse, ratingResponse] = await Promise.all([
-        apiClient.getDiaryEntry(bookId).catch(() => ({ data: null })),
-        apiClient.getRating(bookId).catch(() => ({ data: null })),
-      ]);
+      const bundleResponse = await apiClient.getBookBundle(bookId);
+      if (bundleResponse.data) {
+        const bundle = bundleResponse.data;
+        setBook(bundle.book);
+        setIsRead(bundle.is_read);
 
-      if (diaryResponse.data) {
-        setExistingDiaryEntry(diaryResponse.data);
-        setDiaryEntry(diaryResponse.data.entry_text);
-      }
+        if (bundle.diary_entry) {
+          setExistingDiaryEntry(bundle.diary_entry);
+          setDiaryEntry(bundle.diary_entry.entry_text);
+        }
 
-      if (ratingResponse.data) {
-        setExistingRating(ratingResponse.data);
-        setRating(ratingResponse.data.rating);
+        if (bundle.rating) {
+          setExistingRating(bundle.rating);
+          setRating(bundle.rating.rating);
+        }
       }
     }
 
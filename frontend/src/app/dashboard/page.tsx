@@ -33,15 +33,18 @@ function DashboardContent() {
   const loadDashboardData = async () => {
     setLoading(true);
     
-    const [booksRes, ratingsRes, diaryRes] = await Promise.all([
-      apiClient.getUserReadBooks(),
-      apiClient.getTop10Ratings(),
-      apiClient.getDiaryEntries(),
+    const response = await apiClient.batch([
+      { path: '/books/user/read' },
+      { path: '/ratings/top10' },
+      { path: '/diary' },
     ]);
 
-    if (booksRes.data) setReadBooks(booksRes.data);
-    if (ratingsRes.data) setTopRatings(ratingsRes.data);
-    if (diaryRes.data) setDiaryEntries(diaryRes.data);
+    if (response.data) {
+      const [booksRes, ratingsRes, diaryRes] = response.data.responses;
+      if (booksRes.status === 200) setReadBooks(booksRes.body);
+      if (ratingsRes.status === 200) setTopRatings(ratingsRes.body);
+      if (diaryRes.status === 200) setDiaryEntries(diaryRes.body);
+    }
 
     setLoading(false);
   };
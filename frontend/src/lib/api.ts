@@ -58,6 +58,34 @@ class ApiClient {
     }
   }
 
+  // Run several requests in one round trip; results come back in order
+  async batch(requests: BatchRequestItem[]) {
+    return this.request<{ responses: BatchResponseItem[] }>(
+      '/batch',
+      {
+        method: 'POST',
+        body: JSON.stringify({ requests }),
+      }
+    );
+  }
+
+  // Server-Sent Events stream of new followers and followed users' activity.
+  // Returns the EventSource; call close() on it to stop listening.
+  subscribeEvents(onEvent: (event: SocialEvent) => void): EventSource | null {
+    if (typeof window === 'undefined' || !this.token) {
+      return null;
+    }
+    const source = new EventSource(
+      `${this.baseUrl}/events/stream?token=${encodeURIComponent(this.token)}`
+    );
+    for (const type of ['follow', 'activity', 'resync']) {
+      source.addEventListener(type, (message) => {
+        onEvent(JSON.parse((message as MessageEvent).data));
+      });
+    }
+    return source;
+  }
+
   // Authentication
   async register(username: string, password: string) {
     return this.request<{ access_token: string; token_type: string; user_id: number; username: string }>(
@@ -90,6 +118,14 @@ class ApiClient {
     return this.request<Book>(`/books/${bookId}`);
   }
 
+  async getBookBundle(bookId: number) {
+    return this.request<BookBundle>(`/books/${bookId}/bundle`);
+  }
+
+  async getSimilarBooks(bookId: number, limit: number = 10) {
+    return this.request<{ results: SimilarBook[] }>(`/books/${bookId}/similar?limit=${limit}`);
+  }
+
   async addBook(openLibraryId: string) {
     return this.request<{ book_id: number; message: string }>(
       `/books/add?open_library_id=${encodeURIComponent(openLibraryId)}`,
@@ -104,6 +140,16 @@ class ApiClient {
     );
   }
 
+  async logRead(openLibraryId: string, rating?: number, entryText?: string) {
+    return this.request<LogReadResult>(
+      '/books/log',
+      {
+        method: 'POST',
+        body: JSON.stringify({ open_library_id: openLibraryId, rating, entry_text: entryText }),
+      }
+    );
+  }
+
   async getUserReadBooks() {
     return this.request<Book[]>('/books/user/read');
   }
@@ -181,10 +227,51 @@ class ApiClient {
     );
   }
 
+  async autocompleteUsers(prefix: string, limit: number = 8) {
+    return this.request<{ results: UserSearchResult[] }>(
+      `/users/autocomplete?q=${encodeURIComponent(prefix)}&limit=${limit}`
+    );
+  }
+
   async getUserProfile(userId: number) {
     return this.request<UserProfileWithBooks>(`/users/${userId}/profile`);
   }
 
+  async getFollowers(userId: number, limit: number = 20, before?: number) {
+    const cursor = before !== undefined ? `&before=${before}` : '';
+    return this.request<FollowListPage>(`/users/${userId}/followers?limit=${limit}${cursor}`);
+  }
+
+  async getFollowing(userId: number, limit: number = 20, before?: number) {
+    const cursor = before !== undefined ? `&before=${before}` : '';
+    return this.request<FollowListPage>(`/users/${userId}/following?limit=${limit}${cursor}`);
+  }
+
+  async getUserStats(userId: number) {
+    return this.request<ReadingStats>(`/users/${userId}/stats`);
+  }
+
+  async getFriendsWhoRead(bookId: number) {
+    return this.request<{ results: FriendReader[] }>(`/books/${bookId}/friends`);
+  }
+
+  async getMutuals() {
+    return this.request<{ results: UserSearchResult[] }>('/users/me/mutuals');
+  }
+
+  async getFollowSuggestions(limit: number = 10) {
+    return this.request<{ results: SuggestedUser[] }>(`/users/me/suggestions?limit=${limit}`);
+  }
+
+  async getFeed(limit: number = 20, before?: number) {
+    const cursor = before !== undefined ? `&before=${before}` : '';
+    return this.request<{ items: FeedItem[]; next_cursor: number | null }>(`/feed?limit=${limit}${cursor}`);
+  }
+
+  async getRecommendations(limit: number = 20) {
+    return this.request<{ results: RecommendedBook[] }>(`/users/me/recommendations?limit=${limit}`);
+  }
+
   async getOwnProfile() {
     return this.request<UserProfile>(`/users/me/profile`);
   }
@@ -203,6 +290,13 @@ class ApiClient {
     );
   }
 
+  async deleteAccount() {
+    return this.request<{ message: string }>(
+      '/users/me',
+      { method: 'DELETE' }
+    );
+  }
+
   async updatePrivacy(isPrivate: boolean) {
     return this.request<{ message: string; is_private: boolean }>(
       '/users/me/privacy',
@@ -222,6 +316,13 @@ export interface BookSearchResult {
   isbn?: string;
   cover_image_url?: string;
   published_year?: number;
+  rating_stats?: RatingStats | null;
+}
+
+export interface RatingStats {
+  count: number;
+  average?: number;
+  histogram: Record<1 | 2 | 3 | 4 | 5, number>;
 }
 
 export interface Book {
@@ -235,6 +336,51 @@ export interface Book {
   published_year?: number;
 }
 
+export interface BookBundle {
+  book: Book;
+  is_read: boolean;
+  read_at?: string;
+  rating?: Rating;
+  diary_entry?: DiaryEntry;
+  rating_stats: RatingStats;
+}
+
+export interface BookSummary {
+  id: number;
+  open_library_id: string;
+  title: string;
+  author?: string;
+  cover_image_url?: string;
+}
+
+export interface SimilarBook {
+  score: number;
+  book: BookSummary;
+}
+
+export interface RecommendedBook extends SimilarBook {
+  because_book_id: number;
+}
+
+export interface FeedItem {
+  id: number;
+  verb: 'rated' | 'reviewed' | 'read';
+  created_at: string;
+  user: { id: number; username: string };
+  book?: BookSummary;
+  rating?: number;
+  excerpt?: string;
+}
+
+export interface LogReadResult {
+  book: Book;
+  read_at?: string;
+  rating_id?: number;
+  rating?: number;
+  diary_entry_id?: number;
+  entry_text?: string;
+}
+
 export interface DiaryEntry {
   id: number;
   user_id: number;
@@ -277,6 +423,73 @@ export interface UserSearchResult {
   id: number;
   username: string;
   is_private: boolean;
+  is_following: boolean;
+  follows_you: boolean;
+}
+
+export interface SuggestedUser extends UserSearchResult {
+  mutual_count: number;
+}
+
+export interface ReadingStats {
+  user_id: number;
+  username: string;
+  books_read: number;
+  read_by_year: { year: number; count: number }[];
+  read_by_month: { year: number; month: number; count: number }[];
+  ratings: {
+    count: number;
+    average: number | null;
+    median: number | null;
+    stdev: number | null;
+    histogram: Record<number, number>;
+  };
+  streaks: {
+    longest_days: number;
+    longest_days_start: string | null;
+    longest_days_end: string | null;
+    current_days: number;
+    longest_months: number;
+    longest_months_start: string | null;
+    longest_months_end: string | null;
+  };
+  top_authors: { author: string; books_read: number; average_rating: number | null }[];
+  diary: {
+    entries: number;
+    words: number;
+    average_words: number;
+    longest_entry_words: number;
+    words_by_year: { year: number; entries: number; words: number }[];
+  };
+}
+
+export type SocialEvent =
+  | { type: 'follow'; user: { id: number; username: string }; is_friend: boolean; created_at: string }
+  | {
+      type: 'activity';
+      verb: 'rated' | 'reviewed' | 'read';
+      user: { id: number; username: string };
+      items: { book_id: number; rating: number | null }[];
+      count: number;
+      created_at: string;
+    }
+  | { type: 'resync' };
+
+export interface FollowListUser extends UserSearchResult {
+  is_friend: boolean;
+  followed_at?: string;
+}
+
+export interface FollowListPage {
+  results: FollowListUser[];
+  next_cursor: number | null;
+}
+
+export interface FriendReader {
+  id: number;
+  username: string;
+  read_at?: string;
+  rating?: number;
 }
 
 export interface UserProfile {
@@ -305,5 +518,16 @@ export interface UserProfileWithBooks extends UserProfile {
   top_rated_books: TopRatedBook[];
 }
 
+export interface BatchRequestItem {
+  method?: 'GET' | 'POST' | 'PUT' | 'PATCH' | 'DELETE';
+  path: string;
+  body?: unknown;
+}
+
+export interface BatchResponseItem {
+  status: number;
+  body: any;
+}
+
 export const apiClient = new ApiClient(API_BASE_URL);
 